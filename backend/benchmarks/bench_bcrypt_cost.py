@@ -0,0 +1,86 @@
+"""
+Times bcrypt at each cost factor on this machine and suggests the highest BCRYPT_ROUNDS
+that hashes within a target latency, then shows what a burst of logins costs on the hashing pool.
+
+    cd backend
+    python -m benchmarks.bench_bcrypt_cost
+    python -m benchmarks.bench_bcrypt_cost --target-ms 250 --burst 50
+
+Run it on the hardware that serves the API; the suggestion only holds there.
+"""
+import argparse
+import os
+import statistics
+import time
+from concurrent.futures import ThreadPoolExecutor
+from passlib.context import CryptContext
+
+PASSWORD = "correct horse battery staple"
+
+
+def time_hashes(context, samples):
+    """Returns the hash times in milliseconds."""
+    times = []
+    for _ in range(samples):
+        start = time.perf_counter()
+        context.hash(PASSWORD)
+        times.append((time.perf_counter() - start) * 1000)
+    return times
+
+
+def time_burst(context, workers, burst):
+    """Hashes `burst` passwords on a pool of `workers` threads. Returns (total ms, slowest wait ms)."""
+    start = time.perf_counter()
+    finished = []
+
+    def hash_one():
+        context.hash(PASSWORD)
+        finished.append((time.perf_counter() - start) * 1000)
+
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        for _ in range(burst):
+            pool.submit(hash_one)
+    return (time.perf_counter() - start) * 1000, max(finished)
+
+
+def main():
+    default_workers = int(os.getenv("HASH_EXECUTOR_WORKERS", str(max(1, (os.cpu_count() or 1) // 2))))
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--target-ms", type=float, default=250)
+    parser.add_argument("--min-rounds", type=int, default=10)
+    parser.add_argument("--max-rounds", type=int, default=14)
+    parser.add_argument("--samples", type=int, default=5)
+    parser.add_argument("--workers", type=int, default=default_workers)
+    parser.add_argument("--burst", type=int, default=20)
+    args = parser.parse_args()
+
+    print(f"{'rounds':>6} {'median ms':>10} {'max ms':>8}")
+    chosen = None
+    for rounds in range(args.min_rounds, args.max_rounds + 1):
+        context = CryptContext(schemes=["bcrypt"], bcrypt__rounds=rounds)
+        times = time_hashes(context, args.samples)
+        median = statistics.median(times)
+        print(f"{rounds:>6} {median:>10.1f} {max(times):>8.1f}")
+        if median <= args.target_ms:
+            chosen = rounds
+        else:
+            # Each further step only doubles the time
+            break
+
+    if chosen is None:
+        print(f"\nEven {args.min_rounds} rounds is slower than {args.target_ms:.0f} ms; consider more or faster cores.")
+        chosen = args.min_rounds
+    else:
+        print(f"\nSuggested BCRYPT_ROUNDS={chosen} (target {args.target_ms:.0f} ms)")
+
+    context = CryptContext(schemes=["bcrypt"], bcrypt__rounds=chosen)
+    total_ms, slowest_ms = time_burst(context, args.workers, args.burst)
+    print(
+        f"Burst of {args.burst} logins on {args.workers} hashing workers: "
+        f"{total_ms:.0f} ms total, {args.burst / total_ms * 1000:.1f} logins/s, slowest waited {slowest_ms:.0f} ms"
+    )
+
+
+if __name__ == "__main__":
+    main()
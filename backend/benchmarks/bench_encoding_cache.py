@@ -0,0 +1,78 @@
+"""
+Checks the cached-encoding QA path against the transformers pipeline and times both.
+
+    cd backend
+    python -m benchmarks.bench_encoding_cache
+    python -m benchmarks.bench_encoding_cache --model ./my-local-model --repeat-rate 0.8
+
+Prompts are drawn so that `--repeat-rate` of them repeat an earlier one, as happens for popular areas.
+Reports answer parity, per-batch latency, and the encoding caches' hit rate and memory.
+"""
+import argparse
+import random
+import time
+from encoding_cache import answer_batch, pair_cache, question_cache
+from inference_backends import build_pipeline, INFERENCE_BACKEND
+from model_registry import DEFAULT_MODEL_ID
+from benchmarks.bench_inference_backends import make_prompts
+
+
+def make_workload(count, repeat_rate, seed=0):
+    """Builds `count` prompts where about `repeat_rate` of them were already seen."""
+    rng = random.Random(seed)
+    unique = make_prompts(count, seed)
+    workload = []
+    for prompt in unique:
+        if workload and rng.random() < repeat_rate:
+            workload.append(rng.choice(workload))
+        else:
+            workload.append(prompt)
+    return workload
+
+
+def run(function, workload, batch_size):
+    """Runs the workload in batches and returns (answers, average ms per batch)."""
+    answers = []
+    started = time.perf_counter()
+    for i in range(0, len(workload), batch_size):
+        batch = workload[i:i + batch_size]
+        answers += function([q for q, _ in batch], [c for _, c in batch])
+    return answers, (time.perf_counter() - started) * 1000 / -(-len(workload) // batch_size)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--model", default=DEFAULT_MODEL_ID)
+    parser.add_argument("--backend", default=INFERENCE_BACKEND)
+    parser.add_argument("--requests", type=int, default=200)
+    parser.add_argument("--repeat-rate", type=float, default=0.7)
+    parser.add_argument("--batch-size", type=int, default=8)
+    args = parser.parse_args()
+
+    pipe = build_pipeline(args.model, args.backend)
+    workload = make_workload(args.requests, args.repeat_rate)
+
+    def pipeline_batch(questions, contexts):
+        results = pipe(question=list(questions), context=list(contexts), batch_size=len(questions))
+        return [results] if isinstance(results, dict) else results
+
+    # Warm up both paths
+    pipeline_batch(*zip(*workload[:2]))
+    answer_batch(pipe, *zip(*workload[:2]))
+    pair_cache.clear()
+    question_cache.clear()
+
+    expected, pipeline_ms = run(pipeline_batch, workload, args.batch_size)
+    answers, cached_ms = run(lambda q, c: answer_batch(pipe, q, c), workload, args.batch_size)
+
+    matches = sum(a["answer"].strip() == b["answer"].strip() for a, b in zip(answers, expected))
+    print(f"answers matching the pipeline: {matches}/{len(workload)}")
+    print(f"pipeline:         {pipeline_ms:>7.1f} ms per batch of {args.batch_size}")
+    print(f"cached encodings: {cached_ms:>7.1f} ms per batch of {args.batch_size}")
+    for name, cache in (("question cache", question_cache), ("pair cache", pair_cache)):
+        stats = cache.stats()
+        print(f"{name}: hit rate {stats['hit_rate']:.0%}, {stats['size']} entries, {stats['bytes'] / 1024:.1f} KiB")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,167 @@
+"""
+Compares the torch, quantized and onnx inference backends on answers, latency and memory.
+
+    cd backend
+    python -m benchmarks.bench_inference_backends
+    python -m benchmarks.bench_inference_backends --backends torch quantized --runs 50
+    python -m benchmarks.bench_inference_backends --backends torch onnx --score-tolerance 0.005
+
+Each backend is measured in its own process so their memory use doesn't overlap.
+Answers are checked against the torch backend on the same fixed prompts. The backends in --check
+(onnx by default; quantized is lossy on purpose) must give the same answer spans with scores within
+--score-tolerance, or the run lists the differences and exits with status 1.
+"""
+import argparse
+import json
+import random
+import statistics
+import subprocess
+import sys
+import time
+import psutil
+from inference_backends import BACKENDS, build_pipeline
+from model_registry import DEFAULT_MODEL_ID
+from recommenders import build_prompt
+
+PLACE_TYPES = ["park", "cafe", "library", "museum", "restaurant"]
+
+
+def make_prompts(count, seed=0):
+    """Builds prompts like the ones model_handler sends, with 3 places each."""
+    rng = random.Random(seed)
+    prompts = []
+    for index in range(count):
+        place_type = PLACE_TYPES[index % len(PLACE_TYPES)]
+        places = [
+            {
+                "name": f"{rng.choice(['Maple', 'Cedar', 'Harbour', 'Granville', 'Elm'])} {place_type.title()} {number}",
+                "rating": round(rng.uniform(3.0, 5.0), 1),
+                "distance": round(rng.uniform(100, 2000), 2),
+            }
+            for number in range(1, 4)
+        ]
+        prompts.append(build_prompt(places, place_type))
+    return prompts
+
+
+def rss_mb():
+    return psutil.Process().memory_info().rss / 1024 / 1024
+
+
+def measure(backend, model_id, runs, batch_size):
+    """Loads one backend and times it. Run in a fresh process."""
+    prompts = make_prompts(runs)
+    before = rss_mb()
+    started = time.perf_counter()
+    pipe = build_pipeline(model_id, backend)
+    load_s = time.perf_counter() - started
+    loaded = rss_mb()
+
+    # Warm up
+    pipe(question=prompts[0][0], context=prompts[0][1])
+
+    latencies = []
+    answers = []
+    for question, context in prompts:
+        started = time.perf_counter()
+        result = pipe(question=question, context=context)
+        latencies.append((time.perf_counter() - started) * 1000)
+        answers.append({"answer": result["answer"].strip(), "start": result["start"], "end": result["end"], "score": float(result["score"])})
+
+    batches = [prompts[i:i + batch_size] for i in range(0, len(prompts), batch_size)]
+    started = time.perf_counter()
+    for batch in batches:
+        pipe(question=[q for q, _ in batch], context=[c for _, c in batch], batch_size=len(batch))
+    batch_ms = (time.perf_counter() - started) * 1000 / len(prompts)
+
+    latencies.sort()
+    return {
+        "backend": backend,
+        "load_s": load_s,
+        "model_mb": loaded - before,
+        "peak_mb": rss_mb(),
+        "p50_ms": statistics.median(latencies),
+        "p95_ms": latencies[int(len(latencies) * 0.95) - 1],
+        "batched_ms": batch_ms,
+        "answers": answers,
+    }
+
+
+def run_in_subprocess(backend, model_id, runs, batch_size):
+    command = [
+        sys.executable, "-m", "benchmarks.bench_inference_backends",
+        "--worker", backend, "--model", model_id, "--runs", str(runs), "--batch-size", str(batch_size),
+    ]
+    output = subprocess.run(command, capture_output=True, text=True)
+    if output.returncode != 0:
+        print(f"{backend}: failed\n{output.stderr.strip().splitlines()[-1] if output.stderr else ''}")
+        return None
+    return json.loads(output.stdout.strip().splitlines()[-1])
+
+
+def parity_differences(answers, reference, score_tolerance):
+    """Returns (prompt index, answer, reference answer) for each answer whose span or score differs."""
+    differences = []
+    for index, (answer, expected) in enumerate(zip(answers, reference)):
+        same_span = (answer["start"], answer["end"]) == (expected["start"], expected["end"])
+        if not same_span or abs(answer["score"] - expected["score"]) > score_tolerance:
+            differences.append((index, answer, expected))
+    return differences
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--backends", nargs="+", default=list(BACKENDS))
+    parser.add_argument("--model", default=DEFAULT_MODEL_ID)
+    parser.add_argument("--runs", type=int, default=30)
+    parser.add_argument("--batch-size", type=int, default=8)
+    parser.add_argument("--check", nargs="*", default=["onnx"], help="backends that must match torch")
+    parser.add_argument("--score-tolerance", type=float, default=0.01)
+    parser.add_argument("--worker", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.worker:
+        print(json.dumps(measure(args.worker, args.model, args.runs, args.batch_size)))
+        return
+
+    results = [r for r in (run_in_subprocess(b, args.model, args.runs, args.batch_size) for b in args.backends) if r]
+    if not results:
+        return
+
+    reference = next((r for r in results if r["backend"] == "torch"), results[0])
+    print(f"{'backend':>10} {'load':>8} {'model':>9} {'peak rss':>9} {'p50':>9} {'p95':>9} {'batched':>9} {'parity':>7}")
+    for r in results:
+        matches = len(r["answers"]) - len(parity_differences(r["answers"], reference["answers"], args.score_tolerance))
+        print(
+            f"{r['backend']:>10} {r['load_s']:>7.1f}s {r['model_mb']:>6.0f} MB {r['peak_mb']:>6.0f} MB "
+            f"{r['p50_ms']:>6.1f} ms {r['p95_ms']:>6.1f} ms {r['batched_ms']:>6.1f} ms {matches / len(r['answers']):>7.0%}"
+        )
+    print(f"parity = answers matching the {reference['backend']} backend (same span, score within {args.score_tolerance}); "
+          f"batched = per-request time at batch size {args.batch_size}")
+
+    failed = False
+    checked = [backend for backend in args.check if backend in args.backends and backend != reference["backend"]]
+    if checked and reference["backend"] != "torch":
+        print("\nPARITY CHECK FAILED: the torch backend didn't run, so there is nothing to check against")
+        sys.exit(1)
+    for backend in checked:
+        result = next((r for r in results if r["backend"] == backend), None)
+        if result is None:
+            print(f"\nPARITY CHECK FAILED: {backend} didn't run")
+            failed = True
+            continue
+        differences = parity_differences(result["answers"], reference["answers"], args.score_tolerance)
+        if differences:
+            failed = True
+            print(f"\nPARITY CHECK FAILED: {backend} differs from torch on {len(differences)} of {len(result['answers'])} prompts")
+            for index, answer, expected in differences:
+                print(f"  prompt {index}: {answer['answer']!r} [{answer['start']}:{answer['end']}] score {answer['score']:.4f}, "
+                      f"torch {expected['answer']!r} [{expected['start']}:{expected['end']}] score {expected['score']:.4f}")
+    if failed:
+        sys.exit(1)
+    if checked:
+        print(f"Parity check passed for {', '.join(checked)}")
+
+
+if __name__ == "__main__":
+    main()
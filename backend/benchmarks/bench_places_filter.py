@@ -0,0 +1,81 @@
+"""
+Compares the vectorized places filter with the original geodesic loop.
+
+    cd backend
+    python -m benchmarks.bench_places_filter
+"""
+import random
+import timeit
+from geopy.distance import geodesic
+from utils.places_filter import filter_places_by_radius
+
+CENTER = (49.224090, -123.063501)
+SEARCH_RADIUS = 1500
+CANDIDATE_COUNTS = [20, 60, 1000]
+
+
+def legacy_filter_places_by_radius(center, data, search_radius, tolerance=100):
+    """The original per-place geodesic loop, kept here as the baseline."""
+    results_within_radius = []
+
+    for place in data["results"]:
+        place_coord = (place["geometry"]["location"]["lat"], place["geometry"]["location"]["lng"])
+        distance = geodesic(center, place_coord).meters
+
+        if distance <= search_radius + tolerance:
+            rating = place.get('rating', None)
+            if rating is not None:
+                url = "https://www.google.com/maps/place/?q=place_id:"
+                place_url = f'{url}{place["place_id"]}'
+                results_within_radius.append((place['name'], place['vicinity'], distance, rating, place_url))
+
+    return sorted(results_within_radius, key=lambda x: x[3], reverse=True)[:3]
+
+
+def make_data(count, seed=0):
+    """Builds a fake Places response with `count` places around CENTER."""
+    rng = random.Random(seed)
+    results = []
+    for index in range(count):
+        place = {
+            "name": f"Place {index}",
+            "vicinity": f"{index} Test Street",
+            "place_id": f"place-{index}",
+            "geometry": {"location": {
+                "lat": CENTER[0] + rng.uniform(-0.03, 0.03),
+                "lng": CENTER[1] + rng.uniform(-0.04, 0.04),
+            }},
+        }
+        # Some places have no rating, like real responses
+        if rng.random() > 0.1:
+            place["rating"] = round(rng.uniform(2.5, 5.0), 1)
+        results.append(place)
+    return {"status": "OK", "results": results}
+
+
+def check_parity(data):
+    """Checks both implementations pick the same places with matching distances."""
+    expected = legacy_filter_places_by_radius(CENTER, data, SEARCH_RADIUS)
+    for method, tolerance in (("ellipsoidal", 0.01), ("haversine", 0.005 * SEARCH_RADIUS)):
+        actual = filter_places_by_radius(CENTER, data, SEARCH_RADIUS, method=method)
+        assert [row[0] for row in actual] == [row[0] for row in expected], (method, actual, expected)
+        for got, want in zip(actual, expected):
+            assert abs(got[2] - want[2]) <= tolerance, (method, got[2], want[2])
+
+
+def main():
+    print(f"{'candidates':>10} {'geodesic loop':>15} {'haversine':>12} {'ellipsoidal':>12} {'speedup':>8}")
+    for count in CANDIDATE_COUNTS:
+        data = make_data(count)
+        check_parity(data)
+
+        runs = max(5, 2000 // count)
+        legacy = min(timeit.repeat(lambda: legacy_filter_places_by_radius(CENTER, data, SEARCH_RADIUS), number=runs, repeat=3)) / runs
+        haversine = min(timeit.repeat(lambda: filter_places_by_radius(CENTER, data, SEARCH_RADIUS, method="haversine"), number=runs, repeat=3)) / runs
+        ellipsoidal = min(timeit.repeat(lambda: filter_places_by_radius(CENTER, data, SEARCH_RADIUS, method="ellipsoidal"), number=runs, repeat=3)) / runs
+
+        print(f"{count:>10} {legacy * 1e6:>12.1f} us {haversine * 1e6:>9.1f} us {ellipsoidal * 1e6:>9.1f} us {legacy / haversine:>7.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,66 @@
+"""
+Reports how long importing the app takes and which modules cost the most.
+
+    cd backend
+    python -m benchmarks.bench_startup
+    python -m benchmarks.bench_startup --budget-ms 1500
+
+Fails (exit code 1) if importing main pulls in torch or transformers, which should only load
+with the model, or if the import takes longer than --budget-ms.
+"""
+import argparse
+import subprocess
+import sys
+
+# Modules that must stay out of the app's import path
+LAZY_MODULES = ["torch", "transformers", "optimum", "onnxruntime"]
+
+
+def import_times(module):
+    """Imports a module in a fresh interpreter and returns {module: (self_us, cumulative_us)}."""
+    output = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        capture_output=True, text=True,
+    )
+    if output.returncode != 0:
+        raise SystemExit(f"Importing {module} failed:\n{output.stderr.strip().splitlines()[-1]}")
+
+    times = {}
+    for line in output.stderr.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        self_us, cumulative_us, name = line[len("import time:"):].split("|")
+        times[name.strip()] = (int(self_us), int(cumulative_us))
+    return times
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--module", default="main")
+    parser.add_argument("--top", type=int, default=15)
+    parser.add_argument("--budget-ms", type=float, default=None)
+    args = parser.parse_args()
+
+    times = import_times(args.module)
+    total_ms = times[args.module][1] / 1000
+
+    print(f"import {args.module}: {total_ms:.1f} ms")
+    print(f"{'cumulative':>12} {'self':>10}  module")
+    top_level = sorted(times.items(), key=lambda item: item[1][1], reverse=True)[:args.top]
+    for name, (self_us, cumulative_us) in top_level:
+        print(f"{cumulative_us / 1000:>9.1f} ms {self_us / 1000:>7.1f} ms  {name}")
+
+    failed = False
+    eager = [name for name in LAZY_MODULES if name in times]
+    if eager:
+        print(f"FAIL: {', '.join(eager)} imported at startup")
+        failed = True
+    if args.budget_ms is not None and total_ms > args.budget_ms:
+        print(f"FAIL: import took {total_ms:.1f} ms, budget is {args.budget_ms:.1f} ms")
+        failed = True
+
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,174 @@
+# Answers QA batches with the pipeline's own tokenizer and model, reusing cached encodings.
+# The question only depends on the place type and popular areas send the same context again
+# and again, so most prompts skip tokenization entirely.
+import hashlib
+import os
+import numpy as np
+from dotenv import load_dotenv
+from utils.ttl_cache import TTLCache
+
+load_dotenv()
+
+ENCODING_CACHE_ENABLED = os.getenv("ENCODING_CACHE_ENABLED", "true").lower() == "true"
+QUESTION_CACHE_SIZE = int(os.getenv("QUESTION_CACHE_SIZE", "256"))
+ENCODING_CACHE_SIZE = int(os.getenv("ENCODING_CACHE_SIZE", "4096"))
+ENCODING_CACHE_MAX_BYTES = int(os.getenv("ENCODING_CACHE_MAX_BYTES", str(32 * 1024 * 1024)))
+# Longest encoded question and context, as in the question-answering pipeline
+QA_MAX_LENGTH = int(os.getenv("QA_MAX_LENGTH", "384"))
+# Longest answer span, in tokens
+QA_MAX_ANSWER_LENGTH = int(os.getenv("QA_MAX_ANSWER_LENGTH", "15"))
+
+
+def _encoding_bytes(encoding):
+    return sum(value.nbytes for value in encoding.values() if isinstance(value, np.ndarray))
+
+
+# Question token ids keyed by (tokenizer, question)
+question_cache = TTLCache(QUESTION_CACHE_SIZE, float("inf"), name="question_encoding_cache",
+                          sizeof=lambda ids: ids.nbytes)
+# Encoded question/context pairs keyed by (tokenizer, content hash)
+pair_cache = TTLCache(ENCODING_CACHE_SIZE, float("inf"), name="pair_encoding_cache",
+                      max_bytes=ENCODING_CACHE_MAX_BYTES, sizeof=_encoding_bytes)
+
+
+def supports_encoded_inference(pipe):
+    """Checks if a pipeline's tokenizer can give character offsets, which span decoding needs."""
+    return getattr(getattr(pipe, "tokenizer", None), "is_fast", False) and getattr(pipe, "model", None) is not None
+
+
+def _tokenizer_key(tokenizer):
+    return getattr(tokenizer, "name_or_path", "") or str(id(tokenizer))
+
+
+def encode_question(tokenizer, question):
+    """Returns the question's token ids, without special tokens."""
+    key = (_tokenizer_key(tokenizer), question)
+    ids = question_cache.get(key)
+    if ids is None:
+        ids = np.asarray(tokenizer(question, add_special_tokens=False)["input_ids"], dtype=np.int32)
+        question_cache.set(key, ids)
+    return ids
+
+
+def _find_context(input_ids, context_ids):
+    """Position of the context tokens in the full input, searching from the end."""
+    width = len(context_ids)
+    for start in range(len(input_ids) - width, -1, -1):
+        if input_ids[start:start + width] == context_ids:
+            return start
+    raise ValueError("Context tokens not found in the encoded input")
+
+
+def encode_pair(tokenizer, question, context):
+    """
+    Returns the model inputs for a question and context, plus where the context tokens are
+    and their character offsets.
+    """
+    key = (_tokenizer_key(tokenizer), hashlib.sha256(f"{question}\0{context}".encode()).hexdigest())
+    encoding = pair_cache.get(key)
+    if encoding is not None:
+        return encoding
+
+    question_ids = encode_question(tokenizer, question).tolist()
+    context_encoding = tokenizer(context, add_special_tokens=False, return_offsets_mapping=True)
+
+    # Keep the context within QA_MAX_LENGTH; place lists are short so this rarely cuts anything
+    budget = max(1, QA_MAX_LENGTH - tokenizer.num_special_tokens_to_add(pair=True) - len(question_ids))
+    context_ids = context_encoding["input_ids"][:budget]
+    offsets = context_encoding["offset_mapping"][:budget]
+
+    # Answers are widened to whole words like the pipeline does, so keep each token's word span
+    word_ids = context_encoding.word_ids()[:budget]
+    word_spans = {}
+    for word, (char_start, char_end) in zip(word_ids, offsets):
+        if word is not None:
+            first, last = word_spans.get(word, (char_start, char_end))
+            word_spans[word] = (min(first, char_start), max(last, char_end))
+    word_offsets = [word_spans[word] if word is not None else offset for word, offset in zip(word_ids, offsets)]
+
+    input_ids = tokenizer.build_inputs_with_special_tokens(question_ids, context_ids)
+    encoding = {
+        "input_ids": np.asarray(input_ids, dtype=np.int32),
+        "offsets": np.asarray(word_offsets, dtype=np.int32).reshape(-1, 2),
+        "context_start": _find_context(input_ids, context_ids),
+        "has_cls": tokenizer.cls_token_id is not None and input_ids[0] == tokenizer.cls_token_id,
+    }
+    if "token_type_ids" in tokenizer.model_input_names:
+        encoding["token_type_ids"] = np.asarray(
+            tokenizer.create_token_type_ids_from_sequences(question_ids, context_ids), dtype=np.int32
+        )
+
+    pair_cache.set(key, encoding)
+    return encoding
+
+
+def _to_numpy(tensor):
+    return tensor.detach().cpu().float().numpy() if hasattr(tensor, "detach") else np.asarray(tensor, dtype=np.float32)
+
+
+def _context_probabilities(logits, first, last, has_cls):
+    """
+    Softmax over the context tokens (and CLS, which the pipeline also keeps in the normalisation)
+    returning the probabilities of the context tokens.
+    """
+    values = logits[first:last]
+    if has_cls:
+        values = np.concatenate(([logits[0]], values))
+    exp = np.exp(values - values.max())
+    probabilities = exp / exp.sum()
+    return probabilities[1:] if has_cls else probabilities
+
+
+def decode_span(start_logits, end_logits, encoding, context, max_answer_length=QA_MAX_ANSWER_LENGTH):
+    """Picks the most likely answer span inside the context, like the question-answering pipeline."""
+    first = encoding["context_start"]
+    last = first + len(encoding["offsets"])
+    start_probs = _context_probabilities(start_logits, first, last, encoding["has_cls"])
+    end_probs = _context_probabilities(end_logits, first, last, encoding["has_cls"])
+
+    # Spans must end after they start and be at most max_answer_length tokens long
+    scores = np.tril(np.triu(np.outer(start_probs, end_probs)), max_answer_length - 1)
+    start, end = np.unravel_index(np.argmax(scores), scores.shape)
+
+    char_start = int(encoding["offsets"][start][0])
+    char_end = int(encoding["offsets"][end][1])
+    return {
+        "score": float(scores[start, end]),
+        "start": char_start,
+        "end": char_end,
+        "answer": context[char_start:char_end],
+    }
+
+
+def answer_batch(pipe, questions, contexts):
+    """Runs one padded forward pass over cached encodings and decodes an answer for each pair."""
+    import torch
+
+    tokenizer = pipe.tokenizer
+    encodings = [encode_pair(tokenizer, question, context) for question, context in zip(questions, contexts)]
+
+    length = max(len(encoding["input_ids"]) for encoding in encodings)
+    pad_id = tokenizer.pad_token_id if tokenizer.pad_token_id is not None else 0
+    input_ids = np.full((len(encodings), length), pad_id, dtype=np.int64)
+    attention_mask = np.zeros((len(encodings), length), dtype=np.int64)
+    token_type_ids = np.zeros((len(encodings), length), dtype=np.int64)
+    for row, encoding in enumerate(encodings):
+        size = len(encoding["input_ids"])
+        input_ids[row, :size] = encoding["input_ids"]
+        attention_mask[row, :size] = 1
+        if "token_type_ids" in encoding:
+            token_type_ids[row, :size] = encoding["token_type_ids"]
+
+    inputs = {"input_ids": torch.from_numpy(input_ids), "attention_mask": torch.from_numpy(attention_mask)}
+    if "token_type_ids" in tokenizer.model_input_names:
+        inputs["token_type_ids"] = torch.from_numpy(token_type_ids)
+
+    with torch.inference_mode():
+        outputs = pipe.model(**inputs)
+
+    start_logits = _to_numpy(outputs.start_logits)
+    end_logits = _to_numpy(outputs.end_logits)
+    return [
+        decode_span(start_logits[row], end_logits[row], encoding, context)
+        for row, (encoding, context) in enumerate(zip(encodings, contexts))
+    ]
@@ -0,0 +1,89 @@
+# Ways of running the question-answering model on CPU. Every backend builds a
+# transformers question-answering pipeline, so callers don't depend on which one is used.
+import os
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# torch (full precision eager PyTorch), quantized (dynamic int8 PyTorch) or onnx (ONNX Runtime)
+INFERENCE_BACKEND = os.getenv("INFERENCE_BACKEND", "torch")
+# Where exported ONNX models are kept so they are only exported once
+ONNX_MODEL_DIR = os.getenv("ONNX_MODEL_DIR", "onnx_models")
+# Threads used by PyTorch for one forward pass, 0 keeps its default
+TORCH_NUM_THREADS = int(os.getenv("TORCH_NUM_THREADS", "0"))
+
+
+def _set_torch_threads():
+    import torch
+
+    if TORCH_NUM_THREADS > 0:
+        torch.set_num_threads(TORCH_NUM_THREADS)
+
+
+def build_torch_pipeline(model_id):
+    """Full precision PyTorch model, as loaded by transformers."""
+    from transformers import pipeline
+
+    _set_torch_threads()
+    return pipeline(
+        "question-answering",
+        model=model_id,
+        tokenizer=model_id,
+    )
+
+
+def build_quantized_pipeline(model_id):
+    """PyTorch model with its Linear layers dynamically quantized to int8."""
+    import torch
+    from transformers import AutoModelForQuestionAnswering, AutoTokenizer, pipeline
+
+    _set_torch_threads()
+    model = AutoModelForQuestionAnswering.from_pretrained(model_id)
+    model.eval()
+    model = torch.quantization.quantize_dynamic(model, {torch.nn.Linear}, dtype=torch.qint8)
+    return pipeline(
+        "question-answering",
+        model=model,
+        tokenizer=AutoTokenizer.from_pretrained(model_id),
+    )
+
+
+def build_onnx_pipeline(model_id):
+    """Model exported to ONNX and run with ONNX Runtime. Needs optimum[onnxruntime]."""
+    try:
+        from optimum.onnxruntime import ORTModelForQuestionAnswering
+    except ImportError as e:
+        raise RuntimeError("INFERENCE_BACKEND=onnx needs optimum[onnxruntime] installed") from e
+    from transformers import AutoTokenizer, pipeline
+
+    export_dir = os.path.join(ONNX_MODEL_DIR, model_id.replace("/", "--"))
+    if os.path.exists(os.path.join(export_dir, "model.onnx")):
+        model = ORTModelForQuestionAnswering.from_pretrained(export_dir)
+        tokenizer = AutoTokenizer.from_pretrained(export_dir)
+    else:
+        print(f"Exporting {model_id} to ONNX in {export_dir}")
+        model = ORTModelForQuestionAnswering.from_pretrained(model_id, export=True)
+        tokenizer = AutoTokenizer.from_pretrained(model_id)
+        model.save_pretrained(export_dir)
+        tokenizer.save_pretrained(export_dir)
+
+    return pipeline(
+        "question-answering",
+        model=model,
+        tokenizer=tokenizer,
+    )
+
+
+BACKENDS = {
+    "torch": build_torch_pipeline,
+    "quantized": build_quantized_pipeline,
+    "onnx": build_onnx_pipeline,
+}
+
+
+def build_pipeline(model_id, backend=None):
+    """Builds the question-answering pipeline for a model with the chosen backend."""
+    backend = backend or INFERENCE_BACKEND
+    if backend not in BACKENDS:
+        raise ValueError(f"Unknown INFERENCE_BACKEND {backend!r}, expected one of: {', '.join(BACKENDS)}")
+    return BACKENDS[backend](model_id)
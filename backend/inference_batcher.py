@@ -0,0 +1,162 @@
+# Groups concurrent QA requests into padded batches for the model
+import asyncio
+import os
+import time
+from dotenv import load_dotenv
+from model_registry import get_pipeline, ensure_model, get_active_model_id
+from utils import metrics
+from utils.executors import run_inference, INFERENCE_EXECUTOR, INFERENCE_EXECUTOR_WORKERS
+from model_client import model_client
+from encoding_cache import ENCODING_CACHE_ENABLED, supports_encoded_inference, answer_batch
+
+load_dotenv()
+
+INFERENCE_MAX_BATCH_SIZE = int(os.getenv("INFERENCE_MAX_BATCH_SIZE", "8"))
+INFERENCE_MAX_WAIT_MS = float(os.getenv("INFERENCE_MAX_WAIT_MS", "5"))
+
+
+def run_batch(questions, contexts, model_id=None):
+    """Runs one padded forward pass over a batch of question/context pairs."""
+    # Inference worker processes load their own copy of the active model
+    pipe = ensure_model(model_id) if model_id else get_pipeline()
+
+    # Reuse cached encodings when the tokenizer can map tokens back to the context
+    if ENCODING_CACHE_ENABLED and supports_encoded_inference(pipe):
+        return answer_batch(pipe, questions, contexts)
+
+    results = pipe(question=questions, context=contexts, batch_size=len(questions))
+
+    # The pipeline returns a single dict when given a single pair
+    if isinstance(results, dict):
+        results = [results]
+    return results
+
+
+class InferenceBatcher:
+    """
+    Collects questions for up to `max_wait_ms` (or until `max_batch_size` are waiting),
+    runs them through the model as one batch and hands each answer back to its caller.
+    Up to `max_in_flight` batches run at once, one per inference worker.
+    """
+
+    def __init__(self, max_batch_size=INFERENCE_MAX_BATCH_SIZE, max_wait_ms=INFERENCE_MAX_WAIT_MS,
+                 max_in_flight=INFERENCE_EXECUTOR_WORKERS):
+        self.max_batch_size = max(1, max_batch_size)
+        self.max_wait_ms = max(0.0, max_wait_ms)
+        self.max_in_flight = max(1, max_in_flight)
+        self._queue = None
+        self._slots = None
+        self._worker = None
+        self._running = set()
+
+    def _ensure_worker(self):
+        """Starts the scheduler on the running event loop if it isn't running yet."""
+        if self._worker is None or self._worker.done():
+            self._queue = asyncio.Queue()
+            self._slots = asyncio.Semaphore(self.max_in_flight)
+            self._worker = asyncio.create_task(self._schedule())
+
+    async def submit(self, question, context):
+        """Queues a question and waits for the model's answer."""
+        self._ensure_worker()
+        future = asyncio.get_running_loop().create_future()
+        await self._queue.put((question, context, future, time.perf_counter()))
+        metrics.set_gauge("inference_queue_depth", self._queue.qsize())
+        return await future
+
+    async def _collect(self):
+        """Waits for the first item, then gathers more until the batch is full or the wait runs out."""
+        batch = [await self._queue.get()]
+        deadline = time.perf_counter() + self.max_wait_ms / 1000
+
+        while len(batch) < self.max_batch_size:
+            remaining = deadline - time.perf_counter()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(await asyncio.wait_for(self._queue.get(), timeout=remaining))
+            except asyncio.TimeoutError:
+                break
+
+        return batch
+
+    async def _schedule(self):
+        """Scheduler loop that starts a batch whenever an inference worker is free."""
+        while True:
+            # Wait for a free worker first, so requests keep filling the next batch while all are busy
+            await self._slots.acquire()
+            try:
+                batch = await self._collect()
+            except BaseException:
+                self._slots.release()
+                raise
+
+            # Drop requests whose callers have gone away
+            batch = [item for item in batch if not item[2].done()]
+            if not batch:
+                self._slots.release()
+                continue
+
+            task = asyncio.create_task(self._run(batch, self._slots))
+            self._running.add(task)
+            task.add_done_callback(self._running.discard)
+
+    async def _run(self, batch, slots):
+        """Runs one batch on the inference pool, resolves its callers' futures and frees its slot."""
+        try:
+            started = time.perf_counter()
+            for _, _, _, enqueued in batch:
+                metrics.observe("inference_queue_delay_ms", (started - enqueued) * 1000)
+            metrics.observe("inference_batch_size", len(batch), buckets=list(range(1, self.max_batch_size + 1)))
+            metrics.observe("inference_batch_fill_ratio", len(batch) / self.max_batch_size, buckets=[0.25, 0.5, 0.75, 1.0])
+            metrics.increment("inference_batches_total")
+            metrics.increment("inference_requests_total", len(batch))
+            metrics.set_gauge("inference_queue_depth", self._queue.qsize())
+
+            questions = [item[0] for item in batch]
+            contexts = [item[1] for item in batch]
+
+            try:
+                # The forward pass is blocking, so it runs on the inference pool
+                model_id = get_active_model_id() if INFERENCE_EXECUTOR == "process" else None
+                results = await run_inference(run_batch, questions, contexts, model_id)
+            except Exception as e:
+                metrics.increment("inference_errors_total")
+                for _, _, future, _ in batch:
+                    if not future.done():
+                        future.set_exception(e)
+                return
+
+            metrics.observe("inference_batch_latency_ms", (time.perf_counter() - started) * 1000)
+            for (_, _, future, _), result in zip(batch, results):
+                if not future.done():
+                    future.set_result(result)
+        finally:
+            # Callers of a batch cancelled by stop() shouldn't wait forever
+            for _, _, future, _ in batch:
+                if not future.done():
+                    future.cancel()
+            slots.release()
+
+    async def stop(self):
+        """Stops the scheduler and any batches still running."""
+        if self._worker is not None:
+            self._worker.cancel()
+            try:
+                await self._worker
+            except asyncio.CancelledError:
+                pass
+            self._worker = None
+        for task in list(self._running):
+            task.cancel()
+        await asyncio.gather(*self._running, return_exceptions=True)
+
+
+batcher = InferenceBatcher()
+
+
+async def answer_question(question, context):
+    """Answers a question on the model server when one is configured, otherwise through the shared batching scheduler."""
+    if model_client is not None:
+        return await model_client.answer(question, context)
+    return await batcher.submit(question, context)
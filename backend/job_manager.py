@@ -0,0 +1,215 @@
+# Runs recommendations as background jobs that clients poll, so slow requests don't hold a connection open
+import asyncio
+import itertools
+import os
+import time
+import uuid
+from collections import OrderedDict
+from datetime import datetime
+from dotenv import load_dotenv
+from model_handler import llm_run
+from utils import metrics
+
+load_dotenv()
+
+JOB_WORKERS = int(os.getenv("JOB_WORKERS", "4"))
+# Jobs kept at once, queued, running and finished
+JOB_STORE_SIZE = int(os.getenv("JOB_STORE_SIZE", "10000"))
+# Seconds a finished job's result is kept
+JOB_TTL = float(os.getenv("JOB_TTL", "600"))
+# Longest a status request may wait for a job to finish
+JOB_MAX_WAIT = float(os.getenv("JOB_MAX_WAIT", "30"))
+# Queued jobs nobody has asked about for this many seconds are cancelled instead of run
+JOB_ABANDON_AFTER = float(os.getenv("JOB_ABANDON_AFTER", "120"))
+
+# Lower runs first
+PRIORITY_PAYING = 0      # users past the free allowance, whose calls are paid for
+PRIORITY_USER = 1        # other signed in users, including admins
+PRIORITY_ANONYMOUS = 2
+
+FINISHED = {"succeeded", "failed", "cancelled"}
+
+
+class JobStoreFullError(Exception):
+    """Raised when no more jobs can be accepted until some finish."""
+
+
+class Job:
+    def __init__(self, params, user_id=None, priority=PRIORITY_ANONYMOUS):
+        self.id = uuid.uuid4().hex
+        self.params = params
+        self.user_id = user_id
+        self.priority = priority
+        self.status = "queued"
+        self.result = None
+        self.error = None
+        self.created_at = datetime.utcnow()
+        self.started_at = None
+        self.finished_at = None
+        self.expires_at = None
+        self.last_seen = time.monotonic()
+        self.done = asyncio.Event()
+        self.task = None
+
+    def finish(self, status, result=None, error=None):
+        self.status = status
+        self.result = result
+        self.error = error
+        self.finished_at = datetime.utcnow()
+        self.expires_at = time.monotonic() + JOB_TTL
+        self.done.set()
+        metrics.increment(f"jobs_{status}_total")
+
+    def as_dict(self):
+        return {
+            "job_id": self.id,
+            "status": self.status,
+            "priority": self.priority,
+            "created_at": self.created_at.isoformat(),
+            "started_at": self.started_at.isoformat() if self.started_at else None,
+            "finished_at": self.finished_at.isoformat() if self.finished_at else None,
+            "result": self.result,
+            "error": self.error,
+        }
+
+
+class JobManager:
+    """
+    Bounded in-memory job store with a priority queue and a pool of worker tasks.
+    Finished jobs are dropped JOB_TTL seconds after they finish.
+    """
+
+    def __init__(self, workers=JOB_WORKERS, max_jobs=JOB_STORE_SIZE):
+        self.workers = max(1, workers)
+        self.max_jobs = max_jobs
+        self._jobs = OrderedDict()
+        self._queue = None
+        self._tasks = []
+        self._order = itertools.count()
+
+        metrics.register_gauge("jobs", self.stats)
+
+    def start(self):
+        """Starts the worker tasks on the running event loop."""
+        if self._tasks:
+            return
+        self._queue = asyncio.PriorityQueue()
+        self._tasks = [asyncio.create_task(self._work()) for _ in range(self.workers)]
+
+    async def stop(self):
+        """Stops the workers and cancels unfinished jobs."""
+        for task in self._tasks:
+            task.cancel()
+        for task in self._tasks:
+            try:
+                await task
+            except asyncio.CancelledError:
+                pass
+        self._tasks = []
+        for job in self._jobs.values():
+            if job.status not in FINISHED:
+                job.finish("cancelled", error="Server is shutting down")
+
+    def _evict_expired(self):
+        now = time.monotonic()
+        for job_id in [job_id for job_id, job in self._jobs.items() if job.expires_at is not None and job.expires_at <= now]:
+            del self._jobs[job_id]
+
+    def submit(self, params, user_id=None, priority=PRIORITY_ANONYMOUS):
+        """Queues a job for llm_run(**params) and returns it."""
+        self._evict_expired()
+        if len(self._jobs) >= self.max_jobs:
+            # Make room by dropping the oldest finished jobs first
+            finished = [job_id for job_id, job in self._jobs.items() if job.status in FINISHED]
+            if not finished:
+                metrics.increment("jobs_rejected_total")
+                raise JobStoreFullError("Too many jobs in progress")
+            for job_id in finished[:len(self._jobs) - self.max_jobs + 1]:
+                del self._jobs[job_id]
+
+        if self._queue is None:
+            self.start()
+
+        job = Job(params, user_id, priority)
+        self._jobs[job.id] = job
+        self._queue.put_nowait((priority, next(self._order), job.id))
+        metrics.increment("jobs_submitted_total")
+        return job
+
+    def get(self, job_id):
+        """Returns a job and notes that a client still wants it, or None."""
+        job = self._jobs.get(job_id)
+        if job is None:
+            return None
+        if job.expires_at is not None and job.expires_at <= time.monotonic():
+            del self._jobs[job_id]
+            return None
+        job.last_seen = time.monotonic()
+        return job
+
+    async def wait(self, job, timeout):
+        """Waits up to `timeout` seconds for a job to finish."""
+        try:
+            await asyncio.wait_for(job.done.wait(), min(timeout, JOB_MAX_WAIT))
+        except asyncio.TimeoutError:
+            pass
+        job.last_seen = time.monotonic()
+        return job
+
+    def cancel(self, job, reason="Cancelled"):
+        """Cancels a queued or running job."""
+        if job.status in FINISHED:
+            return False
+        if job.task is not None:
+            job.task.cancel()
+        job.finish("cancelled", error=reason)
+        return True
+
+    async def _work(self):
+        """Worker loop that runs the most urgent queued job."""
+        while True:
+            _, _, job_id = await self._queue.get()
+            job = self._jobs.get(job_id)
+            if job is None or job.status != "queued":
+                continue
+
+            # Nobody is waiting for it any more
+            if time.monotonic() - job.last_seen > JOB_ABANDON_AFTER:
+                job.finish("cancelled", error="Abandoned by the client")
+                continue
+
+            job.status = "running"
+            job.started_at = datetime.utcnow()
+            metrics.observe("job_queue_wait_ms", (job.started_at - job.created_at).total_seconds() * 1000)
+
+            job.task = asyncio.create_task(llm_run(**job.params))
+            try:
+                result = await job.task
+            except asyncio.CancelledError:
+                # The job was cancelled; the worker itself carries on unless it is being stopped
+                if job.status != "cancelled":
+                    job.finish("cancelled", error="Cancelled")
+                    raise
+                continue
+            except Exception as e:
+                job.finish("failed", error=str(e) or type(e).__name__)
+                continue
+            finally:
+                job.task = None
+
+            if job.status == "running":
+                job.finish("succeeded", result=result)
+
+    def stats(self):
+        counts = {}
+        for job in self._jobs.values():
+            counts[job.status] = counts.get(job.status, 0) + 1
+        return {
+            "jobs": len(self._jobs),
+            "max_jobs": self.max_jobs,
+            "queued": self._queue.qsize() if self._queue is not None else 0,
+            "by_status": counts,
+        }
+
+
+job_manager = JobManager()
@@ -1,50 +1,215 @@
-import requests
+import asyncio
+import time
 from dotenv import load_dotenv
 import os
 
-from utils.places_filter import filter_places_by_radius
+from utils.places_filter import filter_places_by_radius, PLACES_TOP_K
+from utils.places_cache import cache_query, get_cached_places, cache_places
+from utils import metrics
+from utils.executors import run_io
+from utils.http_client import get_client, UpstreamError
+from utils.request_cost import RequestBudget
 
 load_dotenv()
 
 API_KEY = os.getenv("GOOGLE_API_KEY")
 API = os.getenv("GOOGLE_API")
+PLACES_CACHE_ENABLED = os.getenv("PLACES_CACHE_ENABLED", "true").lower() == "true"
 
-def location_finder(user_latitude, user_longitude, user_height, steps_to_take, place_type):
+# Result pages to read per search (Places serves up to 3 pages of 20), 1 keeps the first page only
+PLACES_MAX_PAGES = int(os.getenv("PLACES_MAX_PAGES", "1"))
+# Time budget for reading extra pages, in milliseconds
+PLACES_MAX_LATENCY_MS = float(os.getenv("PLACES_MAX_LATENCY_MS", "5000"))
+# Seconds before a next_page_token becomes usable
+PLACES_PAGE_TOKEN_DELAY = float(os.getenv("PLACES_PAGE_TOKEN_DELAY", "2"))
+# Stop reading pages once this many ranked candidates are within the radius
+PLACES_MIN_CANDIDATES = int(os.getenv("PLACES_MIN_CANDIDATES", str(PLACES_TOP_K)))
+
+# Places statuses that are worth retrying
+RETRYABLE_PLACES_STATUSES = {"OVER_QUERY_LIMIT", "UNKNOWN_ERROR"}
+
+places_client = get_client("places")
+
+def is_retryable_places_response(response):
+    """Checks if Places answered with a transient error status."""
+    return response.json().get("status") in RETRYABLE_PLACES_STATUSES
+
+def _request_places(params):
+    """Sends a Nearby Search request over the shared keep-alive client, retrying transient failures."""
+    try:
+        response = places_client.get(API, params=params, retry_if=is_retryable_places_response)
+        # Parse the response JSON
+        return response.json()
+    except (UpstreamError, ValueError) as e:
+        return {"status": "UNAVAILABLE", "results": [], "error_message": str(e)}
+
+def fetch_places(latitude, longitude, radius, place_type):
+    """Calls the Places API Nearby Search and returns the parsed response."""
+    params = {
+        "location": f"{latitude},{longitude}",
+        "radius": radius,
+        "key": API_KEY,
+        "type": place_type,
+    }
+    return _request_places(params)
+
+def fetch_places_page(page_token):
+    """Fetches the next page of a Nearby Search."""
+    return _request_places({"pagetoken": page_token, "key": API_KEY})
+
+async def fetch_all_pages(latitude, longitude, radius, place_type, enough=None, budget=None):
+    """
+    Fetches a Nearby Search and follows its next_page_token, up to PLACES_MAX_PAGES pages
+    within PLACES_MAX_LATENCY_MS. The results so far are handed to `enough(results)` as each
+    page arrives, and no more pages are read once it returns True.
+    Each call is taken from `budget` when it is given; nothing is fetched once it is spent.
+    `complete` in the response is False when pages were left unread for any reason other than PLACES_MAX_PAGES.
+    """
+    deadline = time.monotonic() + PLACES_MAX_LATENCY_MS / 1000
+
+    if budget is not None and not budget.take_upstream_call():
+        return {"status": "OVER_BUDGET", "results": [], "error_message": "Upstream call budget for this request is spent"}
+
+    data = await run_io(fetch_places, latitude, longitude, radius, place_type)
+    results = list(data.get("results", []))
+    seen = {place.get("place_id") for place in results}
+    token = data.get("next_page_token")
+    pages = 1
+    complete = True
+
+    while token and pages < PLACES_MAX_PAGES:
+        if enough is not None and enough(results):
+            metrics.increment("places_pagination_early_exits_total")
+            complete = False
+            break
+
+        # A new token takes a moment to become valid; wait for it without holding a thread
+        if time.monotonic() + PLACES_PAGE_TOKEN_DELAY > deadline:
+            metrics.increment("places_pagination_budget_exhausted_total")
+            complete = False
+            break
+        if budget is not None and not budget.take_upstream_call():
+            complete = False
+            break
+        await asyncio.sleep(PLACES_PAGE_TOKEN_DELAY)
+
+        page = await run_io(fetch_places_page, token)
+        if (page.get("status") == "INVALID_REQUEST" and time.monotonic() + PLACES_PAGE_TOKEN_DELAY <= deadline
+                and (budget is None or budget.take_upstream_call())):
+            # The token wasn't active yet, give it one more delay
+            await asyncio.sleep(PLACES_PAGE_TOKEN_DELAY)
+            page = await run_io(fetch_places_page, token)
+        if page.get("status") != "OK":
+            complete = False
+            break
+
+        for place in page.get("results", []):
+            if place.get("place_id") not in seen:
+                seen.add(place.get("place_id"))
+                results.append(place)
+        token = page.get("next_page_token")
+        pages += 1
+
+    metrics.observe("places_pages_per_search", pages, buckets=[1, 2, 3])
+    return dict(data, results=results, pages=pages, complete=complete)
+
+async def get_nearby_places(latitude, longitude, search_radius, place_type, enough=None, budget=None):
+    """
+    Returns a raw Places response that covers `search_radius` around the position.
+    Responses are cached per geohash cell, place type and radius bucket, so nearby users share them.
+    """
+    if not PLACES_CACHE_ENABLED:
+        return await fetch_all_pages(latitude, longitude, search_radius, place_type, enough, budget)
+
+    key, center, query_radius = cache_query(latitude, longitude, search_radius, place_type)
+    # The disk tier may be read, so look up on the I/O pool
+    data = await run_io(get_cached_places, key)
+    if data is not None:
+        metrics.increment("places_cache_hits_total")
+        return data
+
+    metrics.increment("places_cache_misses_total")
+    data = await fetch_all_pages(center[0], center[1], query_radius, place_type, enough, budget)
+
+    # Only cache successful responses that read every page, since a cut short one is
+    # enough for this request's steps but not necessarily for the next user's
+    if data.get("status") in ("OK", "ZERO_RESULTS") and "error_message" not in data and data.get("complete"):
+        await run_io(cache_places, key, {"status": data["status"], "results": data.get("results", [])})
+    return data
+
+async def location_finder(user_latitude, user_longitude, user_height, steps_to_take, place_type, metadata=None):
     """
     Finds top three locations sorted according to Google Maps Rating that closely meet step count.
+    `place_type` can be one type or a list of types, which are searched concurrently and ranked together.
+    Per-type status and latency, and the request's effective cost limits, are written into `metadata` when it is given.
     """
+    place_types = [place_type] if isinstance(place_type, str) else list(dict.fromkeys(place_type))
+
     # Stride length formula found online
     stride_length = user_height / 100 * 0.4
 
-    # Add 100 meters to search locations slightly further than search radius
-    search_radius = stride_length * steps_to_take + 100
+    # Add 100 meters to search locations slightly further than search radius,
+    # clamped so very large step counts can't make the request arbitrarily expensive
+    budget = RequestBudget(stride_length * steps_to_take + 100)
+    search_radius = budget.radius
+    if metadata is not None:
+        metadata["cost"] = budget.as_metadata()
 
-    params = {
-        "location": f"{user_latitude},{user_longitude}",
-        "radius": search_radius,
-        "key": API_KEY,
-        "type": place_type,
-    }
+    center = (user_latitude, user_longitude)
 
-    # Make the API request
-    response = requests.get(API, params=params)
+    def enough(results):
+        """Checks if the pages so far hold enough ranked candidates within the radius."""
+        candidates = filter_places_by_radius(center, {"results": results}, search_radius, top_k=PLACES_MIN_CANDIDATES)
+        return len(candidates) >= PLACES_MIN_CANDIDATES
 
-    # Parse the response JSON
-    data = response.json()
+    async def search(search_type):
+        """Searches one place type and times it."""
+        started = time.perf_counter()
+        # Raw results, possibly shared with nearby users, are re-filtered below for this exact position
+        data = await get_nearby_places(user_latitude, user_longitude, search_radius, search_type, enough, budget)
+        return search_type, data, (time.perf_counter() - started) * 1000
+
+    # Search every type concurrently
+    searches = await asyncio.gather(*(search(search_type) for search_type in place_types))
+
+    # Merge the results, a place listed under several types is only ranked once
+    merged = []
+    seen = set()
+    type_metadata = {}
+    for search_type, data, latency_ms in searches:
+        type_metadata[search_type] = {
+            "status": data.get("status"),
+            "results": len(data.get("results", [])),
+            "latency_ms": round(latency_ms, 1),
+        }
+
+        # Handle Places API errors
+        if "error_message" in data:
+            print(f"API error for {search_type}: {data['error_message']}")
+            continue
+
+        for place in data.get("results", []):
+            if place.get("place_id") not in seen:
+                seen.add(place.get("place_id"))
+                merged.append(place)
+
+    merged = budget.limit_candidates(merged)
+
+    if metadata is not None:
+        metadata["place_types"] = type_metadata
+        metadata["cost"] = budget.as_metadata()
 
-    # Handle Places API errors
-    if "error_message" in data:
-        print(f"API error: {data['error_message']}")
-        return
-    
     # Handles empty response from Places API
-    if data["status"] == "ZERO_RESULTS":
+    if not merged:
         print("No results for places at chosen location and step count.")
         return
 
+    data = {"status": "OK", "results": merged}
+
     # Process the results
     places_within_radius = filter_places_by_radius(
-        (user_latitude, user_longitude), data, search_radius
+        center, data, search_radius,
+        target_distance=stride_length * steps_to_take
     )
 
     places_json_list = []
@@ -60,6 +225,6 @@ def location_finder(user_latitude, user_longitude, user_height, steps_to_take, p
             }
             places_json_list.append(place_data)
     else:
-        return {"response": "No places found within the specified radius."}
+        print("No places found within the specified radius.")
 
     return places_json_list
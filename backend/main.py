@@ -1,16 +1,34 @@
 # API server is here
-from fastapi import FastAPI, HTTPException, Depends, status, BackgroundTasks, Response, Request, Body
-from fastapi.responses import Response
+from utils import startup_profile
+from fastapi import FastAPI, HTTPException, Depends, status, BackgroundTasks, Response, Request, Body, Query
+from fastapi.responses import Response, JSONResponse, StreamingResponse
 from fastapi.middleware.cors import CORSMiddleware
 from jose import JWTError, jwt
-from utils.models.models import LocationDetails, LocationDetailsResponse, RegisterRequest, RegisterResponse, LoginRequest, LoginResponse, LogoutResponse, PasswordResetRequest, PasswordResetRequestResponse, PasswordReset, PasswordResetResponse, VerifyTokenResponse, EndpointStatsListResponse, ApiUsageListResponse, ApiUsageForUserResponse, DeleteAccountResponse, UpdateNameResponse
-from utils.db_connection import get_db_connection, close_db_connection, create_user_table, insert_user, get_user_by_email, update_user_password, create_endpoint_table, get_endpoint_stats_from_db, create_api_usage_table, initialize_usage_record, get_api_usage_data, get_api_usage_data_for_user, delete_user, update_user_name
-from utils.auth_utils import hash_password, verify_password, create_access_token, create_password_reset_token, send_reset_email, get_current_user
-from datetime import timedelta
-from utils.request_logger import log_endpoint_stats, update_user_api_usage, update_llm_api_calls
-from model_handler import llm_run
+from utils.models.models import LocationDetails, LocationDetailsResponse, RegisterRequest, RegisterResponse, LoginRequest, LoginResponse, LogoutResponse, PasswordResetRequest, PasswordResetRequestResponse, PasswordReset, PasswordResetResponse, VerifyTokenResponse, EndpointStatsListResponse, ApiUsageListResponse, ApiUsageForUserResponse, DeleteAccountResponse, UpdateNameResponse, ModelStatusResponse, ModelReloadRequest, MetricsResponse, JobResponse
+from utils.async_db import usage_summary, init_database, close_database, insert_user, get_user_by_email, update_user_password, initialize_usage_record, get_api_usage_data_for_user, delete_user, update_user_name
+from utils.db_pool import DatabaseConnectionError
+from utils.auth_utils import hash_password_async, verify_and_update_password, set_access_token_cookie, revoke_access_token, create_password_reset_token, send_reset_email, get_current_user, get_token_user, require_admin, token_subject
+from utils.token_cache import revoke_subject
+from utils.request_logger import log_endpoint_stats, update_user_api_usage
+from utils.usage_buffer import usage_buffer
+from utils.stats_view import stats_view, InvalidCursorError, ENDPOINT_SORTS, USER_SORTS, STATS_PAGE_SIZE, STATS_MAX_PAGE_SIZE
+from utils.rate_limiter import check_rate_limit, is_llm_call
+from utils.quota import check_llm_quota, reserve_llm_call, release_llm_call, pays_for_llm_calls, quota_headers
+from model_handler import llm_run, llm_stream
+from job_manager import job_manager, JobStoreFullError, PRIORITY_PAYING, PRIORITY_USER, PRIORITY_ANONYMOUS, FINISHED, JOB_MAX_WAIT
+from recommenders import STRATEGY_NAMES
+from model_registry import load_model, load_model_in_background, swap_model, model_status, is_ready, ModelNotReadyError, MODEL_LOAD_MODE
+from inference_batcher import batcher
+from model_client import model_client, ModelServerBusyError, ModelServerError
+from utils import metrics
+from utils.executors import shutdown_executors
 from dotenv import load_dotenv
+import asyncio
+import json
 import os
+from typing import Optional
+
+startup_profile.mark("import app modules")
 
 # Load environment variables from .env file
 load_dotenv()
@@ -19,25 +37,24 @@ SECRET_KEY = os.getenv("SECRET_KEY")
 ALGORITHM = os.getenv("ALGORITHM")
 ACCESS_TOKEN_EXPIRE_MINUTES = int(os.getenv("ACCESS_TOKEN_EXPIRE_MINUTES"))
 RESET_PASSWORD_SECRET_KEY = os.getenv("RESET_PASSWORD_SECRET_KEY")
+MAX_LOCATION_TYPES = int(os.getenv("MAX_LOCATION_TYPES", "5"))
 
 app = FastAPI()
 
-# Configure CORS middleware to allow your frontend origin
-app.add_middleware(
-    CORSMiddleware, 
-    allow_origins=["http://127.0.0.1:5500", "https://dn3aeuakeqz2h.cloudfront.net"],
-    allow_credentials=True,
-    allow_methods=["*"],
-    allow_headers=["*"],
-)
-
 # Logs API calls
 @app.middleware("http")
 async def log_request_and_update_usage(request: Request, call_next):
     """
-    Middleware that logs the request to the `endpoints` table
+    Middleware that rate limits the request, logs it to the `endpoints` table
     and updates the user's API usage in the `api_usage` table.
     """
+
+    # Rate limit before any database or model work, keyed by the token's subject or the client IP
+    limit = None
+    if request.method != "OPTIONS":
+        limit = await check_rate_limit(request, token_subject(request))
+        if limit is not None and not limit.allowed:
+            return JSONResponse(status_code=429, content={"detail": "Too many requests"}, headers=limit.headers())
     
     # Log the request to the `endpoints` table
     await log_endpoint_stats(request)
@@ -49,21 +66,55 @@ async def log_request_and_update_usage(request: Request, call_next):
     except HTTPException:
         pass
 
+    headers = limit.headers() if limit is not None else {}
+    reserved = False
+
     if user:
         # If the user is authenticated, proceed with logging and updating usage
         user_id = user["id"]
         
         # Update the user's API usage in the `api_usage` table
-        await update_user_api_usage(user_id)
-        
-        if request.url.path == '/api/v1/llm' and request.method == 'POST':
-            await update_llm_api_calls(user_id)
+        llm_call = is_llm_call(request)
+
+        if llm_call:
+            # Checked and counted against cached counters, not a fresh query
+            allowed, remaining = await reserve_llm_call(user)
+            if not allowed:
+                headers.update(quota_headers(remaining))
+                return JSONResponse(status_code=429, content={"detail": "Free LLM API call quota exhausted"}, headers=headers)
+            headers.update(quota_headers(remaining))
+            reserved = True
+
+        await update_user_api_usage(user_id, llm_call)
         
-    # Process the request and return the response
-    response = await call_next(request)
+    # Process the request and return the response, giving the quota back if it fails
+    try:
+        response = await call_next(request)
+    except Exception:
+        if reserved:
+            await release_llm_call(user["id"])
+        raise
+    if reserved and response.status_code >= 400:
+        await release_llm_call(user["id"])
+        _, remaining = await check_llm_quota(user)
+        headers.update(quota_headers(remaining))
+    response.headers.update(headers)
     return response
 
 
+# Configure CORS middleware to allow your frontend origin.
+# Added after the logging middleware so it wraps it, and the 429s that middleware returns get CORS headers too
+app.add_middleware(
+    CORSMiddleware, 
+    allow_origins=["http://127.0.0.1:5500", "https://dn3aeuakeqz2h.cloudfront.net"],
+    allow_credentials=True,
+    allow_methods=["*"],
+    allow_headers=["*"],
+    # Let the frontend read the limits and back off
+    expose_headers=["Retry-After", "X-RateLimit-Limit", "X-RateLimit-Remaining", "X-RateLimit-Reset", "X-Quota-Limit", "X-Quota-Remaining"],
+)
+
+
 # Preflight handler 
 @app.options("/{path:path}",
     summary="Preflight request handler",
@@ -72,33 +123,77 @@ async def preflight_handler():
     return Response(status_code=200)
 
 
-# Creates tables on start up if they don't exist
+# Loads the QA model and creates tables on start up if they don't exist
 @app.on_event("startup")
 async def on_startup():
-    db = get_db_connection()
-    if db is None:
-        print("Failed to connect to database.")
-        return
+    # Load the QA model once so every request shares the same pipeline,
+    # unless a model server owns it. MODEL_LOAD_MODE decides when:
+    # eager loads it now, background loads it while serving, lazy waits for the first /api/v1/llm request.
+    if model_client is None and MODEL_LOAD_MODE == "eager":
+        try:
+            load_model()
+        except Exception as e:
+            print(f"The model failed to load: '{e}'")
 
     try:
-        create_user_table(db)
-        create_endpoint_table(db)
-        create_api_usage_table(db)
+        with startup_profile.phase("initialise database"):
+            await init_database()
+
+    except DatabaseConnectionError:
+        print("Failed to connect to database.")
 
-    except Error as e:
+    except Exception as e:
         print(f"The error '{e}' occurred")
 
-    finally:
-        close_db_connection(db) 
+    # Start writing buffered request counts in the background
+    usage_buffer.start()
+
+    # Keep the admin stats view in step with other workers' counts
+    stats_view.start()
+
+    # Start the workers for queued recommendation jobs
+    job_manager.start()
+
+    if model_client is None and MODEL_LOAD_MODE == "background":
+        load_model_in_background()
+
+    startup_profile.mark("startup")
+    startup_profile.print_report()
+
+
+# Stops background workers when the app shuts down
+@app.on_event("shutdown")
+async def on_shutdown():
+    await job_manager.stop()
+    await stats_view.stop()
+    await batcher.stop()
+    if model_client is not None:
+        await model_client.close()
+    # Write any buffered request counts before the database closes
+    await usage_buffer.stop()
+    await close_database()
+    shutdown_executors()
+
+
+# Raised by the data-access layer when no database connection is available
+@app.exception_handler(DatabaseConnectionError)
+async def database_connection_error_handler(request: Request, exc: DatabaseConnectionError):
+    return JSONResponse(status_code=500, content={"detail": "Database connection failed"})
 
 
 @app.get(
     "/",
     summary="Root/health check endpoint",
-    description="This endpoint serves as a health check to indicate that the application is running. It returns a simple JSON message."
+    description="This endpoint serves as a health check to indicate that the application is running. It returns a simple JSON message along with the readiness of the QA model."
 )
 async def read_root():
-    return {"message": "This response means that the app is running."}
+    if model_client is not None:
+        try:
+            status = await model_client.status()
+        except ModelServerError as e:
+            status = {"state": "unavailable", "error": str(e)}
+        return {"message": "This response means that the app is running.", "model_ready": status["state"] == "ready", "model": status}
+    return {"message": "This response means that the app is running.", "model_ready": is_ready(), "model": model_status()}
 
 
 @app.post("/api/v1/register", 
@@ -106,36 +201,30 @@ async def read_root():
     summary="Register a new user", 
     description="This endpoint registers a new user by accepting user details such as first name, email, and password. It checks for an existing user and hashes the password before storing it.")
 async def register_user(request: RegisterRequest):
-     # Connect to the database
-    db = get_db_connection()
-    if not db:
-        raise HTTPException(status_code=500, detail="Database connection failed")
-    
     # Check if the email already exists
-    existing_user = get_user_by_email(db, request.email)
+    existing_user = await get_user_by_email(request.email)
     if existing_user:
-        close_db_connection(db)
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
             detail="A user with this email already exists."
         )
     
-    # Hash the password
-    hashed_password = hash_password(request.password)
+    # Hash the password on the hashing pool
+    hashed_password = await hash_password_async(request.password)
 
     try:
         # Insert the user into the database
-        insert_user(db, request.first_name, request.email, hashed_password)
+        await insert_user(request.first_name, request.email, hashed_password)
         
         # Get the user_id of the newly inserted user
-        user = get_user_by_email(db, request.email)
+        user = await get_user_by_email(request.email)
         if user:
             user_id = user["id"]
-            initialize_usage_record(db, user_id)    # initialize the user in api usage table
+            await initialize_usage_record(user_id)    # initialize the user in api usage table
+    except DatabaseConnectionError:
+        raise
     except Exception as e:
         raise HTTPException(status_code=400, detail=str(e))
-    finally:
-        close_db_connection(db)
 
     return {"message": "User registered successfully!"}
 
@@ -145,39 +234,29 @@ async def register_user(request: RegisterRequest):
     summary="Login user into application", 
     description="This endpoint authenticates the user and returns a JWT token in a secure HTTP-only cookie.")
 async def login(request: LoginRequest, response: Response):
-    # Connect to the database
-    db = get_db_connection()
-    if not db:
-        raise HTTPException(status_code=500, detail="Database connection failed")
-
     # Retrieve the user by email
-    user = get_user_by_email(db, request.email)
-    close_db_connection(db)
+    user = await get_user_by_email(request.email)
 
-    # Verify if user exists or if password doesn't match
-    if not user or not verify_password(request.password, user["password_hash"]):
+    # Verify if user exists or if password doesn't match (bcrypt runs on the hashing pool)
+    valid, new_hash = (False, None)
+    if user:
+        valid, new_hash = await verify_and_update_password(request.password, user["password_hash"])
+    if not valid:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="Invalid email or password",
             headers={"WWW-Authenticate": "Bearer"},
         )
 
-    # Generate a JWT token
-    access_token_expires = timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES)
-    access_token = create_access_token(
-        data={"sub": user["email"]}, expires_delta=access_token_expires
-    )
-
-    # Set the token in an HTTP-only cookie
-    response.set_cookie(
-        key="access_token",
-        value=access_token,
-        httponly=True,
-        max_age=ACCESS_TOKEN_EXPIRE_MINUTES * 60,
-        secure=True,
-        samesite="None",
-        path="/"  # Ensure cookie is available for all paths
-    )
+    # The stored hash used an older cost factor, so replace it now that we have the password
+    if new_hash:
+        try:
+            await update_user_password(user["email"], new_hash)
+        except DatabaseConnectionError as e:
+            print("Failed to rehash password:", e)
+
+    # Generate a JWT token and set it in an HTTP-only cookie
+    set_access_token_cookie(response, user)
 
     return {"message": "Login successful", "isAdmin": user.get("is_admin")}
 
@@ -186,7 +265,9 @@ async def login(request: LoginRequest, response: Response):
     response_model = LogoutResponse,
     summary="Log user out of application",
     description="This endpoint logs out the user by deleting the JWT token from the HTTP-only cookie.")
-async def logout(response: Response):
+async def logout(request: Request, response: Response):
+    # The token stays valid until it expires unless revoked
+    revoke_access_token(request)
     response.delete_cookie("access_token")
     return {"message": "Logged out successfully"}
 
@@ -197,9 +278,7 @@ async def logout(response: Response):
     description="This endpoint sends a password reset link to the user's email.")
 async def request_password_reset(request: PasswordResetRequest, background_tasks: BackgroundTasks):
     # Verify if the email exists in the database
-    db = get_db_connection()
-    user = get_user_by_email(db, request.email)
-    close_db_connection(db)
+    user = await get_user_by_email(request.email)
 
     if not user:
         raise HTTPException(status_code=404, detail="Email not found")
@@ -228,19 +307,30 @@ async def reset_password(request: PasswordReset):
     except JWTError:
         raise HTTPException(status_code=401, detail="Invalid or expired token")
 
-    # Connect to the database and update the user's password
-    db = get_db_connection()
-    user = get_user_by_email(db, email)
+    # Check the user exists and update their password
+    user = await get_user_by_email(email)
     if not user:
-        close_db_connection(db)
         raise HTTPException(status_code=404, detail="User not found")
 
-    hashed_password = hash_password(request.new_password)
-    update_user_password(db, email, hashed_password)
-    close_db_connection(db)
+    hashed_password = await hash_password_async(request.new_password)
+    await update_user_password(email, hashed_password)
+
+    # Sign out sessions that used the old password
+    revoke_subject(email)
 
     return {"message": "Password has been reset successfully"}
 
+def validate_location_details(request: LocationDetails):
+    """Checks the parts of an LLM request that the model can't express."""
+    # A list of types is searched concurrently and ranked together
+    if not isinstance(request.location_type, str):
+        if not request.location_type or len(request.location_type) > MAX_LOCATION_TYPES:
+            raise HTTPException(status_code=422, detail=f"location_type must list between 1 and {MAX_LOCATION_TYPES} place types")
+
+    if request.strategy is not None and request.strategy not in STRATEGY_NAMES:
+        raise HTTPException(status_code=422, detail=f"strategy must be one of: {', '.join(STRATEGY_NAMES)}")
+
+
 # LLM endpoint
 @app.post("/api/v1/llm", response_model=LocationDetailsResponse, 
     summary="Posts user location, details, and desired location type to LLM.", 
@@ -252,17 +342,174 @@ async def llm_start(request: LocationDetails):
     steps = request.steps
     location_type = request.location_type
 
-    response = llm_run(latitude, longitude, height, steps, location_type) 
+    validate_location_details(request)
+
+    try:
+        response = await llm_run(latitude, longitude, height, steps, location_type, request.strategy)
+    except ModelNotReadyError as e:
+        raise HTTPException(status_code=503, detail=str(e))
+    except ModelServerBusyError as e:
+        # The model server's queue is full
+        raise HTTPException(status_code=429, detail=str(e), headers={"Retry-After": str(e.retry_after)})
+    except ModelServerError as e:
+        raise HTTPException(status_code=503, detail=str(e), headers={"Retry-After": str(e.retry_after)})
 
     return {"response": response}
 
 
+# Streaming LLM endpoint
+@app.post("/api/v1/llm/stream",
+    summary="Posts user location, details, and desired location type to LLM, streaming the result.",
+    description="Same request as /api/v1/llm. The response is newline-delimited JSON: a `places` event with `api_response` as soon as the places are filtered, "
+                "a `recommendation` event with `llm_recommendation` and `recommendation_strategy` once it is ready, then a `metadata` event with timings. "
+                "If the recommendation fails an `error` event with `status` and `detail` is sent instead.")
+async def llm_stream_start(request: LocationDetails):
+    validate_location_details(request)
+
+    async def events():
+        try:
+            async for event in llm_stream(request.latitude, request.longitude, request.height, request.steps, request.location_type, request.strategy):
+                yield json.dumps(event) + "\n"
+        except ModelServerBusyError as e:
+            yield json.dumps({"event": "error", "status": 429, "detail": str(e), "retry_after": e.retry_after}) + "\n"
+        except (ModelNotReadyError, ModelServerError) as e:
+            yield json.dumps({"event": "error", "status": 503, "detail": str(e)}) + "\n"
+        except Exception as e:
+            # The status line has already gone out, so the client needs an event to stop waiting
+            print(f"Error streaming recommendation: {e}")
+            yield json.dumps({"event": "error", "status": 500, "detail": "Failed to generate a recommendation"}) + "\n"
+
+    # The headers are sent right away; no-transform stops proxies buffering the stream
+    return StreamingResponse(events(), media_type="application/x-ndjson", headers={"Cache-Control": "no-cache, no-transform", "X-Accel-Buffering": "no"})
+
+
+async def optional_user(request: Request):
+    """Returns the signed in user, or None."""
+    try:
+        return await get_current_user(request)
+    except HTTPException:
+        return None
+
+
+def get_owned_job(job_id: str, user):
+    """Returns a job if it exists and belongs to the caller, otherwise 404."""
+    job = job_manager.get(job_id)
+    if job is None or job.user_id != (user["id"] if user else None):
+        raise HTTPException(status_code=404, detail="Job not found")
+    return job
+
+
+# Job endpoints: queue a recommendation and poll for it
+@app.post("/api/v1/jobs",
+    response_model=JobResponse,
+    status_code=202,
+    summary="Queues a recommendation job",
+    description="Same body as /api/v1/llm. Returns a job id straight away; poll GET /api/v1/jobs/{job_id} for the result. "
+                "With `wait`, waits up to that many seconds for the job to finish first, and cancels it if the client disconnects meanwhile. "
+                "Users paying for calls past the free quota are served first, then other signed in users.")
+async def create_job(request: LocationDetails, http_request: Request, response: Response, wait: float = 0):
+    validate_location_details(request)
+
+    user = await optional_user(http_request)
+    if user is None:
+        priority = PRIORITY_ANONYMOUS
+    else:
+        # Cached counters, and this call was already counted by the middleware
+        priority = PRIORITY_PAYING if await pays_for_llm_calls(user) else PRIORITY_USER
+
+    try:
+        job = job_manager.submit(
+            {
+                "latitude": request.latitude,
+                "longitude": request.longitude,
+                "height": request.height,
+                "steps": request.steps,
+                "location_type": request.location_type,
+                "strategy": request.strategy,
+            },
+            user_id=user["id"] if user else None,
+            priority=priority,
+        )
+    except JobStoreFullError as e:
+        raise HTTPException(status_code=503, detail=str(e), headers={"Retry-After": "5"})
+
+    response.headers["Location"] = f"/api/v1/jobs/{job.id}"
+    if wait > 0:
+        await wait_for_job(job, wait, http_request, cancel_on_disconnect=True)
+        if job.status in FINISHED:
+            response.status_code = 200
+    return job.as_dict()
+
+
+async def wait_for_job(job, wait, http_request: Request, cancel_on_disconnect=False):
+    """Long-polls a job, checking every second whether the client is still there."""
+    deadline = asyncio.get_running_loop().time() + min(wait, JOB_MAX_WAIT)
+    while not job.done.is_set():
+        remaining = deadline - asyncio.get_running_loop().time()
+        if remaining <= 0:
+            break
+        await job_manager.wait(job, min(remaining, 1))
+        if await http_request.is_disconnected():
+            if cancel_on_disconnect:
+                job_manager.cancel(job, "Client disconnected")
+            break
+
+
+@app.get("/api/v1/jobs/{job_id}",
+    response_model=JobResponse,
+    summary="Gets a recommendation job",
+    description="Returns the job's status and, once it has succeeded, its result. With `wait`, long-polls for up to that many seconds (at most 30) until the job finishes.")
+async def get_job(job_id: str, http_request: Request, wait: float = 0):
+    user = await optional_user(http_request)
+    job = get_owned_job(job_id, user)
+    if wait > 0:
+        await wait_for_job(job, wait, http_request)
+    return job.as_dict()
+
+
+@app.delete("/api/v1/jobs/{job_id}",
+    response_model=JobResponse,
+    summary="Cancels a recommendation job",
+    description="Cancels a queued or running job. Finished jobs are returned unchanged.")
+async def cancel_job(job_id: str, http_request: Request):
+    user = await optional_user(http_request)
+    job = get_owned_job(job_id, user)
+    job_manager.cancel(job, "Cancelled by the client")
+    return job.as_dict()
+
+
+# Hot-swaps the QA model without restarting the process
+@app.post("/api/v1/model/reload",
+    response_model=ModelStatusResponse,
+    summary="Reloads or swaps the QA model",
+    description="Admin only. Loads and warms up the given model (or reloads the configured one) and swaps it in once it is ready. The current model keeps serving requests until then.")
+async def reload_model(request: ModelReloadRequest = Body(default=ModelReloadRequest()), current_user: dict = Depends(require_admin)):
+    try:
+        if model_client is not None:
+            return await model_client.reload(request.model_id)
+        # Loading takes seconds, so keep it off the event loop
+        await asyncio.to_thread(swap_model, request.model_id)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Failed to load model: {e}")
+
+    return model_status()
+
+
+# Exposes in-process metrics
+@app.get("/api/v1/metrics",
+    response_model=MetricsResponse,
+    summary="Get in-process metrics",
+    description="Admin only. Returns the counters, gauges and histograms collected by this worker, such as inference batch fill ratio and queue delay.")
+async def get_metrics(current_user: dict = Depends(require_admin)):
+    return metrics.snapshot()
+
+
 # Verify token endpoint
 @app.get("/api/v1/verify-token", 
     response_model = VerifyTokenResponse,
     summary="Verify if the token is valid and retrieve user information",
-    description="This endpoint verifies the validity of the current user's token and returns related user information.")
-async def verify_token(current_user: dict = Depends(get_current_user)):
+    description="This endpoint verifies the validity of the current user's token and returns related user information. It is answered from the token's claims when the token carries them.")
+async def verify_token(current_user: dict = Depends(get_token_user)):
     return {
         "message": "Token is valid",
         "user_id": current_user["id"],
@@ -273,37 +520,71 @@ async def verify_token(current_user: dict = Depends(get_current_user)):
         "first_name": current_user.get("first_name", "")
     }
 
+def not_modified(request: Request, etag: str):
+    """Checks if the client already has the version tagged `etag`."""
+    if_none_match = request.headers.get("if-none-match")
+    if not if_none_match:
+        return False
+    return if_none_match.strip() == "*" or etag in [tag.strip() for tag in if_none_match.split(",")]
+
+
 # Retrieve stats for all API endpoints
 @app.get("/api/v1/stats/endpoints",
          response_model=EndpointStatsListResponse,
          summary="Get endpoint usage statistics",
-         description="Retrieve statistics for all API endpoints, including HTTP method, endpoint path, and usage count."
+         description="Admin only. Retrieve statistics for all API endpoints, including HTTP method, endpoint path, and usage count. "
+                     "Sorted by `sort` (count or endpoint) and paginated: pass `next_cursor` back as `cursor` for the next page. "
+                     "Served from an in-memory view refreshed from the database periodically; send If-None-Match to get 304 when unchanged."
         )
-async def get_endpoint_stats():
+async def get_endpoint_stats(http_request: Request, response: Response, sort: str = "count", cursor: Optional[str] = None,
+                             limit: int = Query(STATS_PAGE_SIZE, ge=1, le=STATS_MAX_PAGE_SIZE), current_user: dict = Depends(require_admin)):
     """Endpoint to get the count of all endpoints."""
-    # Connect to the database
-    db = get_db_connection()
-    if not db:
-        raise HTTPException(status_code=500, detail="Database connection failed")
-    
-    result = get_endpoint_stats_from_db(db)
-    return {"endpoints": result}
+    if sort not in ENDPOINT_SORTS:
+        raise HTTPException(status_code=422, detail=f"sort must be one of: {', '.join(ENDPOINT_SORTS)}")
+
+    etag = await stats_view.etag("endpoints", sort, cursor, limit)
+    if not_modified(http_request, etag):
+        return Response(status_code=304, headers={"ETag": etag})
+
+    try:
+        result, next_cursor = await stats_view.endpoints_page(sort, cursor, limit)
+    except InvalidCursorError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    if not result and cursor is None:
+        raise HTTPException(status_code=404, detail="No endpoint stats found")
+
+    response.headers["ETag"] = etag
+    response.headers["Cache-Control"] = "private, no-cache"
+    return {"endpoints": result, "next_cursor": next_cursor}
 
 # Retrieve stats of api usages of all users
 @app.get("/api/v1/stats/apiUsage",
          response_model=ApiUsageListResponse,
          summary="Get API usage statistics for all users",
-         description="Retrieve statistics for API usage by all users, including their total API calls.",
+         description="Admin only. Retrieve statistics for API usage by all users, including their total API calls. "
+                     "Sorted by `sort` (calls, most first, so the first page is the top users; or user_id) and paginated: "
+                     "pass `next_cursor` back as `cursor` for the next page. Pages served from the in-memory top users carry an ETag; send If-None-Match to get 304 when unchanged."
         )
-async def usage_data():
+async def usage_data(http_request: Request, response: Response, sort: str = "calls", cursor: Optional[str] = None,
+                     limit: int = Query(STATS_PAGE_SIZE, ge=1, le=STATS_MAX_PAGE_SIZE), current_user: dict = Depends(require_admin)):
     """Endpoint to get the api usage of all users."""
-    # Connect to the database
-    db = get_db_connection()
-    if not db:
-        raise HTTPException(status_code=500, detail="Database connection failed")
-    
-    result = get_api_usage_data(db)
-    return {"users": result} 
+    if sort not in USER_SORTS:
+        raise HTTPException(status_code=422, detail=f"sort must be one of: {', '.join(USER_SORTS)}")
+
+    try:
+        result, next_cursor, source = await stats_view.users_page(sort, cursor, limit)
+    except InvalidCursorError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    # Only pages served wholly from the view have a version to tag; database pages can change at any time
+    if source == "view":
+        etag = await stats_view.etag("users", sort, cursor, limit)
+        if not_modified(http_request, etag):
+            return Response(status_code=304, headers={"ETag": etag})
+        response.headers["ETag"] = etag
+    response.headers["Cache-Control"] = "private, no-cache"
+    return {"users": result, "next_cursor": next_cursor}
 
 # Retrieve stats of api usage from a specific user given the user_id
 @app.get("/api/v1/stats/apiUsage/{user_id}",
@@ -313,14 +594,16 @@ async def usage_data():
         )
 async def usage_data_for_user(user_id: int):
     """Endpoint to get the API usage for a specific user."""
-    # Connect to the database
-    db = get_db_connection()
-    if not db:
-        raise HTTPException(status_code=500, detail="Database connection failed")
-
-    result = get_api_usage_data_for_user(db, user_id)
+    result = await get_api_usage_data_for_user(user_id)
     if not result:
         raise HTTPException(status_code=404, detail="User not found or no API usage data available")
+
+    # Add counts that haven't been flushed to the database yet
+    pending_total, pending_llm = usage_buffer.pending_user_counts(user_id)
+    if pending_total and "total_api_calls" in result:
+        result["total_api_calls"] += pending_total
+        result["llm_api_calls"] += pending_llm
+        result = usage_summary(result)
     return result
 
 # Updates the user's name 
@@ -328,51 +611,48 @@ async def usage_data_for_user(user_id: int):
          response_model=UpdateNameResponse,
          summary="Updates the user's name in the database",
          description="Allows the user to update their name. The new name should be provided in the request body.")
-async def update_name(new_name: str = Body(..., embed=True), current_user: dict = Depends(get_current_user)):
+async def update_name(http_request: Request, response: Response, new_name: str = Body(..., embed=True), current_user: dict = Depends(get_current_user)):
     """
     Updates the user's name in the database.
     """
     user_id = current_user["id"]
     
-    # Connect to the database
-    db = get_db_connection()
-    if not db:
-        raise HTTPException(status_code=500, detail="Database connection failed")
+    # Use the function from async_db.py to update the name
+    success = await update_user_name(user_id, new_name)
+    if not success:
+        raise HTTPException(status_code=500, detail="Failed to update name")
+
+    stats_view.update_user(user_id, first_name=new_name)
+
+    # The token carries the name, so swap it for one with the new name
+    revoke_access_token(http_request)
+    set_access_token_cookie(response, {**current_user, "first_name": new_name})
     
-    try:
-        # Use the function from db_connection.py to update the name
-        success = update_user_name(db, user_id, new_name)
-        if not success:
-            raise HTTPException(status_code=500, detail="Failed to update name")
-        
-        return {"message": "Name updated successfully"}
-    finally:
-        close_db_connection(db)
+    return {"message": "Name updated successfully"}
 
 # Deletes the user's account
 @app.delete("/api/v1/delete-account",
             response_model=DeleteAccountResponse,
             summary="Deletes the user's account from the database",
             description="Allows the user to permanently delete their account.")
-async def delete_account(response: Response, current_user: dict = Depends(get_current_user)):
+async def delete_account(http_request: Request, response: Response, current_user: dict = Depends(get_current_user)):
     # Get the user's ID from the current_user
     user_id = current_user["id"]
     
-    # Connect to the database
-    db = get_db_connection()
-    if not db:
-        raise HTTPException(status_code=500, detail="Database connection failed")
-    
     try:
         # Delete the user
-        success = delete_user(db, user_id)
+        success = await delete_user(user_id)
         if success:
-            # Delete the access token cookie
+            # Revoke every token issued to the user and delete the access token cookie
+            # (the caller's own token by itself too, in case it was issued this second)
+            revoke_subject(current_user["email"])
+            revoke_access_token(http_request)
+            stats_view.forget_user(user_id)
             response.delete_cookie("access_token")
             return {"message": "Account deleted successfully"}
         else:
             raise HTTPException(status_code=500, detail="Failed to delete account")
+    except HTTPException:
+        raise
     except Exception as e:
-        raise HTTPException(status_code=500, detail=str(e))
-    finally:
-        close_db_connection(db)
\ No newline at end of file
+        raise HTTPException(status_code=500, detail=str(e))
\ No newline at end of file
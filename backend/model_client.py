@@ -0,0 +1,162 @@
+# Talks to model_server.py workers over Unix sockets, so API workers don't load the model themselves.
+# Kept free of torch/transformers imports.
+import asyncio
+import itertools
+import json
+import os
+import time
+from dotenv import load_dotenv
+from utils import metrics
+
+load_dotenv()
+
+# One or more model server sockets, comma separated. When unset the model runs in the API process.
+MODEL_SERVER_SOCKET = os.getenv("MODEL_SERVER_SOCKET", "")
+MODEL_SERVER_TIMEOUT = float(os.getenv("MODEL_SERVER_TIMEOUT", "30"))
+MODEL_SERVER_CONNECT_TIMEOUT = float(os.getenv("MODEL_SERVER_CONNECT_TIMEOUT", "2"))
+# Seconds clients are told to wait when no model server can be reached
+MODEL_SERVER_RETRY_AFTER = int(os.getenv("MODEL_SERVER_RETRY_AFTER", "5"))
+
+# Messages can carry long contexts
+STREAM_LIMIT = 4 * 1024 * 1024
+
+
+class ModelServerError(Exception):
+    """Raised when the model server can't answer. `retry_after` is in seconds."""
+
+    def __init__(self, message, retry_after=MODEL_SERVER_RETRY_AFTER):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+class ModelServerBusyError(ModelServerError):
+    """Raised when the model server's queue is full."""
+
+
+class ModelServerUnavailableError(ModelServerError):
+    """Raised when the model server can't be reached or has no model loaded."""
+
+
+class ModelServerConnection:
+    """One multiplexed connection to a model server; replies are matched to requests by id."""
+
+    def __init__(self, path):
+        self.path = path
+        self._reader = None
+        self._writer = None
+        self._listener = None
+        self._lock = None
+        self._pending = {}
+        self._ids = itertools.count()
+
+    async def _connect(self):
+        try:
+            self._reader, self._writer = await asyncio.wait_for(
+                asyncio.open_unix_connection(self.path, limit=STREAM_LIMIT), MODEL_SERVER_CONNECT_TIMEOUT
+            )
+        except (OSError, asyncio.TimeoutError) as e:
+            metrics.increment("model_client_connect_errors_total")
+            raise ModelServerUnavailableError(f"Model server at {self.path} is unreachable: {e}")
+        self._listener = asyncio.create_task(self._listen(self._reader))
+
+    async def _listen(self, reader):
+        """Hands each reply to the request waiting for it."""
+        try:
+            while True:
+                line = await reader.readline()
+                if not line:
+                    break
+                message = json.loads(line)
+                future = self._pending.pop(message.get("id"), None)
+                if future is not None and not future.done():
+                    future.set_result(message)
+        except (OSError, ValueError):
+            pass
+        finally:
+            # The connection is gone; fail whoever is still waiting and reconnect next time
+            self._writer = None
+            pending, self._pending = self._pending, {}
+            for future in pending.values():
+                if not future.done():
+                    future.set_exception(ModelServerUnavailableError(f"Lost connection to model server at {self.path}"))
+
+    async def call(self, message, timeout=MODEL_SERVER_TIMEOUT):
+        """Sends a message and waits for its reply."""
+        if self._lock is None:
+            self._lock = asyncio.Lock()
+
+        request_id = next(self._ids)
+        future = asyncio.get_running_loop().create_future()
+
+        async with self._lock:
+            if self._writer is None:
+                await self._connect()
+            self._pending[request_id] = future
+            try:
+                self._writer.write(json.dumps(dict(message, id=request_id)).encode() + b"\n")
+                await self._writer.drain()
+            except OSError as e:
+                self._pending.pop(request_id, None)
+                raise ModelServerUnavailableError(f"Model server at {self.path} is unreachable: {e}")
+
+        try:
+            return await asyncio.wait_for(future, timeout)
+        except asyncio.TimeoutError:
+            metrics.increment("model_client_timeouts_total")
+            raise ModelServerUnavailableError("Model server timed out")
+        finally:
+            self._pending.pop(request_id, None)
+
+    async def close(self):
+        if self._writer is not None:
+            self._writer.close()
+        if self._listener is not None:
+            self._listener.cancel()
+
+
+class ModelServerClient:
+    """Spreads requests over the configured model servers in turn."""
+
+    def __init__(self, paths):
+        self.connections = [ModelServerConnection(path) for path in paths]
+        self._next = itertools.cycle(self.connections)
+
+    async def _call(self, message, timeout=MODEL_SERVER_TIMEOUT):
+        reply = await next(self._next).call(message, timeout)
+        error = reply.get("error")
+        if error == "busy":
+            metrics.increment("model_client_busy_total")
+            raise ModelServerBusyError("Model server queue is full", reply.get("retry_after", 1))
+        if error == "not_ready":
+            raise ModelServerUnavailableError(reply.get("detail", "Model is not ready"))
+        if error:
+            raise ModelServerError(reply.get("detail", error))
+        return reply["result"]
+
+    async def answer(self, question, context):
+        """Answers one question on a model server."""
+        started = time.perf_counter()
+        result = await self._call({"op": "answer", "question": question, "context": context})
+        metrics.observe("model_client_latency_ms", (time.perf_counter() - started) * 1000)
+        return result
+
+    async def status(self):
+        """Returns the model status of the next model server."""
+        return await self._call({"op": "status"})
+
+    async def reload(self, model_id=None):
+        """Loads a model on every model server and returns the last status."""
+        status = None
+        for connection in self.connections:
+            reply = await connection.call({"op": "reload", "model_id": model_id}, timeout=None)
+            if reply.get("error"):
+                raise ModelServerError(reply.get("detail", reply["error"]))
+            status = reply["result"]
+        return status
+
+    async def close(self):
+        for connection in self.connections:
+            await connection.close()
+
+
+model_client = ModelServerClient([path.strip() for path in MODEL_SERVER_SOCKET.split(",") if path.strip()]) if MODEL_SERVER_SOCKET else None
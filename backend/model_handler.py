@@ -1,50 +1,111 @@
-# Use a pipeline as a high-level helper
-from transformers import pipeline
-import torch
+import time
 from dotenv import load_dotenv
 from location_finder import location_finder
+from recommenders import recommend
+from utils.response_cache import request_fingerprint, get_or_compute, get_cached, store
 
 load_dotenv()
 
-def llm_run(latitude, longitude, height, steps, location_type):
+async def llm_run(latitude, longitude, height, steps, location_type, strategy=None):
     """
-    Runs Places API and uses HuggingFace LLM to recommend one of the options.
+    Returns the recommendation for a request, from the response cache when an equivalent
+    request was answered recently. Identical concurrent requests share one Places search and inference.
     """
+    key = request_fingerprint(latitude, longitude, height, steps, location_type, strategy)
+    response, status = await get_or_compute(
+        key, lambda: _llm_run(latitude, longitude, height, steps, location_type, strategy)
+    )
+    response["metadata"]["cache"] = status
+    return response
 
-    # Calls function to retrieve array of places in a range
-    api_results = location_finder(latitude, longitude, height, steps, location_type)
+async def find_places(latitude, longitude, height, steps, location_type, metadata):
+    """Calls function to retrieve array of places in a range."""
+    api_results = await location_finder(latitude, longitude, height, steps, location_type, metadata)
 
     if not api_results:
         print("No results available from API.")
-        return {"api_response":[], "llm_recommendation":""}
-
-    # LLM model
-    model_id = "deepset/roberta-base-squad2"
+        return []
+    return api_results
 
-    # Defines pipeline for LLM
-    pipe = pipeline(
-        "question-answering",
-        model=model_id,
-        tokenizer=model_id,
-    )
+async def recommend_place(api_results, height, steps, location_type, strategy, metadata):
+    """
+    Recommends one of the places and returns (recommendation, strategy used).
+    The HuggingFace LLM is only asked when `strategy` is "model" or the ranking ends in a tie.
+    """
+    if not api_results:
+        return "", None
 
-    # Question and context for LLM to process
-    question = f'Which location is the best option? The highest-rated {location_type} among the following options should be selected.'
+    # Several types are asked about together, e.g. "park or cafe"
+    if not isinstance(location_type, str):
+        location_type = " or ".join(dict.fromkeys(location_type))
 
-    context = f"There are several {location_type} including:\n"
+    # Distance the step goal covers, with the same stride formula as location_finder
+    target_distance = height / 100 * 0.4 * steps
 
-    for place in api_results:
-        context += f"- {place['name']} with a rating of {place['rating']} and is {place['distance']} metres away. \n"
+    recommendation, used_strategy, tied = await recommend(api_results, location_type, target_distance, strategy)
+    metadata["recommendation"] = {"requested_strategy": strategy, "tie": tied}
+    return recommendation, used_strategy
 
-    context += f"The best {location_type} to visit has a large rating."
+async def _llm_run(latitude, longitude, height, steps, location_type, strategy=None):
+    """
+    Runs Places API and recommends one of the options.
+    `location_type` can be one place type or a list of them.
+    """
+    metadata = {}
 
-    # Send response to LLM for processing
-    llm_response = pipe(question=question, context=context)
+    api_results = await find_places(latitude, longitude, height, steps, location_type, metadata)
+    recommendation, used_strategy = await recommend_place(api_results, height, steps, location_type, strategy, metadata)
 
     # Package API response as json
     response = {
         "api_response" : api_results,
-        "llm_recommendation" : llm_response["answer"]
+        "llm_recommendation" : recommendation,
+        "recommendation_strategy" : used_strategy,
+        "metadata" : metadata
     }
 
     return response
+
+async def llm_stream(latitude, longitude, height, steps, location_type, strategy=None):
+    """
+    Yields the response in parts as soon as each is ready: the places, then the recommendation,
+    then the metadata with timings. Together they hold the same fields as llm_run's response.
+    """
+    started = time.perf_counter()
+
+    def elapsed_ms():
+        return round((time.perf_counter() - started) * 1000, 1)
+
+    key = request_fingerprint(latitude, longitude, height, steps, location_type, strategy)
+    response = get_cached(key)
+    if response is not None:
+        yield {"event": "places", "api_response": response["api_response"], "elapsed_ms": elapsed_ms()}
+        yield {"event": "recommendation", "llm_recommendation": response["llm_recommendation"],
+               "recommendation_strategy": response["recommendation_strategy"], "elapsed_ms": elapsed_ms()}
+        metadata = dict(response["metadata"], cache="hit", timing={"total_ms": elapsed_ms()})
+        yield {"event": "metadata", "metadata": metadata}
+        return
+
+    metadata = {"cache": "miss"}
+    api_results = await find_places(latitude, longitude, height, steps, location_type, metadata)
+    places_ms = elapsed_ms()
+    yield {"event": "places", "api_response": api_results, "elapsed_ms": places_ms}
+
+    recommendation, used_strategy = await recommend_place(api_results, height, steps, location_type, strategy, metadata)
+    recommendation_ms = elapsed_ms()
+    yield {"event": "recommendation", "llm_recommendation": recommendation,
+           "recommendation_strategy": used_strategy, "elapsed_ms": recommendation_ms}
+
+    store(key, {
+        "api_response": api_results,
+        "llm_recommendation": recommendation,
+        "recommendation_strategy": used_strategy,
+        "metadata": {k: v for k, v in metadata.items() if k != "cache"},
+    })
+
+    metadata["timing"] = {
+        "places_ms": places_ms,
+        "recommendation_ms": round(recommendation_ms - places_ms, 1),
+        "total_ms": elapsed_ms(),
+    }
+    yield {"event": "metadata", "metadata": metadata}
@@ -0,0 +1,173 @@
+# Keeps the question-answering pipeline loaded so requests can share it
+import os
+import threading
+import time
+from datetime import datetime
+from dotenv import load_dotenv
+from inference_backends import build_pipeline, INFERENCE_BACKEND
+from utils import startup_profile
+
+load_dotenv()
+
+DEFAULT_MODEL_ID = os.getenv("QA_MODEL_ID", "deepset/roberta-base-squad2")
+# eager (load before serving), background (load after startup while serving) or lazy (load on first use)
+MODEL_LOAD_MODE = os.getenv("MODEL_LOAD_MODE", "eager")
+
+# Small prompt used to run one forward pass before a model starts serving
+WARMUP_QUESTION = "Which park is the best option?"
+WARMUP_CONTEXT = "There are several parks including:\n- Example Park with a rating of 4.5 and is 100 metres away. \n"
+
+_state_lock = threading.Lock()
+# Re-entrant so a lazy first load can hold it while calling load_model
+_swap_lock = threading.RLock()
+
+_pipeline = None
+_model_id = None
+_state = "not_loaded"   # not_loaded, loading, ready or failed
+_error = None
+_loaded_at = None
+
+
+class ModelNotReadyError(Exception):
+    """Raised when a request needs the model before it has been loaded."""
+
+
+def _build_pipeline(model_id):
+    """Builds the question-answering pipeline for a model with the configured backend."""
+    return build_pipeline(model_id, INFERENCE_BACKEND)
+
+
+def warm_up(pipe):
+    """Runs one inference so the first real request doesn't pay for lazy initialisation."""
+    pipe(question=WARMUP_QUESTION, context=WARMUP_CONTEXT)
+
+
+def load_model(model_id=None):
+    """
+    Loads and warms up a model, then makes it the active one.
+    While a new model is loading, the previous one keeps serving requests.
+    """
+    global _pipeline, _model_id, _state, _error, _loaded_at
+
+    model_id = model_id or DEFAULT_MODEL_ID
+
+    # Only one load or swap runs at a time
+    with _swap_lock:
+        with _state_lock:
+            if _pipeline is None:
+                _state = "loading"
+
+        # Only the first load is part of the startup profile
+        first_load = _pipeline is None
+        try:
+            print(f"Loading model {model_id} ({INFERENCE_BACKEND} backend)")
+            if first_load:
+                with startup_profile.phase("import transformers"):
+                    import transformers  # noqa: F401
+            started = time.perf_counter()
+            pipe = _build_pipeline(model_id)
+            built = time.perf_counter()
+            warm_up(pipe)
+            if first_load:
+                startup_profile.record(f"build {INFERENCE_BACKEND} pipeline", started, built)
+                startup_profile.record("warm up model", built, time.perf_counter())
+        except Exception as e:
+            print(f"Error loading model {model_id}: {e}")
+            with _state_lock:
+                _error = str(e)
+                if _pipeline is None:
+                    _state = "failed"
+            raise
+
+        with _state_lock:
+            _pipeline = pipe
+            _model_id = model_id
+            _state = "ready"
+            _error = None
+            _loaded_at = datetime.utcnow()
+
+        print(f"Model {model_id} is ready")
+        return pipe
+
+
+def load_model_in_background(model_id=None):
+    """Starts loading a model on a daemon thread so the app can serve other endpoints meanwhile."""
+    global _state
+
+    def load():
+        try:
+            load_model(model_id)
+        except Exception as e:
+            print(f"The model failed to load: '{e}'")
+
+    with _state_lock:
+        if _pipeline is None:
+            _state = "loading"
+    thread = threading.Thread(target=load, name="model-loader", daemon=True)
+    thread.start()
+    return thread
+
+
+def swap_model(model_id):
+    """Hot-swaps the active model without restarting the process."""
+    return load_model(model_id)
+
+
+def ensure_model(model_id):
+    """
+    Makes sure the given model is the active one in this process, loading it if needed.
+    Used by inference worker processes, which don't share the API process's registry.
+    """
+    with _state_lock:
+        if _pipeline is not None and _model_id == model_id:
+            return _pipeline
+    return load_model(model_id)
+
+
+def get_active_model_id():
+    """Returns the id of the active model, if any."""
+    with _state_lock:
+        return _model_id
+
+
+def get_pipeline():
+    """
+    Returns the active pipeline.
+    With MODEL_LOAD_MODE=lazy the first call loads the model, so it should run off the event loop.
+    """
+    with _state_lock:
+        if _pipeline is not None:
+            return _pipeline
+        state = _state
+
+    if MODEL_LOAD_MODE == "lazy" and state in ("not_loaded", "loading"):
+        # Concurrent callers wait on the same load
+        with _swap_lock:
+            with _state_lock:
+                if _pipeline is not None:
+                    return _pipeline
+            try:
+                return load_model()
+            except Exception as e:
+                # Callers treat this like any other model that isn't ready
+                raise ModelNotReadyError(f"Model failed to load: {e}") from e
+
+    raise ModelNotReadyError(f"Model is not ready (state: {state})")
+
+
+def is_ready():
+    """Checks if a model is loaded and able to serve requests."""
+    with _state_lock:
+        return _state == "ready"
+
+
+def model_status():
+    """Returns the readiness state of the model registry."""
+    with _state_lock:
+        return {
+            "state": _state,
+            "model_id": _model_id,
+            "backend": INFERENCE_BACKEND,
+            "loaded_at": _loaded_at.isoformat() if _loaded_at else None,
+            "error": _error,
+        }
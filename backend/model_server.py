@@ -0,0 +1,114 @@
+"""
+Model server: owns the QA model and answers questions for API workers over a Unix socket.
+
+    cd backend
+    python -m model_server /tmp/steps-model.sock
+
+Then start the API with MODEL_SERVER_SOCKET=/tmp/steps-model.sock. Run several servers on
+different sockets and list them all (comma separated) to spread inference over more processes.
+
+Each line on the socket is one JSON message:
+    {"id": 1, "op": "answer", "question": "...", "context": "..."}
+    {"id": 2, "op": "status"}
+    {"id": 3, "op": "reload", "model_id": "..."}
+and each reply is {"id": ..., "result": ...} or {"id": ..., "error": "busy" | "not_ready" | ..., "detail": ...}.
+Requests are batched like in the API process. Once MODEL_SERVER_MAX_QUEUE answers are pending,
+new ones are turned away with "busy" so the API can answer 429 instead of queueing without bound.
+"""
+import asyncio
+import json
+import os
+import sys
+from dotenv import load_dotenv
+from inference_batcher import InferenceBatcher
+from model_registry import load_model, swap_model, model_status, is_ready
+from utils import metrics
+
+load_dotenv()
+
+MODEL_SERVER_MAX_QUEUE = int(os.getenv("MODEL_SERVER_MAX_QUEUE", "64"))
+# Seconds a busy server asks clients to wait
+MODEL_SERVER_BUSY_RETRY_AFTER = int(os.getenv("MODEL_SERVER_BUSY_RETRY_AFTER", "1"))
+
+
+class ModelServer:
+    def __init__(self, max_queue=MODEL_SERVER_MAX_QUEUE):
+        self.max_queue = max_queue
+        self.pending = 0
+        self.batcher = InferenceBatcher()
+        metrics.register_gauge("model_server_pending", lambda: self.pending)
+
+    async def _answer(self, message):
+        if self.pending >= self.max_queue:
+            metrics.increment("model_server_rejected_total")
+            return {"error": "busy", "retry_after": MODEL_SERVER_BUSY_RETRY_AFTER}
+        if not is_ready():
+            return {"error": "not_ready", "detail": f"Model is not ready (state: {model_status()['state']})"}
+
+        self.pending += 1
+        try:
+            return {"result": await self.batcher.submit(message["question"], message["context"])}
+        finally:
+            self.pending -= 1
+
+    async def _dispatch(self, message):
+        op = message.get("op")
+        try:
+            if op == "answer":
+                return await self._answer(message)
+            if op == "status":
+                return {"result": dict(model_status(), pending=self.pending)}
+            if op == "reload":
+                # Loading takes seconds, so keep it off the event loop
+                await asyncio.to_thread(swap_model, message.get("model_id"))
+                return {"result": model_status()}
+            return {"error": "bad_request", "detail": f"Unknown op {op!r}"}
+        except Exception as e:
+            return {"error": "failed", "detail": str(e)}
+
+    async def _reply(self, message, writer, write_lock):
+        reply = await self._dispatch(message)
+        reply["id"] = message.get("id")
+        async with write_lock:
+            # Scores can come back as numpy floats
+            writer.write(json.dumps(reply, default=float).encode() + b"\n")
+            await writer.drain()
+
+    async def handle_connection(self, reader, writer):
+        """Serves one API worker's connection; its requests are answered as they finish."""
+        write_lock = asyncio.Lock()
+        tasks = set()
+        try:
+            while True:
+                line = await reader.readline()
+                if not line:
+                    break
+                task = asyncio.create_task(self._reply(json.loads(line), writer, write_lock))
+                tasks.add(task)
+                task.add_done_callback(tasks.discard)
+        except (OSError, ValueError):
+            pass
+        finally:
+            for task in tasks:
+                task.cancel()
+            writer.close()
+
+    async def serve(self, path):
+        # Remove a socket left behind by a previous run
+        if os.path.exists(path):
+            os.unlink(path)
+
+        await asyncio.to_thread(load_model)
+
+        server = await asyncio.start_unix_server(self.handle_connection, path, limit=4 * 1024 * 1024)
+        print(f"Model server listening on {path}")
+        async with server:
+            await server.serve_forever()
+
+
+if __name__ == "__main__":
+    path = sys.argv[1] if len(sys.argv) > 1 else os.getenv("MODEL_SERVER_SOCKET", "/tmp/steps-model.sock").split(",")[0]
+    try:
+        asyncio.run(ModelServer().serve(path))
+    except KeyboardInterrupt:
+        pass
@@ -0,0 +1,115 @@
+# Picks the recommended place, by ranking alone or with the QA model
+import math
+import os
+from dotenv import load_dotenv
+from inference_batcher import answer_question
+from utils import metrics
+
+load_dotenv()
+
+# Default strategy for this deployment: rating, distance, weighted or model
+RECOMMENDER_STRATEGY = os.getenv("RECOMMENDER_STRATEGY", "rating")
+# What to do when the top scores tie: model (ask the QA model to pick among them) or first
+RECOMMENDER_TIE_BREAK = os.getenv("RECOMMENDER_TIE_BREAK", "model")
+RECOMMENDER_RATING_WEIGHT = float(os.getenv("RECOMMENDER_RATING_WEIGHT", "0.7"))
+RECOMMENDER_DISTANCE_WEIGHT = float(os.getenv("RECOMMENDER_DISTANCE_WEIGHT", "0.3"))
+
+
+def rating_scores(places, target_distance):
+    """Scores places by rating."""
+    return [place["rating"] for place in places]
+
+
+def distance_scores(places, target_distance):
+    """Scores places by how close their distance is to the step goal."""
+    return [-abs(place["distance"] - target_distance) for place in places]
+
+
+def weighted_scores(places, target_distance):
+    """Blends the rating (out of 5) with closeness to the step goal."""
+    scores = []
+    for place in places:
+        closeness = 1 - min(abs(place["distance"] - target_distance) / max(target_distance, 1), 1)
+        scores.append(RECOMMENDER_RATING_WEIGHT * place["rating"] / 5 + RECOMMENDER_DISTANCE_WEIGHT * closeness)
+    return scores
+
+
+# Deterministic strategies, name -> function(places, target_distance) returning one score per place (higher is better)
+STRATEGIES = {
+    "rating": rating_scores,
+    "distance": distance_scores,
+    "weighted": weighted_scores,
+}
+
+STRATEGY_NAMES = list(STRATEGIES) + ["model"]
+
+# A misspelt default would otherwise fail every request, so refuse to start with it
+if RECOMMENDER_STRATEGY not in STRATEGY_NAMES:
+    raise ValueError(f"Unknown RECOMMENDER_STRATEGY {RECOMMENDER_STRATEGY!r}, expected one of: {', '.join(STRATEGY_NAMES)}")
+
+
+def register_strategy(name, score_function):
+    """Adds a deterministic ranking strategy."""
+    STRATEGIES[name] = score_function
+    if name not in STRATEGY_NAMES:
+        STRATEGY_NAMES.append(name)
+
+
+def build_prompt(places, location_type):
+    """
+    Builds the question and context the QA model answers.
+    The context is canonical: the same places give the same string whatever order they came in,
+    so their encoding is cached once.
+    """
+    question = f'Which location is the best option? The highest-rated {location_type} among the following options should be selected.'
+
+    context = f"There are several {location_type} including:\n"
+
+    for place in sorted(places, key=lambda place: (-float(place["rating"]), place["name"], float(place["distance"]))):
+        context += f"- {place['name']} with a rating of {float(place['rating'])} and is {round(float(place['distance']), 2)} metres away. \n"
+
+    context += f"The best {location_type} to visit has a large rating."
+
+    return question, context
+
+
+async def model_recommendation(places, location_type):
+    """Asks the QA model to pick one of the places."""
+    question, context = build_prompt(places, location_type)
+
+    # Send response to LLM for processing, batched with other concurrent requests
+    llm_response = await answer_question(question, context)
+    return llm_response["answer"]
+
+
+async def recommend(places, location_type, target_distance, strategy=None):
+    """
+    Recommends one of the places and returns (recommendation, strategy used, tied).
+    The model only runs when the strategy is "model", or to break a tie between top scores.
+    Raises ValueError for a strategy that isn't registered.
+    """
+    strategy = strategy or RECOMMENDER_STRATEGY
+    if strategy not in STRATEGY_NAMES:
+        raise ValueError(f"Unknown strategy {strategy!r}, expected one of: {', '.join(STRATEGY_NAMES)}")
+
+    if strategy == "model":
+        metrics.increment("recommendations_model_total")
+        return await model_recommendation(places, location_type), "model", False
+
+    scores = STRATEGIES[strategy](places, target_distance)
+    best = max(scores)
+    winners = [place for place, score in zip(places, scores) if math.isclose(score, best, rel_tol=1e-9, abs_tol=1e-9)]
+    tied = len(winners) > 1
+
+    if tied and RECOMMENDER_TIE_BREAK == "model":
+        try:
+            recommendation = await model_recommendation(winners, location_type)
+            metrics.increment("recommendations_model_tie_break_total")
+            return recommendation, "model", True
+        except Exception as e:
+            # The ranking alone can answer, so any inference failure falls back to its order
+            print(f"Model tie-break failed, using the ranking order: {e}")
+            metrics.increment("recommendations_tie_break_fallback_total")
+
+    metrics.increment(f"recommendations_{strategy}_total")
+    return winners[0]["name"], strategy, tied
@@ -0,0 +1,95 @@
+"""
+Retries and the circuit breaker in utils.http_client, against the local stub server.
+
+    cd backend
+    python -m pytest tests
+"""
+import time
+import pytest
+from utils import http_client
+from utils.http_client import UpstreamClient, CircuitBreaker, CircuitOpenError
+from utils.stub_server import StubHandler, start_stub_server
+
+
+@pytest.fixture(scope="module")
+def stub_url():
+    server, base_url = start_stub_server()
+    yield base_url
+    server.shutdown()
+    server.server_close()
+
+
+@pytest.fixture(autouse=True)
+def reset_stub(monkeypatch):
+    StubHandler.http_statuses = []
+    StubHandler.places_statuses = []
+    StubHandler.requests_seen = []
+    # No waiting between retries
+    monkeypatch.setattr(http_client, "HTTP_BACKOFF_BASE", 0)
+
+
+def make_client(max_retries=2, failure_threshold=3, reset_timeout=0.2):
+    client = UpstreamClient("test", max_retries=max_retries)
+    client.breaker = CircuitBreaker("test", failure_threshold=failure_threshold, reset_timeout=reset_timeout)
+    return client
+
+
+def test_retries_5xx_until_success(stub_url):
+    client = make_client(max_retries=2)
+    StubHandler.http_statuses = [503, 500]
+
+    response = client.post(f"{stub_url}/v3/messages")
+
+    assert response.status_code == 200
+    assert len(StubHandler.requests_seen) == 3
+    assert client.breaker.state == "closed"
+
+
+def test_returns_last_response_when_retries_run_out(stub_url):
+    client = make_client(max_retries=1, failure_threshold=10)
+    StubHandler.http_statuses = [502, 502, 502]
+
+    response = client.post(f"{stub_url}/v3/messages")
+
+    assert response.status_code == 502
+    assert len(StubHandler.requests_seen) == 2
+
+
+def test_breaker_opens_after_consecutive_failures(stub_url):
+    client = make_client(max_retries=0, failure_threshold=3, reset_timeout=60)
+    StubHandler.http_statuses = [503] * 3
+
+    for _ in range(3):
+        assert client.post(f"{stub_url}/v3/messages").status_code == 503
+    assert client.breaker.state == "open"
+
+    with pytest.raises(CircuitOpenError):
+        client.post(f"{stub_url}/v3/messages")
+    # Short-circuited without reaching the upstream
+    assert len(StubHandler.requests_seen) == 3
+
+
+def test_breaker_recovers_after_half_open_probe(stub_url):
+    client = make_client(max_retries=0, failure_threshold=2, reset_timeout=0.2)
+    StubHandler.http_statuses = [503, 503]
+    for _ in range(2):
+        client.post(f"{stub_url}/v3/messages")
+    assert client.breaker.state == "open"
+
+    time.sleep(0.25)
+    assert client.breaker.state == "half_open"
+
+    response = client.post(f"{stub_url}/v3/messages")
+    assert response.status_code == 200
+    assert client.breaker.state == "closed"
+
+
+def test_failed_half_open_probe_reopens_breaker(stub_url):
+    client = make_client(max_retries=0, failure_threshold=2, reset_timeout=0.2)
+    StubHandler.http_statuses = [503, 503, 503]
+    for _ in range(2):
+        client.post(f"{stub_url}/v3/messages")
+
+    time.sleep(0.25)
+    assert client.post(f"{stub_url}/v3/messages").status_code == 503
+    assert client.breaker.state == "open"
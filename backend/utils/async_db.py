@@ -0,0 +1,672 @@
+import asyncio
+import os
+from contextlib import asynccontextmanager
+from dotenv import load_dotenv
+from utils import db_connection
+from utils.db_pool import DatabaseConnectionError
+from utils.user_cache import invalidate_user
+
+# Load environment variables from .env file
+load_dotenv()
+
+# mysql (pooled mysql-connector on the DB thread pool), aiomysql or sqlite
+DB_BACKEND = os.getenv("DB_BACKEND", "mysql")
+SQLITE_PATH = os.getenv("SQLITE_PATH", "ai_steps.db")
+
+FREE_LLM_API_CALLS = 20
+
+
+def usage_summary(row):
+    """Adds the free call allowance and warning to a user's `api_usage` row."""
+    if not row:
+        # If no results are found, return a default structure
+        return {
+            "llm_api_calls": 0,
+            "free_calls_remaining": FREE_LLM_API_CALLS,
+            "warning": None
+        }
+
+    result = dict(row)
+    free_calls_remaining = max(FREE_LLM_API_CALLS - result.get("llm_api_calls", 0), 0)  # Default to 0 if key is missing
+    result["warning"] = (
+        f"You have exceeded your {FREE_LLM_API_CALLS} free API calls. Additional requests may incur charges."
+        if free_calls_remaining == 0
+        else None
+    )
+    result["free_calls_remaining"] = free_calls_remaining
+    return result
+
+
+class Database:
+    """Async data-access interface used by the API handlers."""
+
+    async def connect(self):
+        """Opens the backend's connections."""
+
+    async def close(self):
+        """Closes the backend's connections."""
+
+    async def create_tables(self):
+        raise NotImplementedError
+
+    async def get_user_by_email(self, email):
+        raise NotImplementedError
+
+    async def insert_user(self, first_name, email, password_hash):
+        raise NotImplementedError
+
+    async def update_user_password(self, email, hashed_password):
+        raise NotImplementedError
+
+    async def update_user_name(self, user_id, new_name):
+        raise NotImplementedError
+
+    async def delete_user(self, user_id):
+        raise NotImplementedError
+
+    async def get_endpoint_stats(self):
+        raise NotImplementedError
+
+    async def initialize_usage_record(self, user_id):
+        raise NotImplementedError
+
+    async def get_api_usage_data(self):
+        raise NotImplementedError
+
+    async def get_api_usage_page(self, sort, after, limit):
+        raise NotImplementedError
+
+    async def get_api_usage_data_for_user(self, user_id):
+        raise NotImplementedError
+
+    async def increment_endpoint_count(self, method, path):
+        raise NotImplementedError
+
+    async def increment_total_api_calls(self, user_id):
+        raise NotImplementedError
+
+    async def increment_llm_api_calls(self, user_id):
+        raise NotImplementedError
+
+    async def bulk_increment_endpoint_counts(self, rows):
+        """Adds (method, endpoint, count) rows to `endpoints` in one statement. Raises on failure."""
+        raise NotImplementedError
+
+    async def bulk_increment_api_usage(self, rows):
+        """Adds (user_id, total_api_calls, llm_api_calls) rows to `api_usage` in one statement. Raises on failure."""
+        raise NotImplementedError
+
+
+class PooledMySQLDatabase(Database):
+    """Runs the mysql-connector functions in db_connection on the DB thread pool with pooled connections."""
+
+    async def close(self):
+        db_connection.connection_pool.close_idle()
+
+    async def create_tables(self):
+        def create(connection):
+            db_connection.create_user_table(connection)
+            db_connection.create_endpoint_table(connection)
+            db_connection.create_api_usage_table(connection)
+            db_connection.add_api_usage_index(connection)
+        await db_connection.run_query(create)
+
+    async def get_user_by_email(self, email):
+        return await db_connection.run_query(db_connection.get_user_by_email, email)
+
+    async def insert_user(self, first_name, email, password_hash):
+        await db_connection.run_query(db_connection.insert_user, first_name, email, password_hash)
+
+    async def update_user_password(self, email, hashed_password):
+        await db_connection.run_query(db_connection.update_user_password, email, hashed_password)
+
+    async def update_user_name(self, user_id, new_name):
+        return await db_connection.run_query(db_connection.update_user_name, user_id, new_name)
+
+    async def delete_user(self, user_id):
+        return await db_connection.run_query(db_connection.delete_user, user_id)
+
+    async def get_endpoint_stats(self):
+        return await db_connection.run_query(db_connection.get_endpoint_stats_from_db)
+
+    async def initialize_usage_record(self, user_id):
+        await db_connection.run_query(db_connection.initialize_usage_record, user_id)
+
+    async def get_api_usage_data(self):
+        return await db_connection.run_query(db_connection.get_api_usage_data)
+
+    async def get_api_usage_page(self, sort, after, limit):
+        return await db_connection.run_query(db_connection.get_api_usage_page, sort, after, limit)
+
+    async def get_api_usage_data_for_user(self, user_id):
+        return await db_connection.run_query(db_connection.get_api_usage_data_for_user, user_id)
+
+    async def increment_endpoint_count(self, method, path):
+        await db_connection.run_query(db_connection.increment_endpoint_count, method, path)
+
+    async def increment_total_api_calls(self, user_id):
+        await db_connection.run_query(db_connection.increment_total_api_calls, user_id)
+
+    async def increment_llm_api_calls(self, user_id):
+        await db_connection.run_query(db_connection.increment_llm_api_calls, user_id)
+
+    async def bulk_increment_endpoint_counts(self, rows):
+        await db_connection.run_query(db_connection.bulk_increment_endpoint_counts, rows)
+
+    async def bulk_increment_api_usage(self, rows):
+        await db_connection.run_query(db_connection.bulk_increment_api_usage, rows)
+
+
+class SQLDatabase(Database):
+    """
+    Shared query logic for the natively async drivers.
+    Queries use %s placeholders, subclasses implement the driver calls and dialect-specific SQL.
+    """
+
+    create_table_queries = []
+    endpoint_upsert_query = ""
+    api_usage_upsert_query = ""
+    # Templates for the multi-row UPSERTs, {values} is replaced by the row placeholders
+    endpoint_bulk_upsert_query = ""
+    api_usage_bulk_upsert_query = ""
+
+    async def _fetchone(self, query, params=()):
+        raise NotImplementedError
+
+    async def _fetchall(self, query, params=()):
+        raise NotImplementedError
+
+    async def _execute(self, query, params=()):
+        """Runs a write in its own transaction and returns the number of affected rows."""
+        raise NotImplementedError
+
+    async def create_tables(self):
+        for query in self.create_table_queries:
+            try:
+                await self._execute(query)
+            except DatabaseConnectionError:
+                raise
+            except Exception as e:
+                print("Error creating table", e)
+        print("Tables created")
+
+    async def get_user_by_email(self, email):
+        try:
+            return await self._fetchone("SELECT * FROM users WHERE email = %s", (email,))
+        except DatabaseConnectionError:
+            raise
+        except Exception as e:
+            print("Error retrieving user by email:", e)
+            return None
+
+    async def insert_user(self, first_name, email, password_hash):
+        try:
+            await self._execute(
+                "INSERT INTO users (first_name, email, password_hash) VALUES (%s, %s, %s)",
+                (first_name, email, password_hash),
+            )
+            print("User inserted successfully.")
+        except DatabaseConnectionError:
+            raise
+        except Exception as e:
+            print("Error inserting user", e)
+
+    async def update_user_password(self, email, hashed_password):
+        try:
+            await self._execute("UPDATE users SET password_hash = %s WHERE email = %s", (hashed_password, email))
+        except DatabaseConnectionError:
+            raise
+        except Exception as e:
+            print("Error updating user password:", e)
+
+    async def update_user_name(self, user_id, new_name):
+        try:
+            await self._execute("UPDATE users SET first_name = %s WHERE id = %s", (new_name, user_id))
+            return True
+        except DatabaseConnectionError:
+            raise
+        except Exception as e:
+            print(f"Error updating name for user_id {user_id}: {e}")
+            return False
+
+    async def delete_user(self, user_id):
+        try:
+            await self._execute("DELETE FROM users WHERE id = %s", (user_id,))
+            return True
+        except DatabaseConnectionError:
+            raise
+        except Exception as e:
+            print("Error deleting user:", e)
+            return False
+
+    async def get_endpoint_stats(self):
+        return await self._fetchall("SELECT method, endpoint, count FROM endpoints")
+
+    async def initialize_usage_record(self, user_id):
+        try:
+            await self._execute("INSERT INTO api_usage (user_id) VALUES (%s)", (user_id,))
+            print(f"Initialized usage record for user_id {user_id}")
+        except DatabaseConnectionError:
+            raise
+        except Exception as e:
+            print("Error initializing usage record:", e)
+
+    async def get_api_usage_data(self):
+        try:
+            return await self._fetchall(
+                """
+                SELECT api_usage.user_id, users.first_name, users.email, api_usage.total_api_calls
+                FROM api_usage
+                JOIN users ON api_usage.user_id = users.id
+                """
+            )
+        except DatabaseConnectionError:
+            raise
+        except Exception as e:
+            print("Error fetching API usage data:", e)
+            return []
+
+    async def get_api_usage_page(self, sort, after, limit):
+        try:
+            return await self._fetchall(*db_connection.api_usage_page_query(sort, after, limit))
+        except DatabaseConnectionError:
+            raise
+        except Exception as e:
+            print("Error fetching API usage page:", e)
+            return []
+
+    async def get_api_usage_data_for_user(self, user_id):
+        try:
+            row = await self._fetchone("SELECT * FROM api_usage WHERE user_id = %s", (user_id,))
+            return usage_summary(row)
+        except DatabaseConnectionError:
+            raise
+        except Exception as e:
+            print("Error fetching API usage data for user:", e)
+            return dict(usage_summary(None), warning="Error fetching API usage data. Please try again later.")
+
+    async def increment_endpoint_count(self, method, path):
+        try:
+            await self._execute(self.endpoint_upsert_query, (method, path))
+        except DatabaseConnectionError:
+            raise
+        except Exception as e:
+            print(f"Error logging request to database: {e}")
+
+    async def increment_total_api_calls(self, user_id):
+        try:
+            await self._execute(self.api_usage_upsert_query, (user_id,))
+        except DatabaseConnectionError:
+            raise
+        except Exception as e:
+            print(f"Error updating `api_usage` table: {e}")
+
+    async def increment_llm_api_calls(self, user_id):
+        try:
+            await self._execute("UPDATE api_usage SET llm_api_calls = llm_api_calls + 1 WHERE user_id = %s", (user_id,))
+            print(f"LLM API calls updated for user_id {user_id}")
+        except DatabaseConnectionError:
+            raise
+        except Exception as e:
+            print("Error updating LLM API calls:", e)
+
+    async def bulk_increment_endpoint_counts(self, rows):
+        values = ", ".join(["(%s, %s, %s)"] * len(rows))
+        await self._execute(self.endpoint_bulk_upsert_query.format(values=values), [value for row in rows for value in row])
+
+    async def bulk_increment_api_usage(self, rows):
+        values = ", ".join(["(%s, %s, %s)"] * len(rows))
+        await self._execute(self.api_usage_bulk_upsert_query.format(values=values), [value for row in rows for value in row])
+
+
+class AioMySQLDatabase(SQLDatabase):
+    """MySQL through aiomysql, with its own pool of async connections."""
+
+    create_table_queries = [
+        """
+        CREATE TABLE IF NOT EXISTS users (
+        id INT AUTO_INCREMENT PRIMARY KEY,
+        first_name VARCHAR(255) NOT NULL,
+        email VARCHAR(255) NOT NULL UNIQUE,
+        password_hash VARCHAR(255) NOT NULL,
+        is_admin BOOLEAN DEFAULT FALSE
+        )
+        """,
+        """
+        CREATE TABLE IF NOT EXISTS endpoints (
+        id INT AUTO_INCREMENT PRIMARY KEY,
+        method VARCHAR(10) NOT NULL,
+        endpoint VARCHAR(255) NOT NULL,
+        count INT DEFAULT 0,
+        UNIQUE (method, endpoint)
+        )
+        """,
+        """
+        CREATE TABLE IF NOT EXISTS api_usage (
+        id INT AUTO_INCREMENT PRIMARY KEY,
+        user_id INT NOT NULL UNIQUE,
+        total_api_calls INT DEFAULT 0,
+        llm_api_calls INT DEFAULT 0,
+        INDEX idx_api_usage_total_calls (total_api_calls, user_id),
+        FOREIGN KEY (user_id) REFERENCES users(id) ON DELETE CASCADE
+        )
+        """,
+    ]
+    endpoint_upsert_query = """
+        INSERT INTO endpoints (method, endpoint, count)
+        VALUES (%s, %s, 1)
+        ON DUPLICATE KEY UPDATE count = count + 1
+    """
+    api_usage_upsert_query = """
+        INSERT INTO api_usage (user_id, total_api_calls)
+        VALUES (%s, 1)
+        ON DUPLICATE KEY UPDATE total_api_calls = total_api_calls + 1
+    """
+    endpoint_bulk_upsert_query = """
+        INSERT INTO endpoints (method, endpoint, count)
+        VALUES {values}
+        ON DUPLICATE KEY UPDATE count = count + VALUES(count)
+    """
+    api_usage_bulk_upsert_query = """
+        INSERT INTO api_usage (user_id, total_api_calls, llm_api_calls)
+        VALUES {values}
+        ON DUPLICATE KEY UPDATE
+            total_api_calls = total_api_calls + VALUES(total_api_calls),
+            llm_api_calls = llm_api_calls + VALUES(llm_api_calls)
+    """
+
+    def __init__(self):
+        self._pool = None
+
+    async def create_tables(self):
+        await super().create_tables()
+        try:
+            row = await self._fetchone(db_connection.API_USAGE_INDEX_EXISTS_QUERY)
+            if row["count"] == 0:
+                await self._execute(db_connection.API_USAGE_ADD_INDEX_QUERY)
+                print("Added idx_api_usage_total_calls to api_usage")
+        except DatabaseConnectionError:
+            raise
+        except Exception as e:
+            print("Error adding api usage index", e)
+
+    async def connect(self):
+        # Only needed when this backend is selected
+        import aiomysql
+
+        try:
+            self._pool = await aiomysql.create_pool(
+                host=os.getenv("DB_HOST"),
+                user=os.getenv("DB_USER"),
+                password=os.getenv("DB_PASSWORD"),
+                db=os.getenv("DB_NAME"),
+                port=int(os.getenv("DB_PORT") or 3306),
+                minsize=1,
+                maxsize=db_connection.DB_POOL_SIZE + db_connection.DB_POOL_MAX_OVERFLOW,
+                pool_recycle=db_connection.DB_POOL_IDLE_RECYCLE,
+                autocommit=False,
+            )
+            print("Connected to MySQL database (aiomysql)")
+        except Exception as e:
+            print("Error while connecting to MySQL", e)
+            raise DatabaseConnectionError("Database connection failed")
+
+    async def close(self):
+        if self._pool is not None:
+            self._pool.close()
+            await self._pool.wait_closed()
+            self._pool = None
+
+    @asynccontextmanager
+    async def _cursor(self):
+        """Checks a connection out of the pool and yields it with a dict cursor."""
+        import aiomysql
+
+        if self._pool is None:
+            raise DatabaseConnectionError("Database connection failed")
+        try:
+            connection = await asyncio.wait_for(self._pool.acquire(), timeout=db_connection.DB_POOL_TIMEOUT)
+        except Exception as e:
+            print("Error while connecting to MySQL", e)
+            raise DatabaseConnectionError("Database connection failed")
+
+        try:
+            async with connection.cursor(aiomysql.DictCursor) as cursor:
+                try:
+                    yield connection, cursor
+                except Exception:
+                    await connection.rollback()
+                    raise
+        finally:
+            self._pool.release(connection)
+
+    async def _fetchone(self, query, params=()):
+        async with self._cursor() as (connection, cursor):
+            await cursor.execute(query, params)
+            row = await cursor.fetchone()
+            await connection.commit()
+            return row
+
+    async def _fetchall(self, query, params=()):
+        async with self._cursor() as (connection, cursor):
+            await cursor.execute(query, params)
+            rows = await cursor.fetchall()
+            await connection.commit()
+            return list(rows)
+
+    async def _execute(self, query, params=()):
+        async with self._cursor() as (connection, cursor):
+            await cursor.execute(query, params)
+            await connection.commit()
+            return cursor.rowcount
+
+
+class SQLiteDatabase(SQLDatabase):
+    """SQLite through aiosqlite, for running and load-testing the API locally without a MySQL server."""
+
+    create_table_queries = [
+        """
+        CREATE TABLE IF NOT EXISTS users (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        first_name VARCHAR(255) NOT NULL,
+        email VARCHAR(255) NOT NULL UNIQUE,
+        password_hash VARCHAR(255) NOT NULL,
+        is_admin BOOLEAN DEFAULT FALSE
+        )
+        """,
+        """
+        CREATE TABLE IF NOT EXISTS endpoints (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        method VARCHAR(10) NOT NULL,
+        endpoint VARCHAR(255) NOT NULL,
+        count INT DEFAULT 0,
+        UNIQUE (method, endpoint)
+        )
+        """,
+        """
+        CREATE TABLE IF NOT EXISTS api_usage (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        user_id INT NOT NULL UNIQUE,
+        total_api_calls INT DEFAULT 0,
+        llm_api_calls INT DEFAULT 0,
+        FOREIGN KEY (user_id) REFERENCES users(id) ON DELETE CASCADE
+        )
+        """,
+        "CREATE INDEX IF NOT EXISTS idx_api_usage_total_calls ON api_usage (total_api_calls, user_id)",
+    ]
+    endpoint_upsert_query = """
+        INSERT INTO endpoints (method, endpoint, count)
+        VALUES (%s, %s, 1)
+        ON CONFLICT (method, endpoint) DO UPDATE SET count = count + 1
+    """
+    api_usage_upsert_query = """
+        INSERT INTO api_usage (user_id, total_api_calls)
+        VALUES (%s, 1)
+        ON CONFLICT (user_id) DO UPDATE SET total_api_calls = total_api_calls + 1
+    """
+    endpoint_bulk_upsert_query = """
+        INSERT INTO endpoints (method, endpoint, count)
+        VALUES {values}
+        ON CONFLICT (method, endpoint) DO UPDATE SET count = count + excluded.count
+    """
+    api_usage_bulk_upsert_query = """
+        INSERT INTO api_usage (user_id, total_api_calls, llm_api_calls)
+        VALUES {values}
+        ON CONFLICT (user_id) DO UPDATE SET
+            total_api_calls = total_api_calls + excluded.total_api_calls,
+            llm_api_calls = llm_api_calls + excluded.llm_api_calls
+    """
+
+    def __init__(self, path=SQLITE_PATH):
+        self.path = path
+        self._connection = None
+        # SQLite allows one writer at a time, so writes are serialised here instead of failing with "database is locked"
+        self._write_lock = asyncio.Lock()
+
+    async def connect(self):
+        import aiosqlite
+
+        try:
+            self._connection = await aiosqlite.connect(self.path)
+            self._connection.row_factory = aiosqlite.Row
+            await self._connection.execute("PRAGMA foreign_keys = ON")
+            await self._connection.execute("PRAGMA journal_mode = WAL")
+            print(f"Connected to SQLite database at {self.path}")
+        except Exception as e:
+            print("Error while connecting to SQLite", e)
+            raise DatabaseConnectionError("Database connection failed")
+
+    async def close(self):
+        if self._connection is not None:
+            await self._connection.close()
+            self._connection = None
+
+    def _get_connection(self):
+        if self._connection is None:
+            raise DatabaseConnectionError("Database connection failed")
+        return self._connection
+
+    @staticmethod
+    def _convert(query):
+        """Converts %s placeholders to SQLite's ? style."""
+        return query.replace("%s", "?")
+
+    async def _fetchone(self, query, params=()):
+        async with self._get_connection().execute(self._convert(query), params) as cursor:
+            row = await cursor.fetchone()
+            return dict(row) if row is not None else None
+
+    async def _fetchall(self, query, params=()):
+        async with self._get_connection().execute(self._convert(query), params) as cursor:
+            return [dict(row) for row in await cursor.fetchall()]
+
+    async def _execute(self, query, params=()):
+        connection = self._get_connection()
+        async with self._write_lock:
+            try:
+                cursor = await connection.execute(self._convert(query), params)
+                await connection.commit()
+                return cursor.rowcount
+            except Exception:
+                await connection.rollback()
+                raise
+
+
+BACKENDS = {
+    "mysql": PooledMySQLDatabase,
+    "aiomysql": AioMySQLDatabase,
+    "sqlite": SQLiteDatabase,
+}
+
+_database = None
+
+
+def get_database():
+    """Returns the configured database backend."""
+    global _database
+    if _database is None:
+        if DB_BACKEND not in BACKENDS:
+            raise ValueError(f"Unknown DB_BACKEND '{DB_BACKEND}', expected one of {', '.join(BACKENDS)}")
+        _database = BACKENDS[DB_BACKEND]()
+    return _database
+
+
+async def init_database():
+    """Connects the configured backend and creates the tables if they don't exist."""
+    database = get_database()
+    await database.connect()
+    await database.create_tables()
+
+
+async def close_database():
+    """Closes the configured backend's connections."""
+    if _database is not None:
+        await _database.close()
+
+
+# Module-level functions mirroring db_connection, for the handlers
+
+async def get_user_by_email(email):
+    """Retrieve a user from the database by email."""
+    return await get_database().get_user_by_email(email)
+
+async def insert_user(first_name, email, password_hash):
+    """Inserts a new user into the users table."""
+    await get_database().insert_user(first_name, email, password_hash)
+
+async def update_user_password(email, hashed_password):
+    """Updates user password"""
+    await get_database().update_user_password(email, hashed_password)
+    invalidate_user(email=email)
+
+async def update_user_name(user_id, new_name):
+    """Updates the user's name in the database."""
+    success = await get_database().update_user_name(user_id, new_name)
+    invalidate_user(user_id=user_id)
+    return success
+
+async def delete_user(user_id):
+    """Deletes a user from the database."""
+    success = await get_database().delete_user(user_id)
+    invalidate_user(user_id=user_id)
+    return success
+
+async def get_endpoint_stats():
+    """Returns a list of endpoint statistics."""
+    return await get_database().get_endpoint_stats()
+
+async def initialize_usage_record(user_id):
+    """Inserts new user into api usage table"""
+    await get_database().initialize_usage_record(user_id)
+
+async def get_api_usage_data():
+    """Fetch API usage data with user details."""
+    return await get_database().get_api_usage_data()
+
+async def get_api_usage_page(sort="calls", after=None, limit=100):
+    """Fetch one page of API usage with user details, ordered by `sort` and starting after the key `after`."""
+    return await get_database().get_api_usage_page(sort, after, limit)
+
+async def get_api_usage_data_for_user(user_id):
+    """Fetch API usage data for a specific user."""
+    return await get_database().get_api_usage_data_for_user(user_id)
+
+async def increment_endpoint_count(method, path):
+    """Increments the count of an endpoint in the `endpoints` table."""
+    await get_database().increment_endpoint_count(method, path)
+
+async def increment_total_api_calls(user_id):
+    """Increments `total_api_calls` for a user in the `api_usage` table."""
+    await get_database().increment_total_api_calls(user_id)
+
+async def increment_llm_api_calls(user_id):
+    """Increments `llm_api_calls` for a user in the `api_usage` table."""
+    await get_database().increment_llm_api_calls(user_id)
+
+async def bulk_increment_endpoint_counts(rows):
+    """Adds a batch of (method, endpoint, count) rows to the `endpoints` table."""
+    await get_database().bulk_increment_endpoint_counts(rows)
+
+async def bulk_increment_api_usage(rows):
+    """Adds a batch of (user_id, total_api_calls, llm_api_calls) rows to the `api_usage` table."""
+    await get_database().bulk_increment_api_usage(rows)
@@ -1,12 +1,17 @@
 import os
+import time
 from dotenv import load_dotenv
-from fastapi import HTTPException, status, Request
+from fastapi import HTTPException, status, Request, Response
 from datetime import timedelta
 from jose import jwt, JWTError
 from passlib.context import CryptContext
 from datetime import datetime, timedelta
-import requests
-from utils.db_connection import get_db_connection, close_db_connection, get_user_by_email
+from utils.http_client import get_client, UpstreamError
+from utils.async_db import get_user_by_email
+from utils.user_cache import get_cached_user, cache_user
+from utils.db_pool import DatabaseConnectionError
+from utils.executors import run_hash
+from utils.token_cache import get_cached_claims, cache_claims, revoke_token, is_revoked
 
 # Load environment variables from .env file
 load_dotenv()
@@ -18,10 +23,21 @@ ACCESS_TOKEN_EXPIRE_MINUTES = int(os.getenv("ACCESS_TOKEN_EXPIRE_MINUTES"))
 RESET_PASSWORD_EXPIRE_MINUTES = int(os.getenv("RESET_PASSWORD_EXPIRE_MINUTES"))
 RESET_PASSWORD_SECRET_KEY = os.getenv("RESET_PASSWORD_SECRET_KEY")
 
+# Put the user's id, admin flag and first name in access tokens, so some endpoints can skip the user lookup
+TOKEN_USER_CLAIMS = os.getenv("TOKEN_USER_CLAIMS", "true").lower() == "true"
+
 MAILGUN_API_KEY = os.getenv("MAILGUN_API_KEY") 
 MAILGUN_DOMAIN = os.getenv("MAILGUN_DOMAIN") 
+MAILGUN_API_BASE = os.getenv("MAILGUN_API_BASE", "https://api.mailgun.net")
+
+# bcrypt cost factor; each step doubles the time a hash takes. Pick one with benchmarks/bench_bcrypt_cost.py
+BCRYPT_ROUNDS = int(os.getenv("BCRYPT_ROUNDS", "12"))
+
+mailgun_client = get_client("mailgun")
 
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+# `rounds` sets the minimum and maximum as well as the default, so hashes made with any
+# other cost are flagged by needs_update and replaced at the user's next login
+pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto", bcrypt__rounds=BCRYPT_ROUNDS)
 
 def hash_password(password: str) -> str:
     """Hashes password."""
@@ -31,14 +47,71 @@ def verify_password(plain_password: str, hashed_password: str) -> bool:
     """Checks that entered password is same as hashed password."""
     return pwd_context.verify(plain_password, hashed_password)
 
+async def hash_password_async(password: str) -> str:
+    """Hashes password on the hashing pool."""
+    return await run_hash(hash_password, password)
+
+async def verify_and_update_password(plain_password: str, hashed_password: str):
+    """
+    Checks a password on the hashing pool.
+    Returns (valid, new hash), where the new hash is set when the stored one used a different cost.
+    """
+    return await run_hash(pwd_context.verify_and_update, plain_password, hashed_password)
+
 def create_access_token(data: dict, expires_delta: timedelta = None):
     """Creates an access token."""
     to_encode = data.copy()
-    expire = datetime.utcnow() + (expires_delta or timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES))
-    to_encode.update({"exp": expire})
+    now = datetime.utcnow()
+    expire = now + (expires_delta or timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES))
+    # `iat` only has whole seconds, so revocation checks use the millisecond one
+    to_encode.update({"exp": expire, "iat": now, "iat_ms": time.time_ns() // 1_000_000})
     encoded_jwt = jwt.encode(to_encode, SECRET_KEY, algorithm=ALGORITHM)
     return encoded_jwt
 
+def user_token_claims(user: dict):
+    """The claims an access token carries for a user."""
+    claims = {"sub": user["email"]}
+    if TOKEN_USER_CLAIMS:
+        claims.update({"uid": user["id"], "adm": int(bool(user.get("is_admin"))), "name": user.get("first_name", "")})
+    return claims
+
+def set_access_token_cookie(response: Response, user: dict):
+    """Issues an access token for a user and sets it as an HTTP-only cookie."""
+    access_token = create_access_token(user_token_claims(user), expires_delta=timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES))
+    response.set_cookie(
+        key="access_token",
+        value=access_token,
+        httponly=True,
+        max_age=ACCESS_TOKEN_EXPIRE_MINUTES * 60,
+        secure=True,
+        samesite="None",
+        path="/"  # Ensure cookie is available for all paths
+    )
+    return access_token
+
+def decode_access_token(token: str):
+    """
+    Returns the claims of a valid access token, or None if it is invalid, expired or revoked.
+    Verified tokens are cached until they expire, so the signature is only checked once.
+    """
+    claims = get_cached_claims(token)
+    if claims is None:
+        try:
+            claims = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
+        except JWTError:
+            return None
+        cache_claims(token, claims)
+    if is_revoked(token, claims):
+        return None
+    return claims
+
+def revoke_access_token(request: Request):
+    """Revokes the request's access token, if it has a valid one."""
+    token = request.cookies.get("access_token")
+    claims = decode_access_token(token) if token else None
+    if claims is not None:
+        revoke_token(token, claims)
+
 def create_password_reset_token(email: str):
     """Generate a JWT token for password reset."""
     expire = datetime.utcnow() + timedelta(minutes=30)  # Token expiry time, adjust as needed
@@ -59,16 +132,20 @@ def send_reset_email(email: str, reset_link: str):
     </html>
     """
 
-    response = requests.post(
-        f"https://api.mailgun.net/v3/{MAILGUN_DOMAIN}/messages",
-        auth=("api", MAILGUN_API_KEY),
-        data={
-            "from": f"Your App <mailgun@{MAILGUN_DOMAIN}>",
-            "to": email,
-            "subject": "Password Reset Request",
-            "html": html_content  
-        }
-    )
+    try:
+        response = mailgun_client.post(
+            f"{MAILGUN_API_BASE}/v3/{MAILGUN_DOMAIN}/messages",
+            auth=("api", MAILGUN_API_KEY),
+            data={
+                "from": f"Your App <mailgun@{MAILGUN_DOMAIN}>",
+                "to": email,
+                "subject": "Password Reset Request",
+                "html": html_content  
+            }
+        )
+    except UpstreamError as e:
+        print(f"Failed to send email: {e}")
+        return None
 
     if response.status_code == 200: 
         print("Email sent successfully!")
@@ -81,42 +158,93 @@ def send_reset_email(email: str, reset_link: str):
 
 
 # Retrieves the current user 
+def token_subject(request: Request):
+    """Returns the subject (email) of a valid access token cookie without looking the user up, or None."""
+    token = request.cookies.get("access_token")
+    if not token:
+        return None
+    claims = decode_access_token(token)
+    return claims.get("sub") if claims else None
+
+
 async def get_current_user(request: Request):
     
     # Extract the token from the cookie
     token = request.cookies.get("access_token")
 
+    # The middleware and the handler's dependency share the same request state,
+    # so the user is only resolved once per request
+    memo = getattr(request.state, "current_user", None)
+    if memo is not None and memo[0] == token:
+        return memo[1]
+
     if not token:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="Authentication credentials were not provided",
         )
 
-    try:
-        # Decode the JWT token
-        payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
-        email: str = payload.get("sub")
-
-
-        if email is None:
-            raise HTTPException(
-                status_code=status.HTTP_401_UNAUTHORIZED,
-                detail="Invalid authentication credentials",
-            )
-    except JWTError:
+    # Decode the JWT token
+    payload = decode_access_token(token)
+    if payload is None:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="Could not validate credentials",
         )
 
-    # Connect to the database and retrieve the user
-    db = get_db_connection()
-    user = get_user_by_email(db, email)
-    close_db_connection(db)
+    email: str = payload.get("sub")
+    if email is None:
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="Invalid authentication credentials",
+        )
+
+    # Retrieve the user from the cache, or through the async data-access layer
+    user = get_cached_user(email)
+    if user is None:
+        try:
+            user = await get_user_by_email(email)
+        except DatabaseConnectionError:
+            raise HTTPException(status_code=500, detail="Database connection failed")
+        if user is not None:
+            cache_user(email, user)
 
     if user is None:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="User not found",
         )
-    return user
\ No newline at end of file
+
+    request.state.current_user = (token, user)
+    return user
+
+
+async def get_token_user(request: Request):
+    """
+    Returns the user described by the access token's claims: id, email, is_admin and first_name.
+    Only looks the user up when the token doesn't carry those claims. The claims are as of login,
+    so use get_current_user where a change since then (e.g. losing admin rights) must show at once.
+    """
+    memo = getattr(request.state, "current_user", None)
+    if memo is not None and memo[0] == request.cookies.get("access_token"):
+        return memo[1]
+
+    token = request.cookies.get("access_token")
+    claims = decode_access_token(token) if token else None
+    if claims is None or "uid" not in claims:
+        return await get_current_user(request)
+
+    return {
+        "id": claims["uid"],
+        "email": claims["sub"],
+        "is_admin": claims.get("adm", 0),
+        "first_name": claims.get("name", ""),
+    }
+
+
+async def require_admin(request: Request):
+    """Dependency for admin-only endpoints, answered from the token's claims when it has them."""
+    user = await get_token_user(request)
+    if not user.get("is_admin"):
+        raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Admin privileges required")
+    return user
@@ -1,11 +1,19 @@
 import mysql.connector
 from mysql.connector import Error
+from fastapi import HTTPException
 from dotenv import load_dotenv
 import os
+from utils.executors import run_db
+from utils.db_pool import ConnectionPool
 
 # Load environment variables from .env file
 load_dotenv()
 
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "5"))
+DB_POOL_MAX_OVERFLOW = int(os.getenv("DB_POOL_MAX_OVERFLOW", "5"))
+DB_POOL_TIMEOUT = float(os.getenv("DB_POOL_TIMEOUT", "10"))
+DB_POOL_IDLE_RECYCLE = float(os.getenv("DB_POOL_IDLE_RECYCLE", "300"))
+
 def get_db_connection():
     """Establishes and returns a database connection."""
     try:
@@ -23,6 +31,43 @@ def get_db_connection():
         print("Error while connecting to MySQL", e)
         return None
 
+def close_db_connection(connection):
+    """Closes the database connection."""
+    if connection.is_connected():
+        connection.close()
+        print("MySQL connection closed")
+
+# Shared pool of connections, opened with get_db_connection as they are needed
+connection_pool = ConnectionPool(
+    get_db_connection,
+    close_db_connection,
+    size=DB_POOL_SIZE,
+    max_overflow=DB_POOL_MAX_OVERFLOW,
+    timeout=DB_POOL_TIMEOUT,
+    idle_recycle=DB_POOL_IDLE_RECYCLE,
+)
+
+def db_session():
+    """
+    Context manager that checks a connection out of the pool and returns it afterwards.
+
+        with db_session() as connection:
+            user = get_user_by_email(connection, email)
+    """
+    return connection_pool.connection()
+
+def _call_with_connection(func, *args):
+    """Runs `func(connection, *args)` with a pooled connection."""
+    with db_session() as connection:
+        return func(connection, *args)
+
+async def run_query(func, *args):
+    """
+    Runs a database function on the DB thread pool so it doesn't block the event loop.
+    The function receives its own connection as the first argument.
+    """
+    return await run_db(_call_with_connection, func, *args)
+
 def create_user_table(connection):
     """Creates the users table if it does not already exist."""
     cursor = connection.cursor()
@@ -91,12 +136,6 @@ def update_user_password(connection, email, hashed_password):
     finally:
         cursor.close()
 
-def close_db_connection(connection):
-    """Closes the database connection."""
-    if connection.is_connected():
-        connection.close()
-        print("MySQL connection closed")
-        
 def create_endpoint_table(connection):
     """Creates the endpoints table if it does not already exist."""
     cursor = connection.cursor()
@@ -132,7 +171,7 @@ def get_endpoint_stats_from_db(connection):
 
         # If no data is found, return an empty list
         if not result:
-            raise HTTPException(status_code=404, detail="No endpoint stats found")
+            return []
 
         # Prepare the response data
         stats = [{"method": row[0], "endpoint": row[1], "count": row[2]} for row in result]
@@ -143,7 +182,6 @@ def get_endpoint_stats_from_db(connection):
         raise HTTPException(status_code=500, detail=f"Error fetching endpoint stats: {e}")
     finally:
         cursor.close()
-        close_db_connection(connection)
         
 def create_api_usage_table(connection):
     """Creates the api usage table if it does not already exist."""
@@ -155,6 +193,7 @@ def create_api_usage_table(connection):
         user_id INT NOT NULL UNIQUE,
         total_api_calls INT DEFAULT 0,
         llm_api_calls INT DEFAULT 0,
+        INDEX idx_api_usage_total_calls (total_api_calls, user_id),
         FOREIGN KEY (user_id) REFERENCES users(id) ON DELETE CASCADE
         )
         """
@@ -166,6 +205,27 @@ def create_api_usage_table(connection):
         return None
     finally:
         cursor.close() 
+
+# CREATE TABLE IF NOT EXISTS leaves tables from before the index without it, so it is added separately
+API_USAGE_INDEX_EXISTS_QUERY = """
+SELECT COUNT(*) AS count FROM information_schema.statistics
+WHERE table_schema = DATABASE() AND table_name = 'api_usage' AND index_name = 'idx_api_usage_total_calls'
+"""
+API_USAGE_ADD_INDEX_QUERY = "ALTER TABLE api_usage ADD INDEX idx_api_usage_total_calls (total_api_calls, user_id)"
+
+def add_api_usage_index(connection):
+    """Adds the index the calls-sorted usage pages read by to an `api_usage` table created without it."""
+    cursor = connection.cursor()
+    try:
+        cursor.execute(API_USAGE_INDEX_EXISTS_QUERY)
+        if cursor.fetchone()[0] == 0:
+            cursor.execute(API_USAGE_ADD_INDEX_QUERY)
+            connection.commit()
+            print("Added idx_api_usage_total_calls to api_usage")
+    except Error as e:
+        print("Error adding api usage index", e)
+    finally:
+        cursor.close()
         
 def initialize_usage_record(connection, user_id):
     """Inserts new user into api usage table"""
@@ -189,6 +249,7 @@ def get_api_usage_data(connection):
     try:
         query = """
         SELECT 
+            api_usage.user_id,
             users.first_name, 
             users.email, 
             api_usage.total_api_calls
@@ -210,6 +271,48 @@ def get_api_usage_data(connection):
         cursor.close()
 
 
+def get_api_usage_page(connection, sort, after, limit):
+    """
+    Fetch one page of API usage with user details, by keyset so each page costs the same.
+    `sort` is "calls" (most calls first) or "user_id"; `after` is the last row's key from the previous page.
+    """
+    cursor = connection.cursor(dictionary=True)
+    try:
+        query, params = api_usage_page_query(sort, after, limit)
+        cursor.execute(query, params)
+        return cursor.fetchall()
+    except Error as e:
+        print("Error fetching API usage page:", e)
+        connection.rollback()
+        return []
+    finally:
+        cursor.close()
+
+
+def api_usage_page_query(sort, after, limit):
+    """Builds the keyset query for a page of API usage. Returns (query, params)."""
+    query = """
+    SELECT api_usage.user_id, users.first_name, users.email, api_usage.total_api_calls
+    FROM api_usage
+    JOIN users ON api_usage.user_id = users.id
+    """
+    params = []
+    if sort == "calls":
+        # Uses the (total_api_calls, user_id) index
+        if after is not None:
+            query += "WHERE (api_usage.total_api_calls, api_usage.user_id) < (%s, %s) "
+            params.extend(after)
+        query += "ORDER BY api_usage.total_api_calls DESC, api_usage.user_id DESC "
+    else:
+        if after is not None:
+            query += "WHERE api_usage.user_id > %s "
+            params.append(after[0])
+        query += "ORDER BY api_usage.user_id "
+    query += "LIMIT %s"
+    params.append(limit)
+    return query, tuple(params)
+
+
 def get_api_usage_data_for_user(connection, user_id):
     """Fetch API usage data for a specific user."""
     cursor = connection.cursor(dictionary=True)
@@ -285,3 +388,107 @@ def delete_user(connection, user_id):
         return False
     finally:
         cursor.close()
+
+
+def increment_endpoint_count(connection, method, path):
+    """Increments the count of an endpoint in the `endpoints` table."""
+    cursor = connection.cursor()
+    try:
+        query = """
+        INSERT INTO endpoints (method, endpoint, count)
+        VALUES (%s, %s, 1)
+        ON DUPLICATE KEY UPDATE count = count + 1
+        """
+        cursor.execute(query, (method, path))
+        connection.commit()
+    except Exception as e:
+        print(f"Error logging request to database: {e}")
+        connection.rollback()
+    finally:
+        cursor.close()
+
+
+def increment_total_api_calls(connection, user_id):
+    """Increments `total_api_calls` for a user in the `api_usage` table."""
+    cursor = connection.cursor()
+    try:
+        connection.start_transaction()
+        # Update the `api_usage` table for the specific user
+        query = """
+        INSERT INTO api_usage (user_id, total_api_calls)
+        VALUES (%s, 1)
+        ON DUPLICATE KEY UPDATE total_api_calls = total_api_calls + 1
+        """
+        cursor.execute(query, (user_id,))
+        connection.commit()
+
+    except Exception as e:
+        print(f"Error updating `api_usage` table: {e}")
+        connection.rollback()
+    finally:
+        cursor.close()
+
+
+def increment_llm_api_calls(connection, user_id):
+    """Increments `llm_api_calls` for a user in the `api_usage` table."""
+    cursor = connection.cursor()
+    try:
+        connection.start_transaction()
+
+        update_query = """
+        UPDATE api_usage
+        SET llm_api_calls = llm_api_calls + 1
+        WHERE user_id = %s
+        """
+        cursor.execute(update_query, (user_id,))
+        connection.commit()
+        print(f"LLM API calls updated for user_id {user_id}")
+    except Exception as e:
+        print("Error updating LLM API calls:", e)
+        connection.rollback()
+    finally:
+        cursor.close()
+
+
+def bulk_increment_endpoint_counts(connection, rows):
+    """
+    Adds a batch of counts to the `endpoints` table in one multi-row UPSERT.
+    `rows` is a list of (method, endpoint, count) tuples.
+    """
+    cursor = connection.cursor()
+    try:
+        query = f"""
+        INSERT INTO endpoints (method, endpoint, count)
+        VALUES {", ".join(["(%s, %s, %s)"] * len(rows))}
+        ON DUPLICATE KEY UPDATE count = count + VALUES(count)
+        """
+        cursor.execute(query, [value for row in rows for value in row])
+        connection.commit()
+    except Error:
+        connection.rollback()
+        raise
+    finally:
+        cursor.close()
+
+
+def bulk_increment_api_usage(connection, rows):
+    """
+    Adds a batch of call counts to the `api_usage` table in one multi-row UPSERT.
+    `rows` is a list of (user_id, total_api_calls, llm_api_calls) tuples.
+    """
+    cursor = connection.cursor()
+    try:
+        query = f"""
+        INSERT INTO api_usage (user_id, total_api_calls, llm_api_calls)
+        VALUES {", ".join(["(%s, %s, %s)"] * len(rows))}
+        ON DUPLICATE KEY UPDATE
+            total_api_calls = total_api_calls + VALUES(total_api_calls),
+            llm_api_calls = llm_api_calls + VALUES(llm_api_calls)
+        """
+        cursor.execute(query, [value for row in rows for value in row])
+        connection.commit()
+    except Error:
+        connection.rollback()
+        raise
+    finally:
+        cursor.close()
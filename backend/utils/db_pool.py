@@ -0,0 +1,174 @@
+import threading
+import time
+from contextlib import contextmanager
+from utils import metrics
+
+
+class DatabaseConnectionError(Exception):
+    """Raised when a connection to the database can't be established."""
+
+
+class PoolTimeoutError(DatabaseConnectionError):
+    """Raised when no pooled connection frees up within the checkout timeout."""
+
+
+class ConnectionPool:
+    """
+    Thread-safe pool of database connections.
+
+    Keeps up to `size` idle connections around and opens up to `max_overflow` extra ones under load,
+    which are closed again when they are returned. Connections are pinged on checkout and replaced
+    once they have been idle for longer than `idle_recycle` seconds.
+    """
+
+    def __init__(self, connect, close, size=5, max_overflow=5, timeout=10.0, idle_recycle=300.0, pre_ping=True, name="db_pool"):
+        self._connect = connect
+        self._close = close
+        self.size = max(1, size)
+        self.max_overflow = max(0, max_overflow)
+        self.timeout = timeout
+        self.idle_recycle = idle_recycle
+        self.pre_ping = pre_ping
+        self.name = name
+
+        self._lock = threading.Condition()
+        self._idle = []          # (connection, time it was returned)
+        self._in_use = 0
+        self._opening = 0
+        self._waiting = 0
+
+        metrics.register_gauge(name, self.stats)
+
+    def _total(self):
+        """Connections that are open, being opened or checked out."""
+        return len(self._idle) + self._in_use + self._opening
+
+    def _open(self):
+        """Opens a new connection."""
+        connection = self._connect()
+        if connection is None:
+            raise DatabaseConnectionError("Database connection failed")
+        metrics.increment(f"{self.name}_connections_opened_total")
+        return connection
+
+    def _discard(self, connection):
+        """Closes a connection that won't be reused."""
+        try:
+            self._close(connection)
+        except Exception as e:
+            print(f"Error closing pooled connection: {e}")
+        metrics.increment(f"{self.name}_connections_closed_total")
+
+    def _is_healthy(self, connection, returned_at):
+        """Checks that an idle connection is fresh enough and still alive."""
+        if self.idle_recycle and time.monotonic() - returned_at > self.idle_recycle:
+            return False
+        if not self.pre_ping:
+            return True
+        try:
+            connection.ping(reconnect=False)
+            return True
+        except Exception:
+            return False
+
+    def checkout(self):
+        """Takes a connection from the pool, waiting up to `timeout` seconds for one to free up."""
+        started = time.monotonic()
+        deadline = started + self.timeout
+
+        while True:
+            with self._lock:
+                connection = None
+                while True:
+                    if self._idle:
+                        connection, returned_at = self._idle.pop()
+                        self._in_use += 1
+                        break
+                    if self._total() < self.size + self.max_overflow:
+                        self._opening += 1
+                        break
+
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        metrics.increment(f"{self.name}_timeouts_total")
+                        raise PoolTimeoutError(f"Timed out after {self.timeout}s waiting for a database connection")
+                    self._waiting += 1
+                    try:
+                        self._lock.wait(remaining)
+                    finally:
+                        self._waiting -= 1
+
+            if connection is None:
+                # Open a new connection outside the lock
+                try:
+                    connection = self._open()
+                except Exception:
+                    with self._lock:
+                        self._opening -= 1
+                        self._lock.notify()
+                    raise
+                with self._lock:
+                    self._opening -= 1
+                    self._in_use += 1
+                break
+
+            if self._is_healthy(connection, returned_at):
+                break
+
+            # Stale or dead connection, replace it and try again
+            self._discard(connection)
+            metrics.increment(f"{self.name}_recycled_total")
+            with self._lock:
+                self._in_use -= 1
+                self._lock.notify()
+
+        metrics.observe(f"{self.name}_wait_ms", (time.monotonic() - started) * 1000)
+        return connection
+
+    def checkin(self, connection):
+        """Returns a connection to the pool."""
+        reusable = True
+        try:
+            # Clear any transaction the caller left open
+            connection.rollback()
+        except Exception:
+            reusable = False
+
+        with self._lock:
+            self._in_use -= 1
+            if reusable and len(self._idle) < self.size:
+                self._idle.append((connection, time.monotonic()))
+                connection = None
+            self._lock.notify()
+
+        # Overflow and broken connections are closed
+        if connection is not None:
+            self._discard(connection)
+
+    @contextmanager
+    def connection(self):
+        """Context manager that checks a connection out and returns it when done."""
+        connection = self.checkout()
+        try:
+            yield connection
+        finally:
+            self.checkin(connection)
+
+    def close_idle(self):
+        """Closes every idle connection."""
+        with self._lock:
+            idle, self._idle = self._idle, []
+        for connection, _ in idle:
+            self._discard(connection)
+
+    def stats(self):
+        """Returns how many connections are open, in use and waited for."""
+        with self._lock:
+            return {
+                "size": self.size,
+                "max_overflow": self.max_overflow,
+                "in_use": self._in_use,
+                "idle": len(self._idle),
+                "open": self._total(),
+                "waiting": self._waiting,
+            }
@@ -0,0 +1,130 @@
+import asyncio
+import functools
+import multiprocessing
+import os
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+from dotenv import load_dotenv
+from utils import metrics
+
+load_dotenv()
+
+IO_EXECUTOR_WORKERS = int(os.getenv("IO_EXECUTOR_WORKERS", "16"))
+DB_EXECUTOR_WORKERS = int(os.getenv("DB_EXECUTOR_WORKERS", "8"))
+CPU_EXECUTOR_WORKERS = int(os.getenv("CPU_EXECUTOR_WORKERS", str(min(4, os.cpu_count() or 1))))
+INFERENCE_EXECUTOR = os.getenv("INFERENCE_EXECUTOR", "thread")   # thread or process
+INFERENCE_EXECUTOR_WORKERS = int(os.getenv("INFERENCE_EXECUTOR_WORKERS", "1"))
+# Concurrent bcrypt hashes. Kept below the core count so a burst of logins leaves CPU for everything else
+HASH_EXECUTOR_WORKERS = int(os.getenv("HASH_EXECUTOR_WORKERS", str(max(1, (os.cpu_count() or 1) // 2))))
+HASH_MAX_QUEUE = int(os.getenv("HASH_MAX_QUEUE", "32"))
+
+# How many calls may wait for a worker before callers start waiting on the event loop
+EXECUTOR_MAX_QUEUE = int(os.getenv("EXECUTOR_MAX_QUEUE", "64"))
+
+
+class BoundedPool:
+    """
+    Thread or process pool with a bounded queue.
+    Once `workers + max_queue` calls are pending, further callers wait (without blocking the event loop)
+    until a slot frees up, so a slow upstream can't pile up unbounded work.
+    """
+
+    def __init__(self, name, workers, max_queue=EXECUTOR_MAX_QUEUE, kind="thread"):
+        self.name = name
+        self.workers = max(1, workers)
+        self.capacity = self.workers + max(0, max_queue)
+        self.kind = kind
+        self._executor = None
+        self._slots = None
+        self._pending = 0
+        self._waiting = 0
+
+        metrics.register_gauge(f"executor_{name}", self.stats)
+
+    def _get_executor(self):
+        """Creates the executor on first use."""
+        if self._executor is None:
+            if self.kind == "process":
+                # Spawn keeps the workers clear of the parent's threads and loaded model
+                self._executor = ProcessPoolExecutor(
+                    max_workers=self.workers,
+                    mp_context=multiprocessing.get_context("spawn"),
+                )
+            else:
+                self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix=f"{self.name}-pool")
+        return self._executor
+
+    async def run(self, func, *args, **kwargs):
+        """Runs a blocking function in the pool and waits for its result."""
+        if self._slots is None:
+            self._slots = asyncio.Semaphore(self.capacity)
+
+        self._waiting += 1
+        try:
+            await self._slots.acquire()
+        finally:
+            self._waiting -= 1
+
+        self._pending += 1
+        try:
+            loop = asyncio.get_running_loop()
+            return await loop.run_in_executor(self._get_executor(), functools.partial(func, *args, **kwargs))
+        finally:
+            self._pending -= 1
+            self._slots.release()
+
+    def stats(self):
+        """Returns the pool's size and how saturated its queue is."""
+        running = min(self._pending, self.workers)
+        return {
+            "kind": self.kind,
+            "workers": self.workers,
+            "capacity": self.capacity,
+            "running": running,
+            "queued": self._pending - running,
+            "waiting": self._waiting,
+            "saturation": round((self._pending + self._waiting) / self.capacity, 3),
+        }
+
+    def shutdown(self):
+        """Shuts down the executor."""
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+
+
+io_pool = BoundedPool("io", IO_EXECUTOR_WORKERS)
+db_pool = BoundedPool("db", DB_EXECUTOR_WORKERS)
+cpu_pool = BoundedPool("cpu", CPU_EXECUTOR_WORKERS)
+inference_pool = BoundedPool("inference", INFERENCE_EXECUTOR_WORKERS, kind=INFERENCE_EXECUTOR)
+hash_pool = BoundedPool("hash", HASH_EXECUTOR_WORKERS, max_queue=HASH_MAX_QUEUE)
+
+
+async def run_io(func, *args, **kwargs):
+    """Runs blocking network I/O (e.g. Places and Mailgun calls)."""
+    return await io_pool.run(func, *args, **kwargs)
+
+
+async def run_db(func, *args, **kwargs):
+    """Runs blocking database work."""
+    return await db_pool.run(func, *args, **kwargs)
+
+
+async def run_cpu(func, *args, **kwargs):
+    """Runs CPU-bound work."""
+    return await cpu_pool.run(func, *args, **kwargs)
+
+
+async def run_inference(func, *args, **kwargs):
+    """Runs model inference, in a thread or a separate process depending on INFERENCE_EXECUTOR."""
+    return await inference_pool.run(func, *args, **kwargs)
+
+
+async def run_hash(func, *args, **kwargs):
+    """Runs password hashing on its own pool, so logins queue behind each other rather than other CPU work."""
+    return await hash_pool.run(func, *args, **kwargs)
+
+
+def shutdown_executors():
+    """Shuts down every pool."""
+    for pool in (io_pool, db_pool, cpu_pool, inference_pool, hash_pool):
+        pool.shutdown()
@@ -0,0 +1,185 @@
+import os
+import random
+import threading
+import time
+import requests
+from requests.adapters import HTTPAdapter
+from dotenv import load_dotenv
+from utils import metrics
+from utils.executors import run_io
+
+load_dotenv()
+
+# Keep-alive connections kept per host, and the most that may be open to one host at once
+HTTP_POOL_CONNECTIONS = int(os.getenv("HTTP_POOL_CONNECTIONS", "4"))
+HTTP_POOL_MAXSIZE = int(os.getenv("HTTP_POOL_MAXSIZE", "16"))
+HTTP_CONNECT_TIMEOUT = float(os.getenv("HTTP_CONNECT_TIMEOUT", "3.05"))
+HTTP_READ_TIMEOUT = float(os.getenv("HTTP_READ_TIMEOUT", "10"))
+HTTP_MAX_RETRIES = int(os.getenv("HTTP_MAX_RETRIES", "2"))
+HTTP_BACKOFF_BASE = float(os.getenv("HTTP_BACKOFF_BASE", "0.2"))
+HTTP_BACKOFF_MAX = float(os.getenv("HTTP_BACKOFF_MAX", "2"))
+CIRCUIT_FAILURE_THRESHOLD = int(os.getenv("CIRCUIT_FAILURE_THRESHOLD", "5"))
+CIRCUIT_RESET_TIMEOUT = float(os.getenv("CIRCUIT_RESET_TIMEOUT", "30"))
+
+RETRYABLE_STATUS_CODES = {429, 500, 502, 503, 504}
+
+
+class UpstreamError(Exception):
+    """Raised when an upstream call fails after its retries."""
+
+
+class CircuitOpenError(UpstreamError):
+    """Raised without calling the upstream while its circuit breaker is open."""
+
+
+class CircuitBreaker:
+    """
+    Stops calling an upstream after `failure_threshold` consecutive failures.
+    After `reset_timeout` seconds one trial call is let through, and a success closes the circuit again.
+    """
+
+    def __init__(self, name, failure_threshold=CIRCUIT_FAILURE_THRESHOLD, reset_timeout=CIRCUIT_RESET_TIMEOUT):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self._lock = threading.Lock()
+        self._failures = 0
+        self._opened_at = None
+        self._trial_running = False
+
+    @property
+    def state(self):
+        with self._lock:
+            return self._state()
+
+    def _state(self):
+        if self._opened_at is None:
+            return "closed"
+        if time.monotonic() - self._opened_at >= self.reset_timeout:
+            return "half_open"
+        return "open"
+
+    def allow(self):
+        """Checks if a call may go through."""
+        with self._lock:
+            state = self._state()
+            if state == "closed":
+                return True
+            if state == "half_open" and not self._trial_running:
+                self._trial_running = True
+                return True
+            return False
+
+    def record_success(self):
+        with self._lock:
+            self._failures = 0
+            self._opened_at = None
+            self._trial_running = False
+
+    def record_failure(self):
+        with self._lock:
+            self._failures += 1
+            if self._trial_running or self._failures >= self.failure_threshold:
+                if self._opened_at is None or self._trial_running:
+                    metrics.increment(f"http_{self.name}_circuit_opened_total")
+                self._opened_at = time.monotonic()
+            self._trial_running = False
+
+
+class UpstreamClient:
+    """Keep-alive HTTP client for one upstream, with timeouts, jittered retries and a circuit breaker."""
+
+    def __init__(self, name, max_retries=HTTP_MAX_RETRIES):
+        self.name = name
+        self.max_retries = max_retries
+        self.breaker = CircuitBreaker(name)
+
+        # pool_block caps the connections open to a host instead of opening extra ones under load
+        adapter = HTTPAdapter(pool_connections=HTTP_POOL_CONNECTIONS, pool_maxsize=HTTP_POOL_MAXSIZE, pool_block=True, max_retries=0)
+        self.session = requests.Session()
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+
+        metrics.register_gauge(f"http_{name}_circuit", lambda: self.breaker.state)
+
+    def _backoff(self, attempt):
+        """Full-jitter exponential backoff."""
+        time.sleep(random.uniform(0, min(HTTP_BACKOFF_MAX, HTTP_BACKOFF_BASE * 2 ** attempt)))
+
+    def request(self, method, url, retry_if=None, **kwargs):
+        """
+        Sends a request and returns the response.
+        `retry_if(response)` can mark otherwise successful responses as retryable (e.g. Places' OVER_QUERY_LIMIT).
+        Raises UpstreamError once retries are exhausted and CircuitOpenError while the circuit is open.
+        """
+        kwargs.setdefault("timeout", (HTTP_CONNECT_TIMEOUT, HTTP_READ_TIMEOUT))
+
+        for attempt in range(self.max_retries + 1):
+            if not self.breaker.allow():
+                metrics.increment(f"http_{self.name}_short_circuited_total")
+                raise CircuitOpenError(f"Circuit for {self.name} is open")
+
+            started = time.perf_counter()
+            error = None
+            response = None
+            try:
+                try:
+                    response = self.session.request(method, url, **kwargs)
+                except requests.RequestException as e:
+                    error = e
+                metrics.observe(f"http_{self.name}_latency_ms", (time.perf_counter() - started) * 1000)
+
+                retryable = error is not None or response.status_code in RETRYABLE_STATUS_CODES
+                if not retryable and retry_if is not None:
+                    try:
+                        retryable = retry_if(response)
+                    except ValueError:
+                        retryable = False
+            except BaseException:
+                # Any other error still counts as a failure, so a half-open trial never stays in flight
+                self.breaker.record_failure()
+                raise
+
+            if not retryable:
+                self.breaker.record_success()
+                metrics.increment(f"http_{self.name}_requests_total")
+                return response
+
+            self.breaker.record_failure()
+            metrics.increment(f"http_{self.name}_retryable_failures_total")
+            if attempt < self.max_retries:
+                self._backoff(attempt)
+                continue
+
+            # Out of retries: hand back the last response if there was one so callers can inspect it
+            if response is not None:
+                return response
+            raise UpstreamError(f"Request to {self.name} failed: {error}")
+
+    def get(self, url, **kwargs):
+        return self.request("GET", url, **kwargs)
+
+    def post(self, url, **kwargs):
+        return self.request("POST", url, **kwargs)
+
+    async def request_async(self, method, url, **kwargs):
+        """Sends a request on the I/O thread pool without blocking the event loop."""
+        return await run_io(self.request, method, url, **kwargs)
+
+    async def get_async(self, url, **kwargs):
+        return await self.request_async("GET", url, **kwargs)
+
+    async def post_async(self, url, **kwargs):
+        return await self.request_async("POST", url, **kwargs)
+
+
+_clients = {}
+_clients_lock = threading.Lock()
+
+
+def get_client(name):
+    """Returns the shared client for an upstream."""
+    with _clients_lock:
+        if name not in _clients:
+            _clients[name] = UpstreamClient(name)
+        return _clients[name]
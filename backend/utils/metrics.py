@@ -0,0 +1,72 @@
+import threading
+
+# Default histogram buckets, in milliseconds
+DEFAULT_BUCKETS = [1, 2, 5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000]
+
+_lock = threading.Lock()
+_counters = {}
+_gauges = {}
+_gauge_callbacks = {}
+_histograms = {}
+
+
+def increment(name, value=1):
+    """Increases a counter by the given value."""
+    with _lock:
+        _counters[name] = _counters.get(name, 0) + value
+
+
+def set_gauge(name, value):
+    """Sets a gauge to the given value."""
+    with _lock:
+        _gauges[name] = value
+
+
+def register_gauge(name, callback):
+    """Registers a gauge whose value is read from a callback whenever metrics are collected."""
+    with _lock:
+        _gauge_callbacks[name] = callback
+
+
+def observe(name, value, buckets=None):
+    """Records a value in a histogram."""
+    with _lock:
+        histogram = _histograms.get(name)
+        if histogram is None:
+            histogram = {
+                "count": 0,
+                "sum": 0.0,
+                "min": None,
+                "max": None,
+                "buckets": {str(bound): 0 for bound in (buckets or DEFAULT_BUCKETS)},
+            }
+            _histograms[name] = histogram
+
+        histogram["count"] += 1
+        histogram["sum"] += value
+        histogram["min"] = value if histogram["min"] is None else min(histogram["min"], value)
+        histogram["max"] = value if histogram["max"] is None else max(histogram["max"], value)
+        for bound in histogram["buckets"]:
+            if value <= float(bound):
+                histogram["buckets"][bound] += 1
+
+
+def snapshot():
+    """Returns a copy of every counter, gauge and histogram."""
+    with _lock:
+        gauges = dict(_gauges)
+        callbacks = dict(_gauge_callbacks)
+        counters = dict(_counters)
+        histograms = {}
+        for name, histogram in _histograms.items():
+            histograms[name] = dict(histogram, buckets=dict(histogram["buckets"]))
+            histograms[name]["avg"] = histogram["sum"] / histogram["count"] if histogram["count"] else 0.0
+
+    # Callbacks run outside the lock since they may read other subsystems
+    for name, callback in callbacks.items():
+        try:
+            gauges[name] = callback()
+        except Exception as e:
+            print(f"Error reading gauge {name}: {e}")
+
+    return {"counters": counters, "gauges": gauges, "histograms": histograms}
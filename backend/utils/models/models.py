@@ -1,5 +1,5 @@
-from pydantic import BaseModel
-from typing import List, Optional
+from pydantic import BaseModel, Field
+from typing import List, Optional, Dict, Any, Union
 
 class RegisterRequest(BaseModel):
     first_name: str
@@ -128,9 +128,11 @@ class VerifyTokenResponse(BaseModel):
 class LocationDetails(BaseModel):
     latitude: float
     longitude: float
-    height: int
-    steps: int
-    location_type: str
+    height: int = Field(gt=0)
+    steps: int = Field(gt=0)
+    location_type: Union[str, List[str]]
+    # rating, distance, weighted or model; the deployment's RECOMMENDER_STRATEGY when not given
+    strategy: Optional[str] = None
 
     class Config:
         json_schema_extra = {
@@ -153,6 +155,8 @@ class ApiResponseItem(BaseModel):
 class ApiResponse(BaseModel):
     api_response: List[ApiResponseItem]
     llm_recommendation: str
+    recommendation_strategy: Optional[str] = None
+    metadata: Optional[Dict[str, Any]] = None
 
 class LocationDetailsResponse(BaseModel):
     response: ApiResponse
@@ -184,7 +188,13 @@ class LocationDetailsResponse(BaseModel):
                             "url": "https://www.google.com/maps/place/?q=place_id:ChIJq6rqyDF0hlQRXLjveZ83HR8"
                         }
                     ],
-                    "llm_recommendation": "Bobolink Park"
+                    "llm_recommendation": "Bobolink Park",
+                    "recommendation_strategy": "rating",
+                    "metadata": {
+                        "place_types": {
+                            "park": {"status": "OK", "results": 20, "latency_ms": 182.4}
+                        }
+                    }
                 }
             }
         }
@@ -196,6 +206,7 @@ class EndpointStatsResponse(BaseModel):
 
 class EndpointStatsListResponse(BaseModel):
     endpoints: List[EndpointStatsResponse]
+    next_cursor: Optional[str] = None
     
     class Config:
         json_schema_extra = {
@@ -228,6 +239,7 @@ class ApiUsageResponse(BaseModel):
     
 class ApiUsageListResponse(BaseModel):
     users: List[ApiUsageResponse]
+    next_cursor: Optional[str] = None
     
     class Config:
         json_schema_extra = {
@@ -278,3 +290,78 @@ class DeleteAccountResponse(BaseModel):
                 "message": "Account deleted successfully"
             }
         }
+
+class ModelStatusResponse(BaseModel):
+    state: str
+    model_id: Optional[str] = None
+    backend: Optional[str] = None
+    loaded_at: Optional[str] = None
+    error: Optional[str] = None
+
+    class Config:
+        # model_id is the API's field name, not a pydantic method
+        protected_namespaces = ()
+        json_schema_extra = {
+            "example": {
+                "state": "ready",
+                "model_id": "deepset/roberta-base-squad2",
+                "backend": "torch",
+                "loaded_at": "2024-11-20T18:25:43.511000",
+                "error": None
+            }
+        }
+
+class ModelReloadRequest(BaseModel):
+    model_id: Optional[str] = None
+
+    class Config:
+        # model_id is the API's field name, not a pydantic method
+        protected_namespaces = ()
+        json_schema_extra = {
+            "example": {
+                "model_id": "deepset/roberta-base-squad2"
+            }
+        }
+
+class MetricsResponse(BaseModel):
+    counters: Dict[str, float]
+    gauges: Dict[str, Any]
+    histograms: Dict[str, Dict[str, Any]]
+
+    class Config:
+        json_schema_extra = {
+            "example": {
+                "counters": {"inference_batches_total": 12, "inference_requests_total": 30},
+                "gauges": {"inference_queue_depth": 0},
+                "histograms": {
+                    "inference_batch_fill_ratio": {
+                        "count": 12, "sum": 3.75, "min": 0.125, "max": 0.5, "avg": 0.3125,
+                        "buckets": {"0.25": 5, "0.5": 12, "0.75": 12, "1.0": 12}
+                    }
+                }
+            }
+        }
+
+class JobResponse(BaseModel):
+    job_id: str
+    status: str
+    priority: int
+    created_at: str
+    started_at: Optional[str] = None
+    finished_at: Optional[str] = None
+    result: Optional[ApiResponse] = None
+    error: Optional[str] = None
+
+    class Config:
+        json_schema_extra = {
+            "example": {
+                "job_id": "3f2b9c1e8a7d4f6b9e0c1d2a3b4c5d6e",
+                "status": "queued",
+                "priority": 0,
+                "created_at": "2024-11-20T18:25:43.511000",
+                "started_at": None,
+                "finished_at": None,
+                "result": None,
+                "error": None
+            }
+        }
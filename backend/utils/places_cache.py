@@ -0,0 +1,176 @@
+import hashlib
+import json
+import math
+import os
+import time
+from dotenv import load_dotenv
+from utils.ttl_cache import TTLCache
+
+load_dotenv()
+
+# Geohash precision of a cache cell (6 is roughly 1.2 km x 0.6 km)
+PLACES_CACHE_PRECISION = int(os.getenv("PLACES_CACHE_PRECISION", "6"))
+PLACES_CACHE_TTL = float(os.getenv("PLACES_CACHE_TTL", "1800"))
+PLACES_CACHE_SIZE = int(os.getenv("PLACES_CACHE_SIZE", "2000"))
+PLACES_CACHE_MAX_BYTES = int(os.getenv("PLACES_CACHE_MAX_BYTES", str(64 * 1024 * 1024)))
+# Optional directory for a persistent tier that survives restarts
+PLACES_CACHE_DIR = os.getenv("PLACES_CACHE_DIR")
+
+# Largest radius the Places API accepts, in metres
+PLACES_MAX_RADIUS = 50000
+
+# Search radii are rounded up to one of these, in metres
+RADIUS_BUCKETS = [250, 500, 1000, 2000, 3000, 5000, 7500, 10000, 15000, 20000, 30000, 40000, 50000]
+
+GEOHASH_ALPHABET = "0123456789bcdefghjkmnpqrstuvwxyz"
+EARTH_RADIUS = 6371000
+
+
+def geohash_encode(latitude, longitude, precision=PLACES_CACHE_PRECISION):
+    """Encodes a position as a geohash of the given length."""
+    lat_range = [-90.0, 90.0]
+    lng_range = [-180.0, 180.0]
+    geohash = []
+    bits = 0
+    bit_count = 0
+    even = True
+
+    while len(geohash) < precision:
+        value_range, value = (lng_range, longitude) if even else (lat_range, latitude)
+        middle = (value_range[0] + value_range[1]) / 2
+        bits <<= 1
+        if value >= middle:
+            bits |= 1
+            value_range[0] = middle
+        else:
+            value_range[1] = middle
+        even = not even
+        bit_count += 1
+        if bit_count == 5:
+            geohash.append(GEOHASH_ALPHABET[bits])
+            bits = 0
+            bit_count = 0
+
+    return "".join(geohash)
+
+
+def geohash_bounds(geohash):
+    """Returns the (min_lat, max_lat, min_lng, max_lng) box covered by a geohash."""
+    lat_range = [-90.0, 90.0]
+    lng_range = [-180.0, 180.0]
+    even = True
+
+    for char in geohash:
+        bits = GEOHASH_ALPHABET.index(char)
+        for shift in range(4, -1, -1):
+            value_range = lng_range if even else lat_range
+            middle = (value_range[0] + value_range[1]) / 2
+            if bits >> shift & 1:
+                value_range[0] = middle
+            else:
+                value_range[1] = middle
+            even = not even
+
+    return lat_range[0], lat_range[1], lng_range[0], lng_range[1]
+
+
+def cell_center_and_reach(geohash):
+    """Returns a cell's centre and the distance in metres from its centre to its farthest corner."""
+    min_lat, max_lat, min_lng, max_lng = geohash_bounds(geohash)
+    center_lat = (min_lat + max_lat) / 2
+    center_lng = (min_lng + max_lng) / 2
+
+    # Equirectangular approximation is plenty at cell scale
+    half_height = math.radians(max_lat - min_lat) / 2 * EARTH_RADIUS
+    half_width = math.radians(max_lng - min_lng) / 2 * EARTH_RADIUS * math.cos(math.radians(max(abs(min_lat), abs(max_lat))))
+    return (center_lat, center_lng), math.hypot(half_height, half_width)
+
+
+def bucket_radius(radius):
+    """Rounds a search radius up to its bucket."""
+    for bucket in RADIUS_BUCKETS:
+        if radius <= bucket:
+            return bucket
+    return RADIUS_BUCKETS[-1]
+
+
+def cache_query(latitude, longitude, search_radius, place_type):
+    """
+    Returns the cache key and the Places query (centre and radius) to run on a miss.
+    The query is centred on the cell and widened by the cell's reach, so its results
+    cover a search of up to the bucketed radius from anywhere in the cell.
+    """
+    cell = geohash_encode(latitude, longitude)
+    radius_bucket = bucket_radius(search_radius)
+    center, reach = cell_center_and_reach(cell)
+    query_radius = min(radius_bucket + reach, PLACES_MAX_RADIUS)
+    return (cell, place_type, radius_bucket), center, query_radius
+
+
+def _sizeof(data):
+    """Approximate memory used by a cached response."""
+    return len(json.dumps(data))
+
+
+_memory = TTLCache(PLACES_CACHE_SIZE, PLACES_CACHE_TTL, name="places_cache", max_bytes=PLACES_CACHE_MAX_BYTES, sizeof=_sizeof)
+
+
+def _disk_path(key):
+    """File holding a key's entry in the persistent tier."""
+    digest = hashlib.sha256(json.dumps(key).encode()).hexdigest()
+    return os.path.join(PLACES_CACHE_DIR, f"{digest}.json")
+
+
+def _read_disk(key):
+    """Reads a live entry from the persistent tier."""
+    if not PLACES_CACHE_DIR:
+        return None
+    try:
+        with open(_disk_path(key)) as file:
+            entry = json.load(file)
+    except (OSError, ValueError):
+        return None
+
+    remaining = entry["expires_at"] - time.time()
+    if remaining <= 0:
+        try:
+            os.remove(_disk_path(key))
+        except OSError:
+            pass
+        return None
+    return entry["data"], remaining
+
+
+def _write_disk(key, data):
+    """Writes an entry to the persistent tier."""
+    if not PLACES_CACHE_DIR:
+        return
+    try:
+        os.makedirs(PLACES_CACHE_DIR, exist_ok=True)
+        path = _disk_path(key)
+        # Write to a temporary file first so readers never see a partial entry
+        with open(f"{path}.tmp", "w") as file:
+            json.dump({"expires_at": time.time() + PLACES_CACHE_TTL, "data": data}, file)
+        os.replace(f"{path}.tmp", path)
+    except OSError as e:
+        print(f"Error writing places cache entry: {e}")
+
+
+def get_cached_places(key):
+    """Returns a cached raw Places response, checking memory first and then disk."""
+    data = _memory.get(key)
+    if data is not None:
+        return data
+
+    entry = _read_disk(key)
+    if entry is not None:
+        data, remaining = entry
+        _memory.set(key, data, ttl=remaining)
+        return data
+    return None
+
+
+def cache_places(key, data):
+    """Caches a raw Places response."""
+    _memory.set(key, data)
+    _write_disk(key, data)
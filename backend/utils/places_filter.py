@@ -1,23 +1,129 @@
-from geopy.distance import geodesic
+import os
+import numpy as np
+from dotenv import load_dotenv
 
-def filter_places_by_radius(center, data, search_radius, tolerance=100):
+load_dotenv()
+
+# haversine (fast, spherical) or ellipsoidal (WGS-84, within millimetres of geopy's geodesic)
+PLACES_DISTANCE_METHOD = os.getenv("PLACES_DISTANCE_METHOD", "haversine")
+# Number of places returned
+PLACES_TOP_K = int(os.getenv("PLACES_TOP_K", "3"))
+# How places with the same rating are ordered: order (as Places returned them) or target_distance (closest to the step goal first)
+PLACES_TIE_BREAK = os.getenv("PLACES_TIE_BREAK", "order")
+
+PLACE_URL = "https://www.google.com/maps/place/?q=place_id:"
+
+EARTH_RADIUS = 6371008.8
+# WGS-84 ellipsoid
+WGS84_A = 6378137.0
+WGS84_F = 1 / 298.257223563
+WGS84_B = WGS84_A * (1 - WGS84_F)
+
+
+def haversine_distances(center, latitudes, longitudes):
+    """Great-circle distances in metres from a centre point to arrays of positions."""
+    lat1, lng1 = np.radians(center[0]), np.radians(center[1])
+    lat2, lng2 = np.radians(latitudes), np.radians(longitudes)
+
+    a = np.sin((lat2 - lat1) / 2) ** 2 + np.cos(lat1) * np.cos(lat2) * np.sin((lng2 - lng1) / 2) ** 2
+    return 2 * EARTH_RADIUS * np.arcsin(np.sqrt(np.clip(a, 0.0, 1.0)))
+
+
+def ellipsoidal_distances(center, latitudes, longitudes, iterations=20):
+    """Distances in metres on the WGS-84 ellipsoid (Vincenty's inverse formula), computed for all positions at once."""
+    lat1 = np.radians(center[0])
+    lat2 = np.radians(np.asarray(latitudes, dtype=float))
+    L = np.radians(np.asarray(longitudes, dtype=float) - center[1])
+
+    U1 = np.arctan((1 - WGS84_F) * np.tan(lat1))
+    U2 = np.arctan((1 - WGS84_F) * np.tan(lat2))
+    sin_U1, cos_U1 = np.sin(U1), np.cos(U1)
+    sin_U2, cos_U2 = np.sin(U2), np.cos(U2)
+
+    lam = L.copy()
+    with np.errstate(invalid="ignore", divide="ignore"):
+        for _ in range(iterations):
+            sin_lam, cos_lam = np.sin(lam), np.cos(lam)
+            sin_sigma = np.sqrt((cos_U2 * sin_lam) ** 2 + (cos_U1 * sin_U2 - sin_U1 * cos_U2 * cos_lam) ** 2)
+            cos_sigma = sin_U1 * sin_U2 + cos_U1 * cos_U2 * cos_lam
+            sigma = np.arctan2(sin_sigma, cos_sigma)
+            sin_alpha = np.where(sin_sigma == 0, 0.0, cos_U1 * cos_U2 * sin_lam / sin_sigma)
+            cos2_alpha = 1 - sin_alpha ** 2
+            cos_2sigma_m = np.where(cos2_alpha == 0, 0.0, cos_sigma - 2 * sin_U1 * sin_U2 / cos2_alpha)
+            C = WGS84_F / 16 * cos2_alpha * (4 + WGS84_F * (4 - 3 * cos2_alpha))
+            previous = lam
+            lam = L + (1 - C) * WGS84_F * sin_alpha * (
+                sigma + C * sin_sigma * (cos_2sigma_m + C * cos_sigma * (-1 + 2 * cos_2sigma_m ** 2))
+            )
+            if np.all(np.abs(lam - previous) < 1e-12):
+                break
+
+        u2 = cos2_alpha * (WGS84_A ** 2 - WGS84_B ** 2) / WGS84_B ** 2
+        A = 1 + u2 / 16384 * (4096 + u2 * (-768 + u2 * (320 - 175 * u2)))
+        B = u2 / 1024 * (256 + u2 * (-128 + u2 * (74 - 47 * u2)))
+        delta_sigma = B * sin_sigma * (cos_2sigma_m + B / 4 * (
+            cos_sigma * (-1 + 2 * cos_2sigma_m ** 2)
+            - B / 6 * cos_2sigma_m * (-3 + 4 * sin_sigma ** 2) * (-3 + 4 * cos_2sigma_m ** 2)
+        ))
+        distances = WGS84_B * A * (sigma - delta_sigma)
+
+    # Coincident points
+    return np.where(sin_sigma == 0, 0.0, distances)
+
+
+DISTANCE_METHODS = {
+    "haversine": haversine_distances,
+    "ellipsoidal": ellipsoidal_distances,
+}
+
+
+def top_k_indices(ratings, k, tie_key=None):
+    """
+    Indices of the `k` highest ratings, best first.
+    Uses a partial sort so only the places that can make the top-k get fully sorted.
+    Ties are ordered by `tie_key` (ascending), then by position.
+    """
+    count = len(ratings)
+    if count == 0 or k <= 0:
+        return np.empty(0, dtype=int)
+
+    if count > k:
+        # Rating of the k-th best place; everything at or above it is a candidate (ties included)
+        threshold = np.partition(ratings, count - k)[count - k]
+        candidates = np.flatnonzero(ratings >= threshold)
+    else:
+        candidates = np.arange(count)
+
+    keys = [candidates, -ratings[candidates]]
+    if tie_key is not None:
+        keys.insert(1, tie_key[candidates])
+    # np.lexsort sorts by the last key first
+    order = np.lexsort(keys)
+    return candidates[order][:k]
+
+
+def filter_places_by_radius(center, data, search_radius, tolerance=100, top_k=PLACES_TOP_K, method=None, target_distance=None, tie_break=PLACES_TIE_BREAK):
     """Filter places based on distance from a central point."""
-    results_within_radius = []
+    # Only places with a rating can be ranked
+    places = [place for place in data["results"] if place.get("rating") is not None]
+    if not places:
+        return []
+
+    latitudes = np.fromiter((place["geometry"]["location"]["lat"] for place in places), dtype=float, count=len(places))
+    longitudes = np.fromiter((place["geometry"]["location"]["lng"] for place in places), dtype=float, count=len(places))
+    ratings = np.fromiter((place["rating"] for place in places), dtype=float, count=len(places))
 
-    for place in data["results"]:
-        place_coord = (place["geometry"]["location"]["lat"], place["geometry"]["location"]["lng"])
-        distance = geodesic(center, place_coord).meters
+    distances = DISTANCE_METHODS[method or PLACES_DISTANCE_METHOD](center, latitudes, longitudes)
+    within = np.flatnonzero(distances <= search_radius + tolerance)
 
-        if distance <= search_radius + tolerance:
-            
-            # Ensure 'rating' key exists before accessing it
-            rating = place.get('rating', None)
-            if rating is not None:
-                url = "https://www.google.com/maps/place/?q=place_id:"
-                place_url = f'{url}{place["place_id"]}'
-                results_within_radius.append((place['name'], place['vicinity'], distance, rating, place_url))
+    tie_key = None
+    if tie_break == "target_distance" and target_distance is not None:
+        tie_key = np.abs(distances[within] - target_distance)
 
-    # Sort the results by rating in descending order and retrieve the top three
-    top_three_places = sorted(results_within_radius, key=lambda x: x[3], reverse=True)[:3]
+    # Retrieve the top k places by rating
+    top = within[top_k_indices(ratings[within], top_k, tie_key)]
 
-    return top_three_places
+    return [
+        (places[i]["name"], places[i]["vicinity"], float(distances[i]), places[i]["rating"], f'{PLACE_URL}{places[i]["place_id"]}')
+        for i in top
+    ]
@@ -0,0 +1,91 @@
+import asyncio
+import os
+from dotenv import load_dotenv
+from utils.async_db import get_api_usage_data_for_user, FREE_LLM_API_CALLS
+from utils.ttl_cache import TTLCache
+from utils.usage_buffer import usage_buffer
+
+load_dotenv()
+
+# Reject /api/v1/llm calls beyond the free allowance (admins are exempt)
+LLM_QUOTA_ENFORCE = os.getenv("LLM_QUOTA_ENFORCE", "true").lower() == "true"
+QUOTA_CACHE_TTL = float(os.getenv("QUOTA_CACHE_TTL", "300"))
+QUOTA_CACHE_SIZE = int(os.getenv("QUOTA_CACHE_SIZE", "10000"))
+
+# User id -> [LLM calls used]. Loaded from the database once per TTL and counted up locally in between,
+# so checking a quota doesn't need a query. Each worker counts its own calls, so with several
+# workers a user can go over by a few calls until the entries are reloaded.
+quota_cache = TTLCache(QUOTA_CACHE_SIZE, QUOTA_CACHE_TTL, name="quota_cache")
+
+# User id -> task loading their count, shared by concurrent requests that miss the cache,
+# so they all end up counting on the same entry
+_loading = {}
+
+
+async def _load_counts(user_id):
+    usage = await get_api_usage_data_for_user(user_id)
+    counts = [(usage or {}).get("llm_api_calls", 0) + usage_buffer.pending_user_counts(user_id)[1]]
+    quota_cache.set(user_id, counts)
+    return counts
+
+
+async def _quota_counts(user_id):
+    """Returns a user's cached [LLM calls used], loading it once however many requests miss at the same time."""
+    counts = quota_cache.get(user_id)
+    if counts is not None:
+        return counts
+
+    task = _loading.get(user_id)
+    if task is None:
+        task = asyncio.ensure_future(_load_counts(user_id))
+        _loading[user_id] = task
+        task.add_done_callback(lambda _: _loading.pop(user_id, None))
+    # Shielded so one client disconnecting doesn't cancel the load for the others
+    return await asyncio.shield(task)
+
+
+async def llm_calls_used(user_id):
+    """Returns how many LLM calls a user has made, including ones not yet written to the database."""
+    return (await _quota_counts(user_id))[0]
+
+
+async def reserve_llm_call(user):
+    """
+    Checks a user's quota and counts the call against it in one step.
+    Returns (allowed, free calls remaining after this call).
+    """
+    counts = await _quota_counts(user["id"])
+    # Nothing is awaited from here on, so concurrent requests can't pass on the same count
+    remaining = max(FREE_LLM_API_CALLS - counts[0], 0)
+    allowed = remaining > 0 or not LLM_QUOTA_ENFORCE or bool(user.get("is_admin"))
+    if allowed:
+        counts[0] += 1
+        remaining = max(remaining - 1, 0)
+    return allowed, remaining
+
+
+async def release_llm_call(user_id):
+    """Gives back a call reserved for a request that failed, in the cache and in the usage counts."""
+    counts = quota_cache.get(user_id)
+    if counts is not None and counts[0] > 0:
+        counts[0] -= 1
+    await usage_buffer.refund_llm_call(user_id)
+
+
+async def check_llm_quota(user):
+    """Returns (allowed, free calls remaining) for a user's next LLM call, without counting it."""
+    remaining = max(FREE_LLM_API_CALLS - await llm_calls_used(user["id"]), 0)
+    allowed = remaining > 0 or not LLM_QUOTA_ENFORCE or bool(user.get("is_admin"))
+    return allowed, remaining
+
+
+async def pays_for_llm_calls(user):
+    """Checks if a user's LLM calls have gone past the free allowance, and so are paid for."""
+    return not user.get("is_admin") and await llm_calls_used(user["id"]) > FREE_LLM_API_CALLS
+
+
+def quota_headers(remaining):
+    return {
+        "X-Quota-Limit": str(FREE_LLM_API_CALLS),
+        "X-Quota-Remaining": str(remaining),
+    }
@@ -0,0 +1,165 @@
+import math
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict, namedtuple
+from dotenv import load_dotenv
+from utils import metrics
+from utils.executors import run_io
+
+load_dotenv()
+
+RATE_LIMIT_ENABLED = os.getenv("RATE_LIMIT_ENABLED", "true").lower() == "true"
+# memory (per worker process) or sqlite (shared by every worker on the host through RATE_LIMIT_SQLITE_PATH)
+RATE_LIMIT_BACKEND = os.getenv("RATE_LIMIT_BACKEND", "memory")
+RATE_LIMIT_SQLITE_PATH = os.getenv("RATE_LIMIT_SQLITE_PATH", "rate_limits.db")
+# Requests per minute and burst size for every endpoint, and separately for /api/v1/llm
+RATE_LIMIT_PER_MINUTE = float(os.getenv("RATE_LIMIT_PER_MINUTE", "120"))
+RATE_LIMIT_BURST = int(os.getenv("RATE_LIMIT_BURST", "40"))
+LLM_RATE_LIMIT_PER_MINUTE = float(os.getenv("LLM_RATE_LIMIT_PER_MINUTE", "10"))
+LLM_RATE_LIMIT_BURST = int(os.getenv("LLM_RATE_LIMIT_BURST", "5"))
+# Buckets kept by the memory backend; the least recently used are dropped (and start full again)
+RATE_LIMIT_MAX_KEYS = int(os.getenv("RATE_LIMIT_MAX_KEYS", "100000"))
+# Use the first X-Forwarded-For address as the client IP, only behind a trusted proxy
+RATE_LIMIT_TRUST_FORWARDED = os.getenv("RATE_LIMIT_TRUST_FORWARDED", "false").lower() == "true"
+
+
+class RateLimitResult(namedtuple("RateLimitResult", "allowed limit remaining reset retry_after")):
+    """Outcome of taking a token. `reset` and `retry_after` are in seconds."""
+
+    def headers(self):
+        headers = {
+            "X-RateLimit-Limit": str(self.limit),
+            "X-RateLimit-Remaining": str(self.remaining),
+            "X-RateLimit-Reset": str(self.reset),
+        }
+        if not self.allowed:
+            headers["Retry-After"] = str(self.retry_after)
+        return headers
+
+
+def _refill(tokens, updated, now, rate, burst, cost):
+    """Token bucket step: returns (allowed, tokens left, RateLimitResult)."""
+    tokens = min(burst, tokens + (now - updated) * rate)
+    allowed = tokens >= cost
+    if allowed:
+        tokens -= cost
+    retry_after = 0 if allowed else math.ceil((cost - tokens) / rate)
+    reset = math.ceil((burst - tokens) / rate)
+    return tokens, RateLimitResult(allowed, burst, int(tokens), reset, retry_after)
+
+
+class MemoryBucketStore:
+    """Token buckets in this process's memory."""
+
+    def __init__(self, max_keys=RATE_LIMIT_MAX_KEYS):
+        self.max_keys = max_keys
+        self._buckets = OrderedDict()   # key -> (tokens, updated)
+        self._lock = threading.Lock()
+
+    def take_now(self, key, rate, burst, cost=1):
+        now = time.monotonic()
+        with self._lock:
+            tokens, updated = self._buckets.get(key, (burst, now))
+            tokens, result = _refill(tokens, updated, now, rate, burst, cost)
+            self._buckets[key] = (tokens, now)
+            self._buckets.move_to_end(key)
+            while len(self._buckets) > self.max_keys:
+                self._buckets.popitem(last=False)
+        return result
+
+    async def take(self, key, rate, burst, cost=1):
+        return self.take_now(key, rate, burst, cost)
+
+
+class SQLiteBucketStore:
+    """
+    Token buckets in a local SQLite file, so every worker on the host shares them.
+    Stands in for a shared store such as Redis.
+    """
+
+    def __init__(self, path=RATE_LIMIT_SQLITE_PATH):
+        self.path = path
+        self._local = threading.local()
+
+    def _connection(self):
+        connection = getattr(self._local, "connection", None)
+        if connection is None:
+            connection = sqlite3.connect(self.path, timeout=5, isolation_level=None)
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.execute(
+                "CREATE TABLE IF NOT EXISTS rate_limit_buckets (key TEXT PRIMARY KEY, tokens REAL NOT NULL, updated REAL NOT NULL)"
+            )
+            self._local.connection = connection
+        return connection
+
+    def take_now(self, key, rate, burst, cost=1):
+        # Wall-clock time, since the buckets are shared between processes
+        now = time.time()
+        connection = self._connection()
+        connection.execute("BEGIN IMMEDIATE")
+        try:
+            row = connection.execute("SELECT tokens, updated FROM rate_limit_buckets WHERE key = ?", (key,)).fetchone()
+            tokens, updated = row if row else (burst, now)
+            tokens, result = _refill(tokens, updated, now, rate, burst, cost)
+            connection.execute(
+                "INSERT INTO rate_limit_buckets (key, tokens, updated) VALUES (?, ?, ?) "
+                "ON CONFLICT(key) DO UPDATE SET tokens = excluded.tokens, updated = excluded.updated",
+                (key, tokens, now),
+            )
+            connection.execute("COMMIT")
+        except Exception:
+            connection.execute("ROLLBACK")
+            raise
+        return result
+
+    async def take(self, key, rate, burst, cost=1):
+        # The file lock may be contended, so don't wait for it on the event loop
+        return await run_io(self.take_now, key, rate, burst, cost)
+
+
+BACKENDS = {
+    "memory": MemoryBucketStore,
+    "sqlite": SQLiteBucketStore,
+}
+
+bucket_store = BACKENDS[RATE_LIMIT_BACKEND]()
+
+
+# Endpoints that run a Places search and the recommender
+LLM_PATHS = {"/api/v1/llm", "/api/v1/llm/stream", "/api/v1/jobs"}
+
+
+def is_llm_call(request):
+    """Checks if a request is an LLM call, which costs more and counts against the quota."""
+    return request.method == "POST" and request.url.path in LLM_PATHS
+
+
+def client_ip(request):
+    """The client's IP address."""
+    if RATE_LIMIT_TRUST_FORWARDED:
+        forwarded = request.headers.get("x-forwarded-for")
+        if forwarded:
+            return forwarded.split(",")[0].strip()
+    return request.client.host if request.client else "unknown"
+
+
+async def check_rate_limit(request, subject=None):
+    """
+    Takes a token for the request, keyed by the authenticated subject when there is one and by IP otherwise.
+    /api/v1/llm requests also take from a separate, stricter bucket.
+    Returns the most restrictive result, or None when rate limiting is off.
+    """
+    if not RATE_LIMIT_ENABLED:
+        return None
+
+    key = f"user:{subject}" if subject else f"ip:{client_ip(request)}"
+    result = await bucket_store.take(key, RATE_LIMIT_PER_MINUTE / 60, RATE_LIMIT_BURST)
+
+    if result.allowed and is_llm_call(request):
+        result = await bucket_store.take(f"llm:{key}", LLM_RATE_LIMIT_PER_MINUTE / 60, LLM_RATE_LIMIT_BURST)
+
+    if not result.allowed:
+        metrics.increment("rate_limited_total")
+    return result
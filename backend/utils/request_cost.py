@@ -0,0 +1,60 @@
+import os
+from dotenv import load_dotenv
+from utils import metrics
+from utils.places_cache import PLACES_MAX_RADIUS
+
+load_dotenv()
+
+# Ceilings on what one /api/v1/llm request may cost. Requests above them are served with less
+# (a smaller radius, fewer candidates or fewer searches) rather than rejected.
+MAX_SEARCH_RADIUS = min(float(os.getenv("MAX_SEARCH_RADIUS", str(PLACES_MAX_RADIUS))), PLACES_MAX_RADIUS)
+MAX_CANDIDATES = int(os.getenv("MAX_CANDIDATES", "200"))
+MAX_UPSTREAM_CALLS = int(os.getenv("MAX_UPSTREAM_CALLS", "6"))
+
+
+class RequestBudget:
+    """Tracks the effective limits of one request and what it has used."""
+
+    def __init__(self, requested_radius, max_radius=MAX_SEARCH_RADIUS, max_candidates=MAX_CANDIDATES, max_upstream_calls=MAX_UPSTREAM_CALLS):
+        self.requested_radius = requested_radius
+        self.radius = min(requested_radius, max_radius)
+        self.max_candidates = max_candidates
+        self.max_upstream_calls = max_upstream_calls
+        self.upstream_calls = 0
+        self.candidates = 0
+        self.degraded = []
+
+        if self.radius < requested_radius:
+            self._degrade("radius")
+
+    def _degrade(self, reason):
+        if reason not in self.degraded:
+            self.degraded.append(reason)
+            metrics.increment(f"request_cost_degraded_{reason}_total")
+
+    def take_upstream_call(self):
+        """Uses one upstream call. Returns False once the budget is spent."""
+        if self.upstream_calls >= self.max_upstream_calls:
+            self._degrade("upstream_calls")
+            return False
+        self.upstream_calls += 1
+        return True
+
+    def limit_candidates(self, places):
+        """Keeps at most `max_candidates` places, in the order Places ranked them."""
+        if len(places) > self.max_candidates:
+            self._degrade("candidates")
+            places = places[:self.max_candidates]
+        self.candidates = len(places)
+        return places
+
+    def as_metadata(self):
+        return {
+            "requested_radius": round(self.requested_radius, 2),
+            "radius": round(self.radius, 2),
+            "candidates": self.candidates,
+            "max_candidates": self.max_candidates,
+            "upstream_calls": self.upstream_calls,
+            "max_upstream_calls": self.max_upstream_calls,
+            "degraded": list(self.degraded),
+        }
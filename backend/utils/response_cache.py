@@ -0,0 +1,96 @@
+import asyncio
+import copy
+import os
+from dotenv import load_dotenv
+from utils import metrics
+from utils.ttl_cache import TTLCache
+
+load_dotenv()
+
+RESPONSE_CACHE_ENABLED = os.getenv("RESPONSE_CACHE_ENABLED", "true").lower() == "true"
+RESPONSE_CACHE_TTL = float(os.getenv("RESPONSE_CACHE_TTL", "120"))
+RESPONSE_CACHE_SIZE = int(os.getenv("RESPONSE_CACHE_SIZE", "1000"))
+# Decimal places kept from latitude/longitude, 4 is about 11 metres
+RESPONSE_CACHE_PRECISION = int(os.getenv("RESPONSE_CACHE_PRECISION", "4"))
+
+# Full /api/v1/llm responses keyed by request fingerprint
+response_cache = TTLCache(RESPONSE_CACHE_SIZE, RESPONSE_CACHE_TTL, name="llm_response_cache")
+
+# Fingerprint -> task computing that response, shared by identical concurrent requests
+_in_flight = {}
+
+
+def request_fingerprint(latitude, longitude, height, steps, location_type, strategy=None):
+    """Normalises a request so that equivalent ones share a key."""
+    place_types = (location_type,) if isinstance(location_type, str) else tuple(sorted(set(location_type)))
+    return (
+        round(latitude, RESPONSE_CACHE_PRECISION),
+        round(longitude, RESPONSE_CACHE_PRECISION),
+        height,
+        steps,
+        place_types,
+        strategy,
+    )
+
+
+def get_cached(key):
+    """Returns a copy of a cached response, or None."""
+    if not RESPONSE_CACHE_ENABLED:
+        return None
+    response = response_cache.get(key)
+    if response is None:
+        metrics.increment("llm_response_cache_misses_total")
+        return None
+    metrics.increment("llm_response_cache_hits_total")
+    return copy.deepcopy(response)
+
+
+def store(key, response):
+    """Caches a response built outside get_or_compute, e.g. by the streaming endpoint."""
+    if RESPONSE_CACHE_ENABLED and response.get("api_response"):
+        response_cache.set(key, copy.deepcopy(response))
+
+
+def _finish(key, task):
+    """Caches a finished computation and stops sharing it."""
+    _in_flight.pop(key, None)
+    if task.cancelled():
+        return
+    # Reading the exception marks it retrieved even if every waiter has gone
+    if task.exception() is not None:
+        return
+
+    response = task.result()
+    # Empty responses can come from an upstream failure, so they aren't kept
+    if response.get("api_response"):
+        response_cache.set(key, response)
+
+
+async def get_or_compute(key, compute):
+    """
+    Returns (response, status) for a fingerprint, where status is "hit", "coalesced" or "miss".
+    On a miss `compute()` runs once, however many identical requests are waiting on it.
+    Callers get their own copy of the response, so they may change it freely.
+    """
+    if not RESPONSE_CACHE_ENABLED:
+        return await compute(), "miss"
+
+    response = response_cache.get(key)
+    if response is not None:
+        metrics.increment("llm_response_cache_hits_total")
+        return copy.deepcopy(response), "hit"
+
+    task = _in_flight.get(key)
+    if task is not None:
+        status = "coalesced"
+        metrics.increment("llm_response_cache_coalesced_total")
+    else:
+        status = "miss"
+        metrics.increment("llm_response_cache_misses_total")
+        task = asyncio.ensure_future(compute())
+        _in_flight[key] = task
+        task.add_done_callback(lambda done: _finish(key, done))
+
+    # Shielded so one client disconnecting doesn't cancel the work for the others
+    response = await asyncio.shield(task)
+    return copy.deepcopy(response), status
@@ -0,0 +1,62 @@
+# Times the phases of starting the app (imports, database, model load) so slow starts show up
+import threading
+import time
+from contextlib import contextmanager
+from utils import metrics
+
+# Roughly when the app started importing, since this module is imported first
+_started = time.perf_counter()
+_last_mark = _started
+_phases = []
+_lock = threading.Lock()
+
+
+def record(name, started, ended):
+    """Records a phase from perf_counter start and end times."""
+    with _lock:
+        _phases.append({
+            "name": name,
+            "start_ms": round((started - _started) * 1000, 1),
+            "duration_ms": round((ended - started) * 1000, 1),
+            "thread": threading.current_thread().name,
+        })
+
+
+@contextmanager
+def phase(name):
+    """Times the enclosed block as a startup phase."""
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        record(name, started, time.perf_counter())
+
+
+def mark(name):
+    """Records the time since the previous mark (or since start) as a phase."""
+    global _last_mark
+    now = time.perf_counter()
+    with _lock:
+        started, _last_mark = _last_mark, now
+    record(name, started, now)
+
+
+def report():
+    """Returns the recorded phases in the order they started."""
+    with _lock:
+        phases = sorted(_phases, key=lambda phase: phase["start_ms"])
+    return {
+        "phases": phases,
+        "total_ms": max((p["start_ms"] + p["duration_ms"] for p in phases), default=0.0),
+    }
+
+
+def print_report():
+    """Prints the phases recorded so far."""
+    profile = report()
+    print("Startup profile:")
+    for p in profile["phases"]:
+        print(f"  {p['start_ms']:>9.1f} ms  {p['duration_ms']:>9.1f} ms  {p['name']} ({p['thread']})")
+
+
+metrics.register_gauge("startup_profile", report)
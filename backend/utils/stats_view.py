@@ -0,0 +1,297 @@
+import asyncio
+import base64
+import bisect
+import hashlib
+import json
+import os
+import time
+import uuid
+from dotenv import load_dotenv
+from utils import metrics
+from utils.async_db import get_endpoint_stats, get_api_usage_page
+from utils.usage_buffer import usage_buffer
+
+load_dotenv()
+
+# Seconds between reloads from the database, which is when other workers' counts show up
+STATS_REFRESH_INTERVAL = float(os.getenv("STATS_REFRESH_INTERVAL", "60"))
+# Longest a served page may lag this worker's own counts. Requests within it share a snapshot, and so an ETag
+STATS_MAX_STALENESS = float(os.getenv("STATS_MAX_STALENESS", "5"))
+# Users with the most calls kept in memory; pages past them are read from the database by keyset
+STATS_TOP_USERS = int(os.getenv("STATS_TOP_USERS", "1000"))
+STATS_PAGE_SIZE = int(os.getenv("STATS_PAGE_SIZE", "100"))
+STATS_MAX_PAGE_SIZE = int(os.getenv("STATS_MAX_PAGE_SIZE", "1000"))
+
+# Sort orders, as keys that list rows in ascending order
+ENDPOINT_SORTS = {
+    "count": lambda row: (-row["count"], row["method"], row["endpoint"]),
+    "endpoint": lambda row: (row["endpoint"], row["method"]),
+}
+USER_SORTS = ("calls", "user_id")
+
+
+class InvalidCursorError(ValueError):
+    """Raised for a cursor that is malformed or belongs to another sort order."""
+
+
+def encode_cursor(sort, key, source="view"):
+    """Makes an opaque cursor for the row with `key`. `source` says whether it came from the view or the database."""
+    data = json.dumps({"sort": sort, "key": list(key), "source": source}, separators=(",", ":"))
+    return base64.urlsafe_b64encode(data.encode()).decode().rstrip("=")
+
+
+def decode_cursor(cursor, sort):
+    """Returns (key, source) for a cursor issued for `sort`."""
+    try:
+        data = json.loads(base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)))
+        key, source = tuple(data["key"]), data["source"]
+    except (ValueError, KeyError, TypeError):
+        raise InvalidCursorError("Invalid cursor")
+    if data.get("sort") != sort or source not in ("view", "db"):
+        raise InvalidCursorError("The cursor belongs to another sort order")
+    return key, source
+
+
+def _user_key(row, sort):
+    """A user row's key in the database's order, which is what cursors hold."""
+    if sort == "calls":
+        return (row["total_api_calls"], row["user_id"])
+    return (row["user_id"],)
+
+
+class StatsView:
+    """
+    In-process materialised view of the admin stats: every endpoint's count and the STATS_TOP_USERS users
+    with the most calls. Counts are applied as requests are recorded, and the view is reloaded from the
+    database every STATS_REFRESH_INTERVAL seconds. Pages come from snapshots that are rebuilt at most every
+    STATS_MAX_STALENESS seconds, and each snapshot's version goes into the ETag of pages served from it.
+    """
+
+    def __init__(self, refresh_interval=STATS_REFRESH_INTERVAL, max_staleness=STATS_MAX_STALENESS, top_users=STATS_TOP_USERS):
+        self.refresh_interval = refresh_interval
+        self.max_staleness = max_staleness
+        self.top_users = max(1, top_users)
+        # In ETags, so a tag from another worker or an earlier process never matches
+        self._instance = uuid.uuid4().hex[:8]
+
+        self._endpoints = {}           # (method, endpoint) -> count
+        self._users = {}               # user_id -> usage row, for the top users only
+        self._users_complete = False   # True when every user fits in the top users
+        self._loaded = False
+        self._refreshed_at = None
+        self._dirty = {"endpoints": True, "users": True}
+        self._versions = {"endpoints": 0, "users": 0}
+        self._snapshots = {}           # kind -> (version, built_at, rows)
+        self._sorted = {}              # (kind, sort) -> (version, rows, keys)
+        self._refresh_lock = None
+        self._timer = None
+
+        metrics.register_gauge("stats_view", self.stats)
+
+    def record_endpoint(self, method, endpoint):
+        """Counts a request to an endpoint."""
+        key = (method, endpoint)
+        self._endpoints[key] = self._endpoints.get(key, 0) + 1
+        self._dirty["endpoints"] = True
+
+    def record_user_call(self, user_id):
+        """Counts an API call for a user."""
+        row = self._users.get(user_id)
+        if row is not None:
+            row["total_api_calls"] += 1
+            self._dirty["users"] = True
+        elif self._users_complete:
+            # A user the last refresh didn't see, so the rest are no longer all in memory
+            self._users_complete = False
+            self._dirty["users"] = True
+
+    def update_user(self, user_id, **fields):
+        """Updates a top user's details, e.g. after a name change."""
+        row = self._users.get(user_id)
+        if row is not None:
+            row.update(fields)
+            self._dirty["users"] = True
+
+    def forget_user(self, user_id):
+        """Drops a deleted user."""
+        if self._users.pop(user_id, None) is not None:
+            self._dirty["users"] = True
+
+    async def refresh(self):
+        """Reloads the view from the database plus this worker's unflushed counts."""
+        if self._refresh_lock is None:
+            self._refresh_lock = asyncio.Lock()
+
+        async with self._refresh_lock:
+            # The top users are picked by their database counts, so write this worker's first
+            await usage_buffer.flush()
+
+            async def read():
+                # One row more than kept tells whether every user fits
+                return await get_endpoint_stats(), await get_api_usage_page("calls", None, self.top_users + 1)
+
+            (endpoint_rows, user_rows), pending_endpoints, pending_users = await usage_buffer.read_with_pending(read)
+
+            endpoints = {(row["method"], row["endpoint"]): row["count"] for row in endpoint_rows}
+            for key, count in pending_endpoints.items():
+                endpoints[key] = endpoints.get(key, 0) + count
+
+            users = {}
+            for row in user_rows[:self.top_users]:
+                users[row["user_id"]] = {
+                    "user_id": row["user_id"],
+                    "first_name": row["first_name"],
+                    "email": row["email"],
+                    "total_api_calls": row["total_api_calls"] + pending_users.get(row["user_id"], (0, 0))[0],
+                }
+
+            # Counts recorded while the database was read are in the pending counts, so the old view can go
+            self._endpoints = endpoints
+            self._users = users
+            self._users_complete = len(user_rows) <= self.top_users
+            self._dirty = {"endpoints": True, "users": True}
+            self._snapshots.clear()
+            self._loaded = True
+            self._refreshed_at = time.monotonic()
+
+        metrics.increment("stats_view_refreshes_total")
+
+    async def _ensure_loaded(self):
+        if not self._loaded:
+            await self.refresh()
+
+    def _snapshot(self, kind):
+        """Returns (version, built_at, rows) for `kind`, rebuilding it if it has changed and is stale enough."""
+        snapshot = self._snapshots.get(kind)
+        now = time.monotonic()
+        if snapshot is None or (self._dirty[kind] and now - snapshot[1] >= self.max_staleness):
+            if kind == "endpoints":
+                rows = [{"method": method, "endpoint": endpoint, "count": count} for (method, endpoint), count in self._endpoints.items()]
+            else:
+                rows = [dict(row) for row in self._users.values()]
+            self._versions[kind] += 1
+            self._dirty[kind] = False
+            snapshot = (self._versions[kind], now, rows)
+            self._snapshots[kind] = snapshot
+        return snapshot
+
+    def _sorted_rows(self, kind, sort):
+        """Returns (version, rows, keys) for a snapshot in `sort` order, sorting each version once."""
+        version, _, rows = self._snapshot(kind)
+        cached = self._sorted.get((kind, sort))
+        if cached is None or cached[0] != version:
+            if kind == "endpoints":
+                key = ENDPOINT_SORTS[sort]
+            else:
+                key = lambda row: (-row["total_api_calls"], -row["user_id"])
+            rows = sorted(rows, key=key)
+            cached = (version, rows, [key(row) for row in rows])
+            self._sorted[(kind, sort)] = cached
+        return cached
+
+    async def etag(self, kind, *params):
+        """ETag for a page of `kind` ("endpoints" or "users") with the given query parameters."""
+        await self._ensure_loaded()
+        version = self._snapshot(kind)[0]
+        digest = hashlib.sha1(repr(params).encode()).hexdigest()[:12]
+        return f'W/"{self._instance}-{kind}-{version}-{digest}"'
+
+    async def endpoints_page(self, sort="count", cursor=None, limit=STATS_PAGE_SIZE):
+        """Returns (rows, next cursor or None) of the endpoint stats."""
+        await self._ensure_loaded()
+        _, rows, keys = self._sorted_rows("endpoints", sort)
+
+        start = 0
+        if cursor:
+            after, _ = decode_cursor(cursor, sort)
+            start = bisect.bisect_right(keys, after)
+
+        end = start + limit
+        next_cursor = encode_cursor(sort, keys[end - 1]) if end < len(rows) else None
+        return rows[start:end], next_cursor
+
+    async def users_page(self, sort="calls", cursor=None, limit=STATS_PAGE_SIZE):
+        """
+        Returns (rows, next cursor or None, source) of the API usage stats, where source is "view" when
+        the page came wholly from the view and "db" when the database was read for it. Most calls first
+        is served from the top users while it lasts, then from the database; by user id is always read
+        from the database. Either way a page costs O(limit).
+        Rows read from the database show their stored counts, which lag by up to a usage flush.
+        """
+        await self._ensure_loaded()
+        after, source = decode_cursor(cursor, sort) if cursor else (None, "view")
+
+        page = []
+        if sort == "calls" and source == "view":
+            _, rows, keys = self._sorted_rows("users", sort)
+            start = bisect.bisect_right(keys, (-after[0], -after[1])) if after is not None else 0
+            end = start + limit
+            page = rows[start:end]
+            if end < len(rows):
+                return page, encode_cursor(sort, _user_key(page[-1], sort)), "view"
+            if self._users_complete:
+                return page, None, "view"
+            if page:
+                after = _user_key(page[-1], sort)
+
+        # Top users can sort below their database counts, so they're skipped rather than listed twice
+        skip = self._users.keys() if sort == "calls" else ()
+        rows, after = await self._users_from_db(sort, after, limit - len(page), skip)
+        page.extend(rows)
+        return page, encode_cursor(sort, after, "db") if after is not None else None, "db"
+
+    async def _users_from_db(self, sort, after, limit, skip):
+        """Reads up to `limit` users after the key `after`. Returns (rows, key to continue from or None)."""
+        rows = []
+        while True:
+            want = limit - len(rows)
+            # One row more than needed tells whether there is another page
+            batch = await get_api_usage_page(sort, after, want + 1)
+            more = len(batch) > want
+            for row in batch[:want]:
+                after = _user_key(row, sort)
+                if row["user_id"] not in skip:
+                    # Stored counts, the ones the page is sorted by, so the order shown holds
+                    rows.append(row)
+            if not more:
+                return rows, None
+            if len(rows) >= limit:
+                return rows, after
+
+    async def _run_timer(self):
+        """Refreshes on a fixed interval."""
+        while True:
+            await asyncio.sleep(self.refresh_interval)
+            try:
+                await self.refresh()
+            except Exception as e:
+                print(f"Error refreshing admin stats: {e}")
+                metrics.increment("stats_view_refresh_errors_total")
+
+    def start(self):
+        """Starts the background refresh timer."""
+        if self._timer is None:
+            self._timer = asyncio.create_task(self._run_timer())
+
+    async def stop(self):
+        """Stops the refresh timer."""
+        if self._timer is not None:
+            self._timer.cancel()
+            try:
+                await self._timer
+            except asyncio.CancelledError:
+                pass
+            self._timer = None
+
+    def stats(self):
+        return {
+            "loaded": self._loaded,
+            "endpoints": len(self._endpoints),
+            "top_users": len(self._users),
+            "users_complete": self._users_complete,
+            "versions": dict(self._versions),
+            "age": round(time.monotonic() - self._refreshed_at, 1) if self._refreshed_at is not None else None,
+        }
+
+
+stats_view = StatsView()
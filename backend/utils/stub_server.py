@@ -0,0 +1,107 @@
+"""
+Local stand-in for the Places and Mailgun APIs, for tests and load tests without external calls.
+
+    python -m utils.stub_server 8081
+
+Then point the app at it with GOOGLE_API=http://127.0.0.1:8081/maps/api/place/nearbysearch/json
+and MAILGUN_API_BASE=http://127.0.0.1:8081.
+"""
+import json
+import random
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse, parse_qs
+
+
+def make_places_response(latitude, longitude, count=20, place_type="park"):
+    """Builds a Nearby Search response with places scattered around a position."""
+    results = []
+    for index in range(count):
+        results.append({
+            "name": f"Stub {place_type.title()} {index + 1}",
+            "vicinity": f"{100 + index} Stub Street",
+            "place_id": f"stub-{place_type}-{index}",
+            "rating": round(random.uniform(3.0, 5.0), 1),
+            "geometry": {"location": {
+                "lat": latitude + random.uniform(-0.01, 0.01),
+                "lng": longitude + random.uniform(-0.01, 0.01),
+            }},
+        })
+    return {"status": "OK", "results": results}
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    # HTTP status codes to fail with before answering normally, e.g. [503, 503] to test retries
+    http_statuses = []
+    # Statuses to return before answering normally, e.g. ["OVER_QUERY_LIMIT"] to test retries
+    places_statuses = []
+    # Added delay per request, in seconds
+    latency = 0.0
+    requests_seen = []
+
+    def _send_json(self, status_code, body):
+        payload = json.dumps(body).encode()
+        self.send_response(status_code)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def _send_failure(self):
+        """Sends the next queued HTTP failure, if there is one."""
+        if StubHandler.http_statuses:
+            status_code = StubHandler.http_statuses.pop(0)
+            self._send_json(status_code, {"message": f"Stub {status_code}"})
+            return True
+        return False
+
+    def do_GET(self):
+        url = urlparse(self.path)
+        StubHandler.requests_seen.append(("GET", url.path))
+        time.sleep(self.latency)
+        if self._send_failure():
+            return
+
+        if url.path.endswith("/nearbysearch/json"):
+            if StubHandler.places_statuses:
+                status = StubHandler.places_statuses.pop(0)
+                return self._send_json(200, {"status": status, "results": [], "error_message": f"Stub {status}"})
+
+            query = parse_qs(url.query)
+            latitude, longitude = (float(value) for value in query.get("location", ["0,0"])[0].split(","))
+            return self._send_json(200, make_places_response(latitude, longitude, place_type=query.get("type", ["park"])[0]))
+
+        self._send_json(404, {"message": "Not found"})
+
+    def do_POST(self):
+        url = urlparse(self.path)
+        StubHandler.requests_seen.append(("POST", url.path))
+        time.sleep(self.latency)
+
+        length = int(self.headers.get("Content-Length", 0))
+        self.rfile.read(length)
+        if self._send_failure():
+            return
+        if url.path.endswith("/messages"):
+            return self._send_json(200, {"id": "<stub@mailgun>", "message": "Queued. Thank you."})
+
+        self._send_json(404, {"message": "Not found"})
+
+    def log_message(self, format, *args):
+        pass
+
+
+def start_stub_server(port=0):
+    """Starts the stub server in a background thread and returns (server, base_url)."""
+    server = ThreadingHTTPServer(("127.0.0.1", port), StubHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f"http://127.0.0.1:{server.server_address[1]}"
+
+
+if __name__ == "__main__":
+    port = int(sys.argv[1]) if len(sys.argv) > 1 else 8081
+    server = ThreadingHTTPServer(("127.0.0.1", port), StubHandler)
+    print(f"Stub Places/Mailgun server listening on http://127.0.0.1:{port}")
+    server.serve_forever()
@@ -0,0 +1,78 @@
+import os
+import time
+from dotenv import load_dotenv
+from utils.ttl_cache import TTLCache
+
+load_dotenv()
+
+TOKEN_CACHE_SIZE = int(os.getenv("TOKEN_CACHE_SIZE", "10000"))
+# Revoked tokens remembered at once. Keep it well above the number of logouts per token lifetime,
+# since a revoked token that gets evicted is accepted again until it expires
+REVOKED_TOKENS_SIZE = int(os.getenv("REVOKED_TOKENS_SIZE", "100000"))
+ACCESS_TOKEN_EXPIRE_MINUTES = int(os.getenv("ACCESS_TOKEN_EXPIRE_MINUTES", "30"))
+
+# Verified access token claims keyed by the token, each kept until the token's `exp`,
+# so repeated requests skip signature verification
+token_cache = TTLCache(TOKEN_CACHE_SIZE, ACCESS_TOKEN_EXPIRE_MINUTES * 60, name="token_cache")
+
+# Logged out tokens, kept until they would have expired anyway
+revoked_tokens = TTLCache(REVOKED_TOKENS_SIZE, ACCESS_TOKEN_EXPIRE_MINUTES * 60, name="revoked_tokens")
+
+# Subject -> millisecond its tokens were revoked (account deleted or password reset).
+# Tokens issued up to and including that millisecond are rejected; later ones are fine.
+# Like the user cache, each worker process keeps its own lists, so a revocation only
+# reaches the worker that handled it.
+revoked_subjects = TTLCache(REVOKED_TOKENS_SIZE, ACCESS_TOKEN_EXPIRE_MINUTES * 60, name="revoked_subjects")
+
+
+def _seconds_left(claims):
+    exp = claims.get("exp")
+    return exp - time.time() if isinstance(exp, (int, float)) else None
+
+
+def get_cached_claims(token):
+    """Returns the cached claims of a verified token, or None."""
+    return token_cache.get(token)
+
+
+def cache_claims(token, claims):
+    """Caches a verified token's claims until it expires."""
+    seconds_left = _seconds_left(claims)
+    if seconds_left is not None and seconds_left > 0:
+        token_cache.set(token, claims, ttl=seconds_left)
+
+
+def revoke_token(token, claims):
+    """Rejects one token from now until it expires, e.g. on logout."""
+    token_cache.pop(token)
+    seconds_left = _seconds_left(claims)
+    if seconds_left is None or seconds_left > 0:
+        revoked_tokens.set(token, True, ttl=seconds_left)
+
+
+def _now_ms():
+    return time.time_ns() // 1_000_000
+
+
+def _issued_at_ms(claims):
+    """A token's issue time in milliseconds, from `iat_ms` or else the whole second in `iat`."""
+    if "iat_ms" in claims:
+        return claims["iat_ms"]
+    # Tokens without an issue time predate revocation support, so they count as issued before it
+    return claims.get("iat", 0) * 1000
+
+
+def revoke_subject(subject):
+    """Rejects every token issued so far for a subject (their email)."""
+    revoked_subjects.set(subject, _now_ms())
+    token_cache.invalidate_where(lambda _, claims: claims.get("sub") == subject)
+
+
+def is_revoked(token, claims):
+    """Checks a verified token against the revocation lists."""
+    if revoked_tokens.get(token) is not None:
+        return True
+    revoked_at = revoked_subjects.get(claims.get("sub"))
+    # Inclusive, so a token from the same millisecond is never let through. One reissued after a
+    # reset comes a password hash later. Tokens with only `iat` sharing the second are rejected too
+    return revoked_at is not None and _issued_at_ms(claims) <= revoked_at
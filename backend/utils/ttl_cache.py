@@ -0,0 +1,100 @@
+import threading
+import time
+from collections import OrderedDict
+from utils import metrics
+
+
+class TTLCache:
+    """
+    Thread-safe LRU cache whose entries expire `ttl` seconds after they are set.
+    With `max_bytes` and a `sizeof` function, it also evicts to stay under a memory budget.
+    Hit, miss and eviction counts are exported as a gauge under `name`.
+    """
+
+    def __init__(self, maxsize, ttl, name=None, max_bytes=None, sizeof=None):
+        self.maxsize = max(1, maxsize)
+        self.ttl = ttl
+        self.name = name
+        self.max_bytes = max_bytes
+        self._sizeof = sizeof
+        self._bytes = 0
+        self._data = OrderedDict()   # key -> (expires_at, value, size)
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+        if name:
+            metrics.register_gauge(name, self.stats)
+
+    def get(self, key, default=None):
+        """Returns a live entry and marks it as recently used."""
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is not None:
+                expires_at, value, _ = entry
+                if expires_at > time.monotonic():
+                    self._data.move_to_end(key)
+                    self.hits += 1
+                    return value
+                self._remove(key)
+            self.misses += 1
+            return default
+
+    def _remove(self, key):
+        """Removes an entry and its size. The lock must be held."""
+        entry = self._data.pop(key, None)
+        if entry is not None:
+            self._bytes -= entry[2]
+        return entry
+
+    def set(self, key, value, ttl=None):
+        """Stores an entry, evicting the least recently used ones if the cache is full."""
+        expires_at = time.monotonic() + (self.ttl if ttl is None else ttl)
+        size = self._sizeof(value) if self._sizeof else 0
+        with self._lock:
+            self._remove(key)
+            self._data[key] = (expires_at, value, size)
+            self._bytes += size
+            while len(self._data) > self.maxsize or (self.max_bytes and self._bytes > self.max_bytes and len(self._data) > 1):
+                oldest = next(iter(self._data))
+                self._remove(oldest)
+                self.evictions += 1
+
+    def pop(self, key, default=None):
+        """Removes an entry and returns its value."""
+        with self._lock:
+            entry = self._remove(key)
+            return entry[1] if entry is not None else default
+
+    def invalidate_where(self, predicate):
+        """Removes every entry whose (key, value) matches the predicate."""
+        with self._lock:
+            stale = [key for key, (_, value, _) in self._data.items() if predicate(key, value)]
+            for key in stale:
+                self._remove(key)
+            return len(stale)
+
+    def clear(self):
+        """Removes every entry."""
+        with self._lock:
+            self._data.clear()
+            self._bytes = 0
+
+    def __len__(self):
+        with self._lock:
+            return len(self._data)
+
+    def stats(self):
+        """Returns the cache's size and hit rate."""
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "size": len(self._data),
+                "maxsize": self.maxsize,
+                "bytes": self._bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "hit_rate": round(self.hits / lookups, 3) if lookups else 0.0,
+            }
@@ -0,0 +1,186 @@
+import asyncio
+import os
+from dotenv import load_dotenv
+from utils import metrics
+from utils.async_db import bulk_increment_endpoint_counts, bulk_increment_api_usage
+from utils.db_pool import DatabaseConnectionError
+
+load_dotenv()
+
+# Seconds between background flushes
+USAGE_FLUSH_INTERVAL = float(os.getenv("USAGE_FLUSH_INTERVAL", "5"))
+# Unflushed increments that trigger an early flush
+USAGE_FLUSH_THRESHOLD = int(os.getenv("USAGE_FLUSH_THRESHOLD", "500"))
+# Upper bound on increments held in memory, and so on what a crash can lose.
+# Once reached, requests wait for a flush instead of buffering more.
+USAGE_MAX_UNFLUSHED = int(os.getenv("USAGE_MAX_UNFLUSHED", "5000"))
+# buffered: write-behind on a timer or threshold, sync: flush on every request (no loss, one round-trip per request)
+USAGE_DURABILITY = os.getenv("USAGE_DURABILITY", "buffered")
+
+
+class UsageBuffer:
+    """
+    Accumulates endpoint counts and per-user call counts in memory
+    and writes them to the database in batched multi-row UPSERTs.
+    """
+
+    def __init__(self, flush_interval=USAGE_FLUSH_INTERVAL, flush_threshold=USAGE_FLUSH_THRESHOLD,
+                 max_unflushed=USAGE_MAX_UNFLUSHED, durability=USAGE_DURABILITY):
+        self.flush_interval = flush_interval
+        self.flush_threshold = max(1, flush_threshold)
+        self.max_unflushed = max(self.flush_threshold, max_unflushed)
+        self.durability = durability
+
+        self._endpoints = {}     # (method, endpoint) -> count
+        self._users = {}         # user_id -> [total_api_calls, llm_api_calls]
+        self._unflushed = 0
+        self._flush_lock = None
+        self._flush_task = None
+        self._timer = None
+
+        metrics.register_gauge("usage_buffer_unflushed", lambda: self._unflushed)
+
+    async def record_endpoint(self, method, endpoint):
+        """Counts a request to an endpoint."""
+        key = (method, endpoint)
+        self._endpoints[key] = self._endpoints.get(key, 0) + 1
+        await self._after_record()
+
+    async def record_user_call(self, user_id, llm_call=False):
+        """Counts an API call (and optionally an LLM call) for a user."""
+        counts = self._users.setdefault(user_id, [0, 0])
+        counts[0] += 1
+        if llm_call:
+            counts[1] += 1
+        await self._after_record()
+
+    async def refund_llm_call(self, user_id):
+        """Takes back an LLM call counted for a request that failed."""
+        counts = self._users.setdefault(user_id, [0, 0])
+        counts[1] -= 1
+        await self._after_record()
+
+    async def _after_record(self):
+        """Flushes according to the durability setting and thresholds."""
+        self._unflushed += 1
+
+        if self.durability == "sync" or self._unflushed >= self.max_unflushed:
+            # Wait for the write so no more than max_unflushed increments are ever at risk
+            await self.flush()
+        elif self._unflushed >= self.flush_threshold and (self._flush_task is None or self._flush_task.done()):
+            self._flush_task = asyncio.create_task(self.flush())
+
+    def pending_endpoint_counts(self):
+        """Returns a copy of the unflushed endpoint counts."""
+        return dict(self._endpoints)
+
+    def pending_user_counts(self, user_id=None):
+        """Returns the unflushed (total_api_calls, llm_api_calls) for one user, or a dict for all users."""
+        if user_id is not None:
+            return tuple(self._users.get(user_id, (0, 0)))
+        return {user: tuple(counts) for user, counts in self._users.items()}
+
+    async def read_with_pending(self, read):
+        """
+        Awaits `read()` while no flush is in flight and returns (its result, pending endpoint counts,
+        pending user counts). Together they hold every count this worker has seen, none of them twice.
+        """
+        if self._flush_lock is None:
+            self._flush_lock = asyncio.Lock()
+
+        async with self._flush_lock:
+            result = await read()
+            return result, self.pending_endpoint_counts(), self.pending_user_counts()
+
+    async def flush(self):
+        """Writes every buffered count to the database."""
+        if self._flush_lock is None:
+            self._flush_lock = asyncio.Lock()
+
+        async with self._flush_lock:
+            # Swap the buffers so requests keep counting while the write is in flight
+            endpoints, self._endpoints = self._endpoints, {}
+            users, self._users = self._users, {}
+            flushed = self._unflushed
+            self._unflushed = 0
+
+            if not endpoints and not users:
+                return
+
+            endpoint_rows = [(method, endpoint, count) for (method, endpoint), count in endpoints.items()]
+            user_rows = [(user_id, total, llm) for user_id, (total, llm) in users.items()]
+
+            try:
+                if endpoint_rows:
+                    await bulk_increment_endpoint_counts(endpoint_rows)
+                    endpoint_rows = []
+                if user_rows:
+                    await self._write_user_rows(user_rows)
+            except Exception as e:
+                # Put unwritten counts back so the next flush retries them
+                print(f"Error flushing usage counts: {e}")
+                metrics.increment("usage_buffer_flush_errors_total")
+                self._merge_back(endpoint_rows, user_rows)
+                return
+
+            metrics.increment("usage_buffer_flushes_total")
+            metrics.observe("usage_buffer_flush_size", flushed, buckets=[1, 10, 50, 100, 500, 1000, 5000])
+
+    async def _write_user_rows(self, rows):
+        """
+        Writes user rows in one UPSERT. If the batch is rejected (e.g. a user was deleted
+        and the foreign key fails), retries row by row and drops the rows that still fail.
+        """
+        try:
+            await bulk_increment_api_usage(rows)
+        except DatabaseConnectionError:
+            raise
+        except Exception as e:
+            print(f"Batched `api_usage` update failed, retrying row by row: {e}")
+            for row in rows:
+                try:
+                    await bulk_increment_api_usage([row])
+                except DatabaseConnectionError:
+                    raise
+                except Exception as row_error:
+                    print(f"Dropping usage counts for user_id {row[0]}: {row_error}")
+                    metrics.increment("usage_buffer_dropped_rows_total")
+
+    def _merge_back(self, endpoint_rows, user_rows):
+        """Adds unwritten rows back into the buffers."""
+        for method, endpoint, count in endpoint_rows:
+            key = (method, endpoint)
+            self._endpoints[key] = self._endpoints.get(key, 0) + count
+            self._unflushed += count
+        for user_id, total, llm in user_rows:
+            counts = self._users.setdefault(user_id, [0, 0])
+            counts[0] += total
+            counts[1] += llm
+            self._unflushed += total
+
+    async def _run_timer(self):
+        """Flushes on a fixed interval."""
+        while True:
+            await asyncio.sleep(self.flush_interval)
+            await self.flush()
+
+    def start(self):
+        """Starts the background flush timer."""
+        if self._timer is None and self.durability != "sync":
+            self._timer = asyncio.create_task(self._run_timer())
+
+    async def stop(self):
+        """Stops the timer and writes whatever is still buffered."""
+        if self._timer is not None:
+            self._timer.cancel()
+            try:
+                await self._timer
+            except asyncio.CancelledError:
+                pass
+            self._timer = None
+        if self._flush_task is not None:
+            await asyncio.gather(self._flush_task, return_exceptions=True)
+        await self.flush()
+
+
+usage_buffer = UsageBuffer()
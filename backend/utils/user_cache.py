@@ -0,0 +1,30 @@
+import os
+from dotenv import load_dotenv
+from utils.ttl_cache import TTLCache
+
+load_dotenv()
+
+USER_CACHE_TTL = float(os.getenv("USER_CACHE_TTL", "60"))
+USER_CACHE_SIZE = int(os.getenv("USER_CACHE_SIZE", "10000"))
+
+# Users keyed by the token subject (their email). Each worker process has its own cache,
+# so changes made through another worker are picked up once the entry expires.
+user_cache = TTLCache(USER_CACHE_SIZE, USER_CACHE_TTL, name="user_cache")
+
+
+def get_cached_user(email):
+    """Returns a cached user, or None."""
+    return user_cache.get(email)
+
+
+def cache_user(email, user):
+    """Caches a user loaded from the database."""
+    user_cache.set(email, user)
+
+
+def invalidate_user(email=None, user_id=None):
+    """Removes a user from the cache by email and/or user id."""
+    if email is not None:
+        user_cache.pop(email)
+    if user_id is not None:
+        user_cache.invalidate_where(lambda _, user: user.get("id") == user_id)
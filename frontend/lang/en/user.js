@@ -82,4 +82,5 @@ const messages = {
     usageUsernameTitle: "Username",
     usageEmailTitle: "Email",
     usageTotalRequestsTitle: "Total requests",
+    loadMoreTitle: "Load more",
 };
@@ -1,4 +1,7 @@
 
+// Cursors for the next page of each table, null once everything is shown
+let endpointStatsCursor = null;
+let apiUsageStatsCursor = null;
 
 function loadAdminPageContent(){
     const contentDiv = document.getElementById("content"); // Get the content div
@@ -13,6 +16,7 @@ function loadAdminPageContent(){
     document.getElementById("endpointMethod").textContent = messages.endpointMethodTitle;
     document.getElementById("endPointEndpoint").textContent =  messages.endpointEndpointTitle;
     document.getElementById("endpointRequests").textContent = messages.endpointRequestsTitle;
+    setupLoadMoreButton("load-more-endpoint", () => loadEndpointStats(endpointStatsCursor));
     loadEndpointStats();
 
     //load Section 2: api usage stats
@@ -20,21 +24,45 @@ function loadAdminPageContent(){
     document.getElementById("usageUsername").textContent = messages.usageUsernameTitle;
     document.getElementById("usageEmail").textContent = messages.usageEmailTitle;
     document.getElementById("usageTotalRequests").textContent = messages.usageTotalRequestsTitle;
+    setupLoadMoreButton("load-more-api", () => loadApiUsageStats(apiUsageStatsCursor));
     loadApiUsageStats(); 
  
 };
 
-//gets the endpoints data from endpoints table 
-async function loadEndpointStats() {
+//builds a stats url for one page, starting after the cursor if there is one
+function statsPageUrl(path, cursor) {
+    const url = new URL(`${API_BASE_URL}${path}`);
+    if (cursor) {
+        url.searchParams.set("cursor", cursor);
+    }
+    return url;
+}
+
+//sets the label of a load more button and what it loads
+function setupLoadMoreButton(buttonId, loadNextPage) {
+    const button = document.getElementById(buttonId);
+    button.textContent = messages.loadMoreTitle;
+    button.addEventListener("click", loadNextPage);
+}
+
+//shows the load more button only while there is another page
+function updateLoadMoreButton(buttonId, cursor) {
+    document.getElementById(buttonId).style.display = cursor ? "block" : "none";
+}
+
+//gets the endpoints data from endpoints table, a page at a time
+async function loadEndpointStats(cursor = null) {
     try {
-        const endpointStatsResponse = await fetch(`${API_BASE_URL}/api/v1/stats/endpoints`, {
+        const endpointStatsResponse = await fetch(statsPageUrl("/api/v1/stats/endpoints", cursor), {
             method: "GET",
             credentials: "include",
             headers: { "Accept": "application/json" },
         });
 
         const endpointStats = await endpointStatsResponse.json();
-        renderEndpointStats(endpointStats["endpoints"]); //call render to display data
+        renderEndpointStats(endpointStats["endpoints"], cursor !== null); //call render to display data
+        endpointStatsCursor = endpointStats["next_cursor"] || null;
+        updateLoadMoreButton("load-more-endpoint", endpointStatsCursor);
 
     } catch (error) {
         console.error("Error loading endpoint stats content:", error);
@@ -44,9 +72,11 @@ async function loadEndpointStats() {
 }
 
 //displays the data into the table
-function renderEndpointStats(stats) {
+function renderEndpointStats(stats, append = false) {
     const tableBody = document.querySelector("#endpoint-table tbody");
-    tableBody.innerHTML = ""; // Clear any existing data
+    if (!append) {
+        tableBody.innerHTML = ""; // Clear any existing data
+    }
 
     stats.forEach((stat) => {
         const row = document.createElement("tr");
@@ -59,17 +89,19 @@ function renderEndpointStats(stats) {
     });
 }
 
-//gets the api usage data form api_usage table
-async function loadApiUsageStats(){
+//gets the api usage data form api_usage table, top users first and a page at a time
+async function loadApiUsageStats(cursor = null){
     try {
-        const apiUsageStatsResponse = await fetch(`${API_BASE_URL}/api/v1/stats/apiUsage`, {
+        const apiUsageStatsResponse = await fetch(statsPageUrl("/api/v1/stats/apiUsage", cursor), {
             method: "GET",
             credentials: "include",
             headers: { "Accept": "application/json" },
         });
 
         const apiUsageStats = await apiUsageStatsResponse.json();
-        renderApiUsageStats(apiUsageStats["users"]);  // Call render function to display the data
+        renderApiUsageStats(apiUsageStats["users"], cursor !== null);  // Call render function to display the data
+        apiUsageStatsCursor = apiUsageStats["next_cursor"] || null;
+        updateLoadMoreButton("load-more-api", apiUsageStatsCursor);
 
     } catch (error) {
         console.error("Error loading API usage stats content:", error);
@@ -79,9 +111,11 @@ async function loadApiUsageStats(){
 }
 
 //displays the data into the table
-function renderApiUsageStats(stats) {
+function renderApiUsageStats(stats, append = false) {
     const tableBody = document.querySelector("#user-api-table tbody"); 
-    tableBody.innerHTML = ""; // Clear any existing data
+    if (!append) {
+        tableBody.innerHTML = ""; // Clear any existing data
+    }
 
     stats.forEach((stat) => {
         const row = document.createElement("tr");
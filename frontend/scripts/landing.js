@@ -197,13 +197,28 @@ async function loadInteractiveComponents(userData, userInputSection) {
         showLoadingSpinner();
 
         try {
-            // Section 4: Fetch and Display the LLM response
-            const llmResponse = await generate_llm_message2(requestData);
+            // Section 4: Fetch and Display the LLM response.
+            // The places are shown as soon as they arrive and the recommendation fills in after.
+            let apiResponse = null;
+            const llmResponse = await stream_llm_message(requestData, {
+                onPlaces: (places) => {
+                    apiResponse = places;
+                    hideLoadingSpinner();
+                    if (places.length) {
+                        renderApiResponse(places, null);
+                    }
+                },
+                onRecommendation: (recommendation) => {
+                    if (apiResponse && apiResponse.length) {
+                        renderRecommendation(recommendation);
+                    }
+                },
+            });
 
             // Hide the loading spinner after the API response
             hideLoadingSpinner();
 
-            if (llmResponse && llmResponse.api_response) {
+            if (llmResponse && llmResponse.api_response && llmResponse.api_response.length) {
                 renderApiResponse(llmResponse.api_response, llmResponse.llm_recommendation);
             } else {
                 const llmResponseDisplay = document.getElementById("llm-response");
@@ -271,6 +286,106 @@ async function generate_llm_message2(requestData) {
     }
 }
 
+// Sends the POST request to the streaming llm endpoint. Each line of the response is one event:
+// "places", then "recommendation", then "metadata" (or "error"). Calls the callbacks as events
+// arrive and resolves with the same object /api/v1/llm returns in `response`.
+async function stream_llm_message(requestData, { onPlaces, onRecommendation } = {}) {
+    // Browsers that can't read a response as it arrives use the regular endpoint from the start,
+    // so the recommendation is only requested (and charged) once
+    if (!canStreamResponses()) {
+        return generate_llm_message2(requestData);
+    }
+
+    let response;
+    try {
+        response = await fetch(`${API_BASE_URL}/api/v1/llm/stream`, {
+            method: "POST",
+            credentials: "include",
+            headers: {
+                "Content-Type": "application/json",
+                "Accept": "application/x-ndjson",
+            },
+            body: JSON.stringify(requestData),
+        });
+    } catch (error) {
+        // The stream request itself failed, e.g. a proxy that rejects streaming responses
+        console.error("Streaming request failed, retrying without streaming:", error);
+        return generate_llm_message2(requestData);
+    }
+
+    // A server without the streaming endpoint
+    if (response.status === 404) {
+        return generate_llm_message2(requestData);
+    }
+
+    if (!response.ok) {
+        throw new Error("Failed to fetch data from server");
+    }
+
+    const result = { api_response: [], llm_recommendation: "", recommendation_strategy: null, metadata: null };
+    const handleEvent = (event) => {
+        if (event.event === "places") {
+            result.api_response = event.api_response;
+            if (onPlaces) onPlaces(event.api_response);
+        } else if (event.event === "recommendation") {
+            result.llm_recommendation = event.llm_recommendation;
+            result.recommendation_strategy = event.recommendation_strategy;
+            if (onRecommendation) onRecommendation(event.llm_recommendation);
+        } else if (event.event === "metadata") {
+            result.metadata = event.metadata;
+        } else if (event.event === "error") {
+            throw new Error(event.detail || "Failed to generate a recommendation");
+        }
+    };
+    const handleLines = (text) => {
+        text.split("\n").forEach((line) => {
+            if (line.trim()) {
+                handleEvent(JSON.parse(line));
+            }
+        });
+    };
+
+    // No readable body after all: read the whole response instead of sending the request again
+    if (!response.body) {
+        handleLines(await response.text());
+        return result;
+    }
+
+    const reader = response.body.getReader();
+    const decoder = new TextDecoder();
+    let buffer = "";
+
+    while (true) {
+        const { value, done } = await reader.read();
+        buffer += decoder.decode(value || new Uint8Array(), { stream: !done });
+
+        let newline;
+        while ((newline = buffer.indexOf("\n")) >= 0) {
+            const line = buffer.slice(0, newline).trim();
+            buffer = buffer.slice(newline + 1);
+            if (line) {
+                handleEvent(JSON.parse(line));
+            }
+        }
+
+        if (done) {
+            handleLines(buffer);
+            break;
+        }
+    }
+
+    return result;
+}
+
+// Checks if this browser can read a fetch response while it is still arriving
+function canStreamResponses() {
+    return typeof ReadableStream !== "undefined"
+        && typeof ReadableStream.prototype.getReader === "function"
+        && typeof TextDecoder !== "undefined"
+        && typeof Response !== "undefined"
+        && "body" in Response.prototype;
+}
+
 // Add the loading spinner to the LLM response section
 function showLoadingSpinner() {
     const llmResponseDisplay = document.getElementById("llm-response");
@@ -345,8 +460,28 @@ function renderApiResponse(apiResponse, llmRecommendation) {
     llmResponseDisplay.appendChild(llmRecommendationTitle);
 
     const llmRecommendationElement = document.createElement("p");
-    llmRecommendationElement.textContent = llmRecommendation;
+    llmRecommendationElement.id = "llm-recommendation";
     llmResponseDisplay.appendChild(llmRecommendationElement);
+
+    // While the recommendation is still streaming in, show a spinner in its place
+    renderRecommendation(llmRecommendation);
+}
+
+// Display the LLM recommendation once it arrives
+function renderRecommendation(llmRecommendation) {
+    const llmRecommendationElement = document.getElementById("llm-recommendation");
+    if (!llmRecommendationElement) {
+        return;
+    }
+
+    llmRecommendationElement.innerHTML = "";
+    if (llmRecommendation === null || llmRecommendation === undefined) {
+        const spinner = document.createElement("div");
+        spinner.className = "spinner";
+        llmRecommendationElement.appendChild(spinner);
+    } else {
+        llmRecommendationElement.textContent = llmRecommendation;
+    }
 }
 
 async function updateApiUsage(userId) {